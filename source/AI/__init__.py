@@ -0,0 +1,4 @@
+"""AI package
+
+This package contains the differents AI which can play chess.
+"""
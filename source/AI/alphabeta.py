@@ -0,0 +1,372 @@
+"""Alpha-beta module
+
+This module contains the class Engine, an AI which looks for the best move
+with a negamax alpha-beta search and iterative deepening.
+
+The search stops when its deadline or its node budget is reached, and then
+gives the best move found so far, so the time spent per move stays under
+control.
+"""
+
+import time
+
+import rules as ru
+import tablebase as tb
+from AI import book as bk
+from AI import transposition as tt
+
+"""Constants"""
+INFINITY = 1000000
+MATE = 100000   # Score of a check mate, minus the number of plies to get it
+MATE_FOUND = MATE - 1000    # Beyond, the score is a check mate
+
+# The value of each piece type, in hundredths of a pawn.
+PIECE_VALUES = {ru.PAWN: 100, ru.BISHOP: 330, ru.KNIGHT: 320, ru.ROOK: 500,
+                ru.QUEEN: 900, ru.KING: 0}
+
+# How many nodes are searched between two looks at the clock.
+CHECK_EVERY = 256
+
+"""Functions"""
+def position_bonus(color, type_, (x, y)):
+    """Return the bonus of a 'color' piece of type_ standing at (x, y)."""
+
+    if(color == ru.WHITE_COLOR):
+        rank = y - 1
+    else:
+        rank = ru.BOARD_SIZE - y
+    # 0 on the border, 3 on the four squares of the center.
+    center = min(x - 1, ru.BOARD_SIZE - x, y - 1, ru.BOARD_SIZE - y)
+
+    if(type_ == ru.PAWN):
+        return 5 * rank + (10 if x in [4, 5] and rank >= 2 else 0)
+    if(type_ in [ru.KNIGHT, ru.BISHOP]):
+        return 10 * center
+    if(type_ == ru.QUEEN):
+        return 3 * center
+    if(type_ == ru.KING):
+        return -10 * rank   # The king is safer at home
+    return 0
+
+# PIECE_SCORES[color][type_][pos] is the value plus the bonus of the piece.
+PIECE_SCORES = [[dict(((x, y), PIECE_VALUES[type_] +
+                                   position_bonus(color, type_, (x, y)))
+                      for x in xrange(1, ru.BOARD_SIZE + 1)
+                      for y in xrange(1, ru.BOARD_SIZE + 1))
+                 for type_ in xrange(6)]
+                for color in xrange(2)]
+
+def evaluate(board, color):
+    """Return the score of the position for 'color', the higher the better
+    for him."""
+
+    s = 0
+    for pos, p in board.dict_.iteritems():
+        if(p.color == color):
+            s += PIECE_SCORES[p.color][p.type_][pos]
+        else:
+            s -= PIECE_SCORES[p.color][p.type_][pos]
+    return s
+
+def is_capture(m):
+    """Return True if the Move m takes a piece or promotes a pawn."""
+
+    return m.type_ in [ru.CAPTURE, ru.EN_PASSANT, ru.PROMOTION,
+                       ru.CAPTURE_PROMOTION]
+
+def promotion(m):
+    """Return the type of the piece a pawn becomes with the Move m, or
+    None."""
+
+    if(m.type_ in [ru.PROMOTION, ru.CAPTURE_PROMOTION]):
+        return ru.QUEEN
+    return None
+
+def tablebase_score((result, plies), ply):
+    """Return the score of the (result, plies) given by the tablebases for
+    the player to move, ply plies from the root."""
+
+    if(result == tb.WIN):
+        return MATE - ply - plies
+    if(result == tb.LOSS):
+        return -MATE + ply + plies
+    return 0
+
+
+"""Classes"""
+class Engine():
+    """The class Engine is an AI which searches the best move of a Game.
+
+    The search is limited by max_depth, by a deadline of time_ms milliseconds
+    and by a budget of max_nodes nodes; None means no limit. After a search,
+    depth, nodes, time and score tell what the search did.
+
+    The engine has a transposition table of hash_mb megabytes, kept from one
+    search to the next; 0 means no table.
+
+    If book is the path of an opening book, the moves of the book are played
+    without searching. If tablebases is the directory of endgame tablebases,
+    the positions of their endings are not searched: the best move of the
+    root comes from them, and the score of a node is read in them.
+    """
+
+    def __init__(self, max_depth=64, time_ms=None, max_nodes=None,
+                 hash_mb=16, book=None, tablebases=None):
+        self.max_depth = max_depth
+        self.time_ms = time_ms
+        self.max_nodes = max_nodes
+        self.table = None
+        if(hash_mb):
+            self.table = tt.TranspositionTable(hash_mb)
+        self.book = None
+        if(book is not None):
+            self.book = bk.Book(book)
+        self.tablebases = None
+        if(tablebases is not None):
+            self.tablebases = tb.Tablebases(tablebases)
+
+        self.depth = 0      # The depth of the deepest finished iteration
+        self.nodes = 0
+        self.time = 0.
+        self.score = 0
+        self.best_move = None
+        self.best_promotion = None  # The piece the pawn of best_move becomes
+
+    def nps(self):
+        """Return the number of nodes searched per second."""
+
+        return self.nodes / max(self.time, 1e-9)
+
+    def report(self):
+        """Return a line telling what the last search did."""
+
+        return ("depth %d, %d nodes in %.3fs (%.0f nodes/s), score %d" %
+                (self.depth, self.nodes, self.time, self.nps(), self.score))
+
+    def search(self, game):
+        """Return the best Move found for the player who must play in game,
+        or None if he can't play.
+
+        The board of the game is used for the search, and is given back as it
+        was. A promotion is made to a queen, unless the tablebases choose
+        another piece; best_promotion tells which one.
+        """
+
+        self.board = game.board
+        self.color = game.get_playing_color()
+        self.start = time.time()
+        self.nodes = 0
+        self.next_check = CHECK_EVERY
+        self.stopped = False
+        self.depth = 0
+        self.score = 0
+        if(self.table is not None):
+            self.table.new_search()
+
+        moves = list(self.board.legal_moves(self.color))
+        self.best_move = None
+        self.best_promotion = None
+        if(moves and self.book is not None):
+            self.best_move = self.book.choose(self.board.zobrist, moves)
+            if(self.best_move is not None):
+                self.best_promotion = promotion(self.best_move)
+                self.time = time.time() - self.start
+                return self.best_move
+        if(moves and self.tablebases is not None):
+            found = self.tablebases.best_move(game)
+            if(found is not None):
+                self.best_move, self.best_promotion = found
+                self.score = tablebase_score(self.tablebases.probe(game), 0)
+                self.time = time.time() - self.start
+                return self.best_move
+        if(moves):
+            self.best_move = moves[0]
+            entry = self.__probe(0)
+            if(entry is not None and entry[3] in moves):
+                self.best_move = entry[3]
+
+        for depth in xrange(1, self.max_depth + 1):
+            if(not moves):
+                break
+            moves.sort(key=self.__move_order, reverse=True)
+            if(self.best_move in moves):    # The best move is searched first
+                moves.remove(self.best_move)
+                moves.insert(0, self.best_move)
+
+            score, m = self.__search_root(moves, depth)
+            if(m is not None):
+                self.best_move, self.score = m, score
+            if(self.stopped):
+                break
+            self.__store(depth, tt.EXACT, score, m, 0)
+            self.depth = depth
+            if(abs(score) >= MATE_FOUND):
+                break   # A mate was found, no need to look further
+
+        if(self.best_move is not None):
+            self.best_promotion = promotion(self.best_move)
+        self.time = time.time() - self.start
+        return self.best_move
+
+    def play(self, game):
+        """Search the best move and play it in game.
+
+        Return what Game.move() returned, or None if there is no move.
+        """
+
+        m = self.search(game)
+        if(m is None):
+            return None
+        result = game.move(self.color, m.src, m.dest, type_=m.type_)
+        if(self.best_promotion is not None):
+            game.promote(m.dest, self.best_promotion)
+        return result
+
+    def __move_order(self, m):
+        # Return the key to sort the moves, the most promising first: the
+        # captures of the most valuable pieces by the least valuable ones.
+        if(not is_capture(m)):
+            return 0
+        victim = self.board.dict_.get(m.dest)
+        if(victim is None):
+            value = PIECE_VALUES[ru.PAWN]
+        else:
+            value = PIECE_VALUES[victim.type_]
+        if(promotion(m) is not None):
+            value += PIECE_VALUES[ru.QUEEN]
+        return 10 * value - PIECE_VALUES[self.board.dict_[m.src].type_]
+
+    def __probe(self, ply):
+        # Return the (depth, bound, score, move) of the position in the
+        # transposition table, or None.
+        if(self.table is None):
+            return None
+        entry = self.table.probe(self.board.zobrist)
+        if(entry is None):
+            return None
+        depth, bound, score, m = entry
+        # The mate scores are stored as seen from the position.
+        if(score >= MATE_FOUND):
+            score -= ply
+        elif(score <= -MATE_FOUND):
+            score += ply
+        return depth, bound, score, m
+
+    def __store(self, depth, bound, score, m, ply):
+        # Store the search of the position in the transposition table.
+        if(self.table is None):
+            return
+        if(score >= MATE_FOUND):
+            score += ply
+        elif(score <= -MATE_FOUND):
+            score -= ply
+        self.table.store(self.board.zobrist, depth, bound, score, m)
+
+    def __out_of_limits(self):
+        # Say if the search must stop now.
+        if(self.max_nodes is not None and self.nodes >= self.max_nodes):
+            return True
+        if(self.time_ms is not None and self.nodes >= self.next_check):
+            self.next_check = self.nodes + CHECK_EVERY
+            return (time.time() - self.start) * 1000 >= self.time_ms
+        return False
+
+    def __search_root(self, moves, depth):
+        # Return the score and the best of the moves at depth, the best move
+        # being None if the search stopped before the first move was done.
+        alpha, best = -INFINITY, None
+        e_c = ru.enemy_color(self.color)
+        for m in moves:
+            token = self.board.make(m, promotion(m))
+            score = -self.__negamax(e_c, depth - 1, -INFINITY, -alpha, 1)
+            self.board.unmake(token)
+            if(self.stopped):
+                break
+            if(score > alpha):
+                alpha, best = score, m
+        return alpha, best
+
+    def __negamax(self, color, depth, alpha, beta, ply):
+        # Return the score of the position for 'color', searched at depth.
+        if(depth <= 0):
+            return self.__quiescence(color, alpha, beta)
+        self.nodes += 1
+        if(self.stopped or self.__out_of_limits()):
+            self.stopped = True
+            return 0
+        if(self.tablebases is not None and
+           len(self.board.dict_) <= tb.MAX_PIECES):
+            found = self.tablebases.probe_board(self.board, color)
+            if(found is not None):
+                return tablebase_score(found, ply)
+
+        entry = self.__probe(ply)
+        best_move = None
+        if(entry is not None):
+            e_depth, bound, score, best_move = entry
+            if(e_depth >= depth and
+               (bound == tt.EXACT or
+                (bound == tt.LOWER and score >= beta) or
+                (bound == tt.UPPER and score <= alpha))):
+                return score
+
+        moves = list(self.board.legal_moves(color))
+        if(not moves):
+            if(self.board.is_check(color)):
+                return -MATE + ply
+            return 0
+        moves.sort(key=self.__move_order, reverse=True)
+        if(best_move in moves):     # The move of the table is searched first
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+
+        alpha_0, best_score = alpha, -INFINITY
+        e_c = ru.enemy_color(color)
+        for m in moves:
+            token = self.board.make(m, promotion(m))
+            score = -self.__negamax(e_c, depth - 1, -beta, -alpha, ply + 1)
+            self.board.unmake(token)
+            if(self.stopped):
+                return 0
+            if(score > best_score):
+                best_score, best_move = score, m
+                if(score > alpha):
+                    alpha = score
+                    if(alpha >= beta):
+                        break
+
+        if(best_score >= beta):
+            bound = tt.LOWER
+        elif(best_score <= alpha_0):
+            bound = tt.UPPER
+        else:
+            bound = tt.EXACT
+        self.__store(depth, bound, best_score, best_move, ply)
+        return best_score
+
+    def __quiescence(self, color, alpha, beta):
+        # Return the score of the position for 'color', only looking at the
+        # captures so that the search doesn't stop in the middle of a trade.
+        self.nodes += 1
+        if(self.stopped or self.__out_of_limits()):
+            self.stopped = True
+            return 0
+        stand_pat = evaluate(self.board, color)
+        if(stand_pat >= beta):
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        moves = [m for m in self.board.legal_moves(color) if is_capture(m)]
+        moves.sort(key=self.__move_order, reverse=True)
+        e_c = ru.enemy_color(color)
+        for m in moves:
+            token = self.board.make(m, promotion(m))
+            score = -self.__quiescence(e_c, -beta, -alpha)
+            self.board.unmake(token)
+            if(self.stopped):
+                return 0
+            if(score > alpha):
+                alpha = score
+                if(alpha >= beta):
+                    break
+        return alpha
@@ -0,0 +1,63 @@
+"""Unittest of the module alphabeta.py."""
+
+import unittest
+import game
+from AI import alphabeta
+
+"""Constants"""
+W = game.WHITE_COLOR
+B = game.BLACK_COLOR
+
+class Search(unittest.TestCase):
+    """Test the moves found by the engine."""
+
+    def setUp(self):
+        self.g = game.Game()
+
+    def play(self, moves):
+        """Play the list of (src, dest) 'moves', white first."""
+
+        c = W
+        for src, dest in moves:
+            self.assertNotEqual(self.g.move(c, src, dest), game.INVALID_MOVE)
+            c = game.ru.enemy_color(c)
+
+    def test_mate_in_one(self):
+        """1. e4 e5 2. Bc4 Nc6 3. Qh5 Nf6 and 4. Qxf7++ is found."""
+
+        self.play([((5, 2), (5, 4)), ((5, 7), (5, 5)), ((6, 1), (3, 4)),
+                   ((2, 8), (3, 6)), ((4, 1), (8, 5)), ((7, 8), (6, 6))])
+        e = alphabeta.Engine(max_depth=3)
+        self.assertEqual(e.play(self.g), game.CHECK_MATE)
+        self.assertEqual(e.best_move.dest, (6, 7))
+        self.assertTrue(e.score >= alphabeta.MATE_FOUND)
+
+    def test_hanging_queen(self):
+        """1. e4 d5 2. Qg4: the queen is taken."""
+
+        self.play([((5, 2), (5, 4)), ((4, 7), (4, 5)), ((4, 1), (7, 4))])
+        e = alphabeta.Engine(max_depth=2)
+        m = e.search(self.g)
+        self.assertEqual((m.src, m.dest), ((3, 8), (7, 4)))
+
+    def test_limits(self):
+        """The search stops at its node budget and gives the board back."""
+
+        self.play([((5, 2), (5, 4)), ((5, 7), (5, 5))])
+        key = self.g.position_key()
+        pieces = self.g.get_board().copy()
+        e = alphabeta.Engine(max_nodes=500)
+        m = e.search(self.g)
+        self.assertIn(m, list(self.g.board.legal_moves(W)))
+        self.assertTrue(e.nodes <= 500)
+        self.assertEqual(self.g.position_key(), key)
+        self.assertEqual(self.g.get_board(), pieces)
+
+        e = alphabeta.Engine(time_ms=200)
+        e.search(self.g)
+        self.assertTrue(e.time < 1.)
+        self.assertTrue(e.depth >= 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""Book module
+
+This module builds an opening book from recorded games, and finds the moves
+of the book for a position.
+
+The book is a file of entries of 16 bytes sorted by position: the Zobrist
+key of the position (8 bytes), the move (2 bytes, as encoded by the
+transposition module), its weight (2 bytes) and the number of games where it
+was played (4 bytes), all big-endian. The weight of a move is twice the games
+it won plus the games it drew, as in the Polyglot books. The reader maps the
+file in memory and finds a position by binary search.
+
+Usage, from the source directory:
+python -m AI.book games.pgn|games.arc book.bin [max_plies] [min_games]
+"""
+
+import mmap
+import os
+import struct
+import sys
+
+import rules as ru
+import pgn
+import archive
+from AI import transposition as tt
+
+"""Constants"""
+ENTRY = struct.Struct('>QHHI')  # Key, move, weight, games
+MAX_PLIES = 20      # Only the first moves of the games go in the book
+MIN_GAMES = 1       # Nor the moves played less often
+MAX_WEIGHT = 0xffff
+
+"""Functions"""
+def game_moves(path):
+    """Generate the (FEN, moves, result) of the games of the PGN file or the
+    archive path, the moves being in SAN or encoded by the archive
+    module."""
+
+    if(path.endswith('.pgn')):
+        with open(path) as f:
+            for pgn_game in pgn.read_games(f):
+                yield (pgn_game.headers.get('FEN', ru.INITIAL_FEN),
+                       pgn_game.moves, pgn_game.result)
+    else:
+        a = archive.Archive(path)
+        for n in xrange(len(a)):
+            fen, moves, result = a.record(n)
+            yield fen or ru.INITIAL_FEN, moves, result
+        a.close()
+
+def build(path, book_path, max_plies=MAX_PLIES, min_games=MIN_GAMES):
+    """Write the book book_path from the games of the PGN file or the
+    archive path.
+
+    The moves of the first max_plies plies of the games which were played
+    at least min_games times go in the book. Return the number of entries.
+    """
+
+    stats = {}  # (key, move): [games, weight]
+    board = ru.Board([])
+    for fen, moves, result in game_moves(path):
+        color = board.set_fen(fen)
+        for move in moves[:max_plies]:
+            if(isinstance(move, basestring)):
+                parsed = pgn.parse_san(board, color, move)
+                if(parsed is None):
+                    break
+                m, promotion = parsed
+            else:
+                m, promotion = archive.decode_move(board, move)
+            if(result == '1/2-1/2'):
+                points = 1
+            elif(result == ['1-0', '0-1'][color]):
+                points = 2
+            else:
+                points = 0
+            s = stats.setdefault((board.zobrist, tt.encode_move(m)), [0, 0])
+            s[0] += 1
+            s[1] += points
+            board.make(m, promotion)
+            color = ru.enemy_color(color)
+
+    n = 0
+    with open(book_path, 'wb') as f:
+        for (key, move), (games, weight) in sorted(stats.iteritems()):
+            if(games >= min_games):
+                f.write(ENTRY.pack(key, move, min(weight, MAX_WEIGHT),
+                                   games))
+                n += 1
+    return n
+
+
+"""Classes"""
+class Book():
+    """The class Book finds the moves of an opening book file."""
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.map = None
+        self.entries = 0
+        if(os.path.getsize(path)):  # An empty file can't be mapped
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.entries = len(self.map) // ENTRY.size
+
+    def close(self):
+        """Unmap and close the file."""
+
+        if(self.map is not None):
+            self.map.close()
+        self.f.close()
+
+    def __len__(self):
+        return self.entries
+
+    def moves(self, key):
+        """Return the list of the (Move, weight, games) of the book for the
+        position of Zobrist key, the heaviest first."""
+
+        # Binary search of the first entry of the key
+        low, high = 0, self.entries
+        while(low < high):
+            middle = (low + high) // 2
+            if(ENTRY.unpack_from(self.map, middle * ENTRY.size)[0] < key):
+                low = middle + 1
+            else:
+                high = middle
+
+        l = []
+        for i in xrange(low, self.entries):
+            k, move, weight, games = ENTRY.unpack_from(self.map,
+                                                       i * ENTRY.size)
+            if(k != key):
+                break
+            l.append((tt.decode_move(move), weight, games))
+        l.sort(key=lambda (m, weight, games): (-weight, -games))
+        return l
+
+    def probe(self, g):
+        """Return the list of the (Move, weight, games) of the book for the
+        position of the Game g, the heaviest first."""
+
+        return self.moves(g.position_key())
+
+    def choose(self, key, legal_moves):
+        """Return the heaviest move of the book for the position of Zobrist
+        key among legal_moves, or None."""
+
+        for m, weight, games in self.moves(key):
+            if(weight > 0 and m in legal_moves):
+                return m
+        return None
+
+
+if __name__ == '__main__':
+    max_plies, min_games = MAX_PLIES, MIN_GAMES
+    if(len(sys.argv) > 3):
+        max_plies = int(sys.argv[3])
+    if(len(sys.argv) > 4):
+        min_games = int(sys.argv[4])
+    print "%d entries" % build(sys.argv[1], sys.argv[2], max_plies,
+                               min_games)
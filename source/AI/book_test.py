@@ -0,0 +1,81 @@
+"""Unittest of the module book.py."""
+
+import os
+import tempfile
+import unittest
+import game
+import pgn_test
+import rules
+from AI import alphabeta
+from AI import book
+
+"""Constants"""
+W = game.WHITE_COLOR
+B = game.BLACK_COLOR
+
+GAMES = pgn_test.OPERA_GAME * 2 + """[Result "0-1"]
+
+1. e4 c5 2. Nf3 0-1
+
+[Result "1/2-1/2"]
+
+1. d4 d5 1/2-1/2
+
+"""
+
+class Book(unittest.TestCase):
+    """Test building and reading a book."""
+
+    def setUp(self):
+        fd, self.pgn_path = tempfile.mkstemp(suffix='.pgn')
+        os.write(fd, GAMES)
+        os.close(fd)
+        fd, self.path = tempfile.mkstemp(suffix='.bin')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.pgn_path)
+        os.remove(self.path)
+
+    def test_moves(self):
+        """The moves of a position come with their weight, the heaviest
+        first."""
+
+        self.assertEqual(book.build(self.pgn_path, self.path, 4), 8)
+        b = book.Book(self.path)
+        self.assertEqual(len(b), 8)
+        self.assertEqual(os.path.getsize(self.path), 8 * 16)
+
+        g = game.Game()
+        e4 = rules.Move((5, 2), (5, 4), rules.NORMAL_MOVE)
+        d4 = rules.Move((4, 2), (4, 4), rules.NORMAL_MOVE)
+        self.assertEqual(b.probe(g), [(e4, 4, 3), (d4, 1, 1)])
+        g.move(W, (5, 2), (5, 4))
+        self.assertEqual([(m.dest, weight) for m, weight, games in b.probe(g)],
+                         [((3, 5), 2), ((5, 5), 0)])
+        g.move(B, (3, 7), (3, 5))
+        nf3 = rules.Move((7, 1), (6, 3), rules.NORMAL_MOVE)
+        self.assertEqual(b.probe(g), [(nf3, 0, 1)])
+        g.move(W, (7, 1), (6, 3))
+        self.assertEqual(b.probe(g), [])
+        self.assertEqual(b.moves(0), [])
+        self.assertEqual(b.moves(2**64 - 1), [])
+        b.close()
+
+    def test_engine(self):
+        """The engine plays the book without searching, and the moves which
+        only lost are left."""
+
+        book.build(self.pgn_path, self.path)
+        e = alphabeta.Engine(max_depth=2, book=self.path)
+        g = game.Game()
+        e.play(g)
+        self.assertEqual(g.history[-1].dest, (5, 4))
+        self.assertEqual(e.nodes, 0)
+        g.move(B, (3, 7), (3, 5))
+        e.play(g)
+        self.assertEqual(e.depth, 2)    # Nf3 only lost, it was searched
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+"""Transposition module
+
+This module contains the class TranspositionTable which remembers what the
+search found about the positions, known by their Zobrist key, so that a
+position reached again by another order of moves is not searched twice.
+
+The table has a fixed size given in megabytes: it is stored in two arrays of
+64-bit integers, one for the keys and one for the packed entries, and never
+grows. The array module of Python 2 has no typecode of 64 bits everywhere:
+'L' has 64 bits only where a C long does, so where it has 32 bits, each
+integer is stored in two halves.
+"""
+
+from array import array
+
+import rules as ru
+
+"""Constants"""
+BOARD_SIZE = ru.BOARD_SIZE
+
+(   # Bound type of a score
+EMPTY,  # The slot is empty
+EXACT,  # The score is exact
+LOWER,  # The score is a lower bound, the search failed high
+UPPER   # The score is an upper bound, the search failed low
+) = range(4)
+
+SLOTS = 2   # Per bucket: the depth-preferred slot then the always-replace one
+
+# How an entry is packed in 64 bits, from the low bits:
+# bound (2 bits), depth (8 bits), age (6 bits), move (16 bits), score (32 bits)
+DEPTH_SHIFT = 2
+AGE_SHIFT = 10
+MOVE_SHIFT = 16
+SCORE_SHIFT = 32
+SCORE_OFFSET = 1 << 31
+MAX_AGE = 64
+
+# The typecode of the arrays of 64-bit integers, None if there is none
+WORD_TYPECODE = None
+for typecode in ['Q', 'L']:
+    try:
+        if(array(typecode).itemsize == 8):
+            WORD_TYPECODE = typecode
+            break
+    except ValueError:  # No 'Q' before Python 3.3
+        pass
+HALF_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+"""Functions"""
+def encode_move(m):
+    """Return the Move m as a 16-bit number, 0 being no move."""
+
+    if(m is None):
+        return 0
+    (s_x, s_y), (d_x, d_y), type_ = m
+    src = (s_y - 1) * BOARD_SIZE + s_x - 1
+    dest = (d_y - 1) * BOARD_SIZE + d_x - 1
+    return 1 | src << 1 | dest << 7 | type_ << 13
+
+def decode_move(n):
+    """Return the Move given by encode_move(), or None."""
+
+    if(n == 0):
+        return None
+    src, dest, type_ = (n >> 1) & 63, (n >> 7) & 63, n >> 13
+    return ru.Move((src % BOARD_SIZE + 1, src // BOARD_SIZE + 1),
+                   (dest % BOARD_SIZE + 1, dest // BOARD_SIZE + 1), type_)
+
+
+def words(n):
+    """Return an array of n 64-bit integers set to 0, made of two arrays of
+    halves if the platform has no 64-bit typecode."""
+
+    if(WORD_TYPECODE is None):
+        return HalvesArray(n)
+    return array(WORD_TYPECODE, [0]) * n
+
+
+"""Classes"""
+class HalvesArray():
+    """The class HalvesArray is an array of 64-bit integers stored as two
+    arrays of 32-bit halves."""
+
+    itemsize = 8
+
+    def __init__(self, n):
+        self.low = array(HALF_TYPECODE, [0]) * n
+        self.high = array(HALF_TYPECODE, [0]) * n
+
+    def __len__(self):
+        return len(self.low)
+
+    def __getitem__(self, i):
+        return self.high[i] << 32 | self.low[i]
+
+    def __setitem__(self, i, value):
+        self.low[i] = value & 0xffffffff
+        self.high[i] = value >> 32
+
+class TranspositionTable():
+    """The class TranspositionTable stores the score, the depth, the bound
+    type and the best move of the positions.
+
+    Each key has a bucket of two slots. The first one keeps the deepest
+    search of the current search, the second one always takes the new
+    entries which don't go in the first one, and the ones pushed out of it.
+    A position is in one slot at most.
+    """
+
+    def __init__(self, size_mb=16, array_type=None):
+        """Allocate a table of size_mb megabytes.
+
+        The arrays of 64-bit integers are made by array_type(n), words() if
+        it is None.
+        """
+
+        if(array_type is None):
+            array_type = words
+        # Bytes per slot: the key and the packed entry
+        slot_size = 2 * array_type(0).itemsize
+        buckets = 1
+        while(buckets * 2 * SLOTS * slot_size <= size_mb * 2**20):
+            buckets *= 2
+        self.mask = buckets - 1
+        self.keys = array_type(buckets * SLOTS)
+        self.entries = array_type(buckets * SLOTS)
+        self.age = 0
+        self.clear_stats()
+        self.filled = 0
+
+    def size(self):
+        """Return the number of slots of the table."""
+
+        return len(self.keys)
+
+    def clear(self):
+        """Empty the table."""
+
+        for i in xrange(len(self.keys)):
+            self.keys[i] = 0
+            self.entries[i] = 0
+        self.filled = 0
+        self.clear_stats()
+
+    def clear_stats(self):
+        """Set the statistics back to zero."""
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0     # Entries of other positions overwritten
+
+    def new_search(self):
+        """Tell the table a new search begins, so that the entries of the
+        previous searches can be replaced first."""
+
+        self.age = (self.age + 1) % MAX_AGE
+
+    def probe(self, key):
+        """Return the (depth, bound, score, move) stored for the key, or
+        None."""
+
+        self.probes += 1
+        i = (key & self.mask) * SLOTS
+        for j in xrange(i, i + SLOTS):
+            if(self.keys[j] == key and self.entries[j] & 3 != EMPTY):
+                self.hits += 1
+                e = self.entries[j]
+                return ((e >> DEPTH_SHIFT) & 255, e & 3,
+                        (e >> SCORE_SHIFT) - SCORE_OFFSET,
+                        decode_move((e >> MOVE_SHIFT) & 0xffff))
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """Store what a search at depth found about the position of the key:
+        the score, its bound type and the best move (or None)."""
+
+        self.stores += 1
+        i = (key & self.mask) * SLOTS
+        keys, entries = self.keys, self.entries
+        old = None  # The slot of the entry already stored for the key
+        for j in xrange(i, i + SLOTS):
+            if(keys[j] == key and entries[j] & 3 != EMPTY):
+                old = j
+        if(old is not None and move is None):   # Keep the best move known
+            move = decode_move((entries[old] >> MOVE_SHIFT) & 0xffff)
+
+        first = entries[i]
+        if(old == i or first & 3 == EMPTY or
+           depth >= (first >> DEPTH_SHIFT) & 255 or
+           (first >> AGE_SHIFT) & 63 != self.age):
+            j = i   # The depth-preferred slot
+            if(first & 3 == EMPTY):
+                self.filled += 1
+            elif(old != i):
+                # The entry pushed out goes to the always-replace slot,
+                # over the entry of the key if it was there.
+                if(entries[i + 1] & 3 == EMPTY):
+                    self.filled += 1
+                elif(old != i + 1):
+                    self.collisions += 1
+                keys[i + 1], entries[i + 1] = keys[i], first
+                old = None
+            if(old == i + 1):
+                entries[i + 1] = EMPTY
+                self.filled -= 1
+        else:
+            j = i + 1
+            if(entries[j] & 3 == EMPTY):
+                self.filled += 1
+            elif(old != j):
+                self.collisions += 1
+
+        keys[j] = key
+        entries[j] = (bound | min(depth, 255) << DEPTH_SHIFT |
+                      self.age << AGE_SHIFT |
+                      encode_move(move) << MOVE_SHIFT |
+                      (score + SCORE_OFFSET) << SCORE_SHIFT)
+
+    def hit_rate(self):
+        """Return the part of the probes which found their position."""
+
+        return float(self.hits) / max(self.probes, 1)
+
+    def fill_rate(self):
+        """Return the part of the slots which are used."""
+
+        return float(self.filled) / self.size()
+
+    def report(self):
+        """Return a line giving the statistics of the table."""
+
+        return ("%d slots, %.1f%% filled, %d probes, %.1f%% hits, "
+                "%d stores, %d collisions" %
+                (self.size(), 100 * self.fill_rate(), self.probes,
+                 100 * self.hit_rate(), self.stores, self.collisions))
@@ -0,0 +1,100 @@
+"""Unittest of the module transposition.py."""
+
+import unittest
+import rules as ru
+from AI import transposition as tt
+
+class Table(unittest.TestCase):
+    """Test storing and finding entries."""
+
+    def setUp(self):
+        self.t = tt.TranspositionTable(1)
+        self.m = ru.Move((5, 7), (5, 8), ru.CAPTURE_PROMOTION)
+
+    def test_move_encoding(self):
+        """The moves are given back as they were stored."""
+
+        for m in [None, self.m, ru.Move((1, 1), (8, 8), ru.NORMAL_MOVE),
+                  ru.Move((5, 1), (7, 1), ru.CASTLING)]:
+            self.assertEqual(tt.decode_move(tt.encode_move(m)), m)
+
+    def test_store_probe(self):
+        """An entry is found with its key only."""
+
+        self.assertEqual(self.t.size(), 2**16)
+        key = 0x123456789abcdef0
+        self.t.store(key, 5, tt.LOWER, -99999, self.m)
+        self.assertEqual(self.t.probe(key), (5, tt.LOWER, -99999, self.m))
+        self.assertEqual(self.t.probe(key ^ 1 << 63), None)
+        self.assertEqual(self.t.hit_rate(), 0.5)
+
+        # The best move is kept when a new search doesn't give one.
+        self.t.store(key, 6, tt.UPPER, 10, None)
+        self.assertEqual(self.t.probe(key), (6, tt.UPPER, 10, self.m))
+
+    def test_replacement(self):
+        """The deepest entry stays, the others share the second slot."""
+
+        n = self.t.mask + 1     # Same bucket, other positions
+        self.t.store(1, 8, tt.EXACT, 1, None)
+        self.t.store(1 + n, 2, tt.EXACT, 2, None)
+        self.t.store(1 + 2*n, 3, tt.EXACT, 3, None)
+        self.assertEqual(self.t.probe(1)[2], 1)
+        self.assertEqual(self.t.probe(1 + n), None)
+        self.assertEqual(self.t.probe(1 + 2*n)[2], 3)
+        self.assertEqual(self.t.collisions, 1)
+
+        # The entries of an old search can be replaced: the one pushed out
+        # of the first slot goes to the second one.
+        self.t.new_search()
+        self.t.store(1 + n, 2, tt.EXACT, 2, None)
+        self.assertEqual(self.t.probe(1 + n)[2], 2)
+        self.assertEqual(self.t.probe(1)[2], 1)
+        self.assertEqual(self.t.probe(1 + 2*n), None)
+        self.assertEqual(self.t.collisions, 2)
+
+    def test_one_slot_per_key(self):
+        """A position stored again deeper leaves no copy in the second
+        slot."""
+
+        n = self.t.mask + 1
+        self.t.store(1, 8, tt.EXACT, 1, None)
+        self.t.store(1 + n, 2, tt.EXACT, 2, self.m)
+        self.t.store(1 + n, 9, tt.LOWER, 3, None)
+        self.assertEqual(self.t.probe(1 + n), (9, tt.LOWER, 3, self.m))
+        self.assertEqual(self.t.probe(1)[2], 1)
+        self.assertEqual(list(self.t.keys[2:4]), [1 + n, 1])
+        self.assertEqual(self.t.filled, 2)
+        self.assertEqual(self.t.collisions, 0)
+
+        # Stored shallower, it stays in the second slot.
+        self.t.store(1, 3, tt.UPPER, 4, None)
+        self.assertEqual(self.t.probe(1)[:3], (3, tt.UPPER, 4))
+        self.assertEqual(self.t.filled, 2)
+
+    def test_fixed_size(self):
+        """The table never grows."""
+
+        size = self.t.size()
+        for key in xrange(3 * size):
+            self.t.store(key * 0x9e3779b97f4a7c15 % 2**64, 1, tt.EXACT, 0,
+                         None)
+        self.assertEqual(self.t.size(), size)
+        self.assertEqual(len(self.t.entries), size)
+        self.assertTrue(0.5 <= self.t.fill_rate() <= 1.)
+
+    def test_halves(self):
+        """Without a 64-bit typecode, the integers are stored in halves, and
+        the table has the same size."""
+
+        t = tt.TranspositionTable(1, tt.HalvesArray)
+        self.assertIsInstance(t.keys, tt.HalvesArray)
+        self.assertEqual(t.size(), self.t.size())
+        key = 0xfedcba9876543210
+        t.store(key, 5, tt.LOWER, -99999, self.m)
+        self.assertEqual(t.probe(key), (5, tt.LOWER, -99999, self.m))
+        self.assertEqual(t.probe(key ^ 1 << 63), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,346 @@
+"""Vectorized module
+
+This module scores many positions at once with NumPy, for the labelling of
+datasets and the tuning of the engine.
+
+The positions are packed in an (N, 64) int8 array: the square (x, y) is the
+column (y - 1) * 8 + x - 1, 0 is an empty square, a white piece is its type
+plus one and a black piece the opposite. The score of each position is the
+sum of the terms below, each one computed for all the positions together:
+- the value and the bonus of the square of each piece, as in the alpha-beta
+engine;
+- the mobility: the squares each piece attacks, its own pieces included;
+- the pawn structure: the doubled, isolated and passed pawns.
+
+The mobility of the bishops, the rooks and the queens depends on the other
+pieces: the squares taken on each row, column and diagonal make a byte,
+computed for all the lines by one matrix product, and a table gives the
+squares attacked from each square of the line for each byte. The pawns of
+each column make a byte in the same way.
+
+evaluate_board() gives the same score for one Board without NumPy: it is
+the per-position loop the batches replace, about 20 times slower. The FEN
+strings are packed by table look-ups over all their characters at once,
+in about as long as their evaluation.
+
+NumPy is optional: without it, the module can be imported but only
+evaluate_board() works.
+"""
+
+import rules as ru
+from AI import alphabeta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""Constants"""
+BOARD_SIZE = ru.BOARD_SIZE
+
+BLOCK_SIZE = 4096       # Positions scored together by evaluate()
+
+# Points per attacked square, by piece type.
+MOBILITY_WEIGHTS = {ru.KNIGHT: 4, ru.BISHOP: 4, ru.ROOK: 2, ru.QUEEN: 1}
+# The directions and the rays of the pieces which move along them.
+SLIDER_TYPES = [(ru.FOUR_DIAGONALS, ru.DIAGONAL_RAYS, (ru.BISHOP, ru.QUEEN)),
+                (ru.CARDINAL_DIRECTION, ru.CARDINAL_RAYS,
+                 (ru.ROOK, ru.QUEEN))]
+DOUBLED_PAWN = -10      # For each pawn more than one on a column
+ISOLATED_PAWN = -10     # For each pawn without a pawn on the next columns
+# The bonus of a passed pawn, by row from the side of its player.
+PASSED_PAWN = [0, 5, 10, 20, 35, 60, 100, 0]
+
+# The letter of each piece in the FEN notation and its number in the arrays.
+LETTER_CODES = dict([(char, type_ + 1)
+                     for type_, char in enumerate(ru.PIECE_LETTERS)] +
+                    [(char.lower(), -type_ - 1)
+                     for type_, char in enumerate(ru.PIECE_LETTERS)])
+
+"""Functions"""
+def square((x, y)):
+    """Return the column of the square (x, y) in the arrays."""
+
+    return (y - 1) * BOARD_SIZE + x - 1
+
+def code(p):
+    """Return the number of the piece p in the arrays."""
+
+    if(p.color == ru.WHITE_COLOR):
+        return p.type_ + 1
+    return -p.type_ - 1
+
+def evaluate_board(board, color):
+    """Return the score of the position of the board for 'color', the higher
+    the better for it."""
+
+    s = alphabeta.evaluate(board, color)
+    b = board.dict_
+    pawns = [[], []]    # [color]: positions of the pawns
+    for pos, p in b.iteritems():
+        sign = 1 if p.color == color else -1
+        if(p.type_ == ru.KNIGHT):
+            s += sign * MOBILITY_WEIGHTS[ru.KNIGHT] * len(
+                                                     ru.KNIGHT_TARGETS[pos])
+        for directions, rays, types in SLIDER_TYPES:
+            if(p.type_ not in types):
+                continue
+            for ray in rays[pos]:
+                for target in ray:
+                    s += sign * MOBILITY_WEIGHTS[p.type_]
+                    if(target in b):
+                        break
+        if(p.type_ == ru.PAWN):
+            pawns[p.color].append(pos)
+
+    for c in [ru.WHITE_COLOR, ru.BLACK_COLOR]:
+        sign = 1 if c == color else -1
+        enemies = pawns[ru.enemy_color(c)]
+        columns = [x for x, y in pawns[c]]
+        for x in set(columns):
+            s += sign * DOUBLED_PAWN * (columns.count(x) - 1)
+        for x, y in pawns[c]:
+            if(x - 1 not in columns and x + 1 not in columns):
+                s += sign * ISOLATED_PAWN
+            if(c == ru.WHITE_COLOR):
+                passed = not any(abs(e_x - x) <= 1 and e_y > y
+                                 for e_x, e_y in enemies)
+                row = y - 1
+            else:
+                passed = not any(abs(e_x - x) <= 1 and e_y < y
+                                 for e_x, e_y in enemies)
+                row = BOARD_SIZE - y
+            if(passed):
+                s += sign * PASSED_PAWN[row]
+    return s
+
+def pack_boards(boards):
+    """Return the (N, 64) int8 array of the list of Boards."""
+
+    a = np.zeros((len(boards), BOARD_SIZE ** 2), np.int8)
+    for i, board in enumerate(boards):
+        for pos, p in board.dict_.iteritems():
+            a[i, square(pos)] = code(p)
+    return a
+
+def pack_fens(fens):
+    """Return the (N, 64) int8 array of the positions of the list of FEN
+    strings, and the int8 array of the colors to move.
+
+    The characters of all the positions are read at once: tables give the
+    number of squares each one covers and its piece, and the sum of the
+    squares covered before a character gives its square.
+    """
+
+    fields = [fen.split(None, 2) for fen in fens]
+    rows = ''.join(f[0] for f in fields)
+    chars = np.frombuffer(rows, np.uint8)
+    chars = chars[chars != ord('/')]
+    widths = FEN_WIDTHS[chars]
+    ends = np.cumsum(widths)
+    if(len(fens) and ends[-1] != len(fens) * BOARD_SIZE ** 2 or
+       (widths == 0).any()):
+        raise ValueError("Invalid FEN string in the list")
+
+    # The squares of the characters in the order of the FEN strings, from
+    # a8 to h1, then in the arrays.
+    pieces = FEN_CODES[chars] != 0
+    k = (ends - widths)[pieces]
+    i, k = k // BOARD_SIZE ** 2, k % BOARD_SIZE ** 2
+    a = np.zeros((len(fens), BOARD_SIZE ** 2), np.int8)
+    a[i, (BOARD_SIZE - 1 - k // BOARD_SIZE) * BOARD_SIZE +
+         k % BOARD_SIZE] = FEN_CODES[chars[pieces]]
+    colors = np.array([len(f) > 1 and f[1] == 'b' for f in fields], np.int8)
+    return a, colors * ru.BLACK_COLOR
+
+def lines():
+    """Return the list of the lines of the board: the rows, the columns and
+    the diagonals, each one being the list of its squares."""
+
+    r = range(1, BOARD_SIZE + 1)
+    l = [[(x, y) for x in r] for y in r] + [[(x, y) for y in r] for x in r]
+    l += [[(x, x - d) for x in r if 1 <= x - d <= BOARD_SIZE]
+          for d in xrange(1 - BOARD_SIZE, BOARD_SIZE)]
+    l += [[(x, d - x) for x in r if 1 <= d - x <= BOARD_SIZE]
+          for d in xrange(2, 2 * BOARD_SIZE + 1)]
+    return l
+
+def line_count(bits, i):
+    """Return the number of squares attacked from the square i of a line,
+    bits being the list of the squares of the line which are taken."""
+
+    n = 0
+    for step in [-1, 1]:
+        j = i + step
+        while(0 <= j < len(bits)):
+            n += 1
+            if(bits[j]):
+                break
+            j += step
+    return n
+
+def line_bytes(taken, matrix):
+    """Return the (N, L) array of the bytes of the squares taken on each of
+    the L lines of the matrix, taken being an (N, 64) bool array.
+
+    The matrix gives the bit of each square in the byte of each line: the
+    product is done by BLAS, far faster than packing the bits.
+    """
+
+    return np.dot(taken.astype(np.float32), matrix).astype(np.intp)
+
+def byte_matrix(lines):
+    """Return the (64, L) float32 matrix of the bits of the squares in the
+    bytes of the L lines, the first square of a line being the high bit."""
+
+    m = np.zeros((BOARD_SIZE ** 2, len(lines)), np.float32)
+    for i, line in enumerate(lines):
+        for j, pos in enumerate(line):
+            m[square(pos), i] = 1 << (BOARD_SIZE - 1 - j)
+    return m
+
+def pawn_score(pawns, enemies):
+    """Return the array of the scores of the pawn structures of a player,
+    pawns and enemies being the (N, 8) arrays of the bytes of the columns of
+    the pawns of the player and of the enemy pawns, the rows going from the
+    side of the player."""
+
+    by_column = POPCOUNT[pawns]
+    s = DOUBLED_PAWN * np.maximum(by_column - 1, 0).sum(axis=1)
+
+    # Isolated pawns
+    next_to = np.zeros_like(by_column)
+    next_to[:, 1:] |= by_column[:, :-1]
+    next_to[:, :-1] |= by_column[:, 1:]
+    s += ISOLATED_PAWN * (by_column * (next_to == 0)).sum(axis=1)
+
+    # Passed pawns: the farthest enemy pawn on the column or the next ones
+    # is not in front of them.
+    farthest = FARTHEST[enemies]
+    span = farthest.copy()
+    span[:, 1:] = np.maximum(span[:, 1:], farthest[:, :-1])
+    span[:, :-1] = np.maximum(span[:, :-1], farthest[:, 1:])
+    s += PASSED_TABLE[span, pawns].sum(axis=1)
+    return s
+
+def evaluate(a, colors):
+    """Return the int32 array of the scores of the positions of the (N, 64)
+    array a, each one for the color to move given by the array colors, as
+    evaluate_board() gives them.
+
+    The positions are scored by blocks of BLOCK_SIZE, whose arrays stay in
+    the cache of the processor.
+    """
+
+    s = np.empty(len(a), np.int32)
+    for i in xrange(0, len(a), BLOCK_SIZE):
+        s[i:i + BLOCK_SIZE] = evaluate_block(a[i:i + BLOCK_SIZE],
+                                             colors[i:i + BLOCK_SIZE])
+    return s
+
+def evaluate_block(a, colors):
+    """Return the int32 array of the scores of the positions of the (N, 64)
+    array a, as evaluate() does, all of them at once."""
+
+    n = a.shape[0]
+    # The row of each piece in the flat tables, (code + 6) * 64 + square
+    pieces = a.astype(np.intp) * BOARD_SIZE ** 2 + PIECE_OFFSETS
+    s = np.take(PIECE_TABLE, pieces).sum(axis=1)
+
+    # Mobility of the bishops, the rooks and the queens: the squares taken
+    # on each line make a byte, which gives the squares attacked.
+    patterns = line_bytes(a != 0, LINE_MATRIX)
+    rows, squares = np.nonzero(np.take(SLIDERS, a.astype(np.intp) + 6))
+    lines = np.take(patterns, rows[:, np.newaxis] * patterns.shape[1] +
+                              LINE_IDS[squares])
+    mobility = np.take(MOBILITY_TABLE, lines + KIND_OFFSETS +
+                       (pieces[rows, squares] * MOBILITY_ROW)[:, np.newaxis])
+    s += np.bincount(rows, mobility.sum(axis=1), n).astype(np.int32)
+
+    # Pawn structure, the rows going from the side of each player
+    white = line_bytes(a == ru.PAWN + 1, PAWN_MATRIX)
+    black = line_bytes(a == -ru.PAWN - 1, PAWN_MATRIX)
+    s += pawn_score(white[:, :BOARD_SIZE], black[:, :BOARD_SIZE])
+    s -= pawn_score(black[:, BOARD_SIZE:], white[:, BOARD_SIZE:])
+
+    return np.where(colors == ru.WHITE_COLOR, s, -s).astype(np.int32)
+
+
+"""Precomputed tables"""
+if(np is not None):
+    # FEN_WIDTHS[byte] is the number of squares covered by the character of
+    # a FEN row, 0 for the invalid ones, and FEN_CODES[byte] its piece.
+    FEN_WIDTHS = np.zeros(256, np.intp)
+    FEN_CODES = np.zeros(256, np.int8)
+    for char, c in LETTER_CODES.iteritems():
+        FEN_WIDTHS[ord(char)] = 1
+        FEN_CODES[ord(char)] = c
+    for n in xrange(1, BOARD_SIZE + 1):
+        FEN_WIDTHS[ord(str(n))] = n
+
+    # PIECE_TABLE[code + 6][square] is the value plus the bonus of the piece,
+    # with the mobility of the knights which doesn't depend on the others.
+    PIECE_TABLE = np.zeros((13, BOARD_SIZE ** 2), np.int32)
+    for color, sign in [(ru.WHITE_COLOR, 1), (ru.BLACK_COLOR, -1)]:
+        for type_ in xrange(6):
+            c = sign * (type_ + 1) + 6
+            for pos in ru.SQUARES:
+                PIECE_TABLE[c, square(pos)] = (
+                    sign * alphabeta.PIECE_SCORES[color][type_][pos])
+                if(type_ == ru.KNIGHT):
+                    PIECE_TABLE[c, square(pos)] += (
+                        sign * MOBILITY_WEIGHTS[ru.KNIGHT] *
+                        len(ru.KNIGHT_TARGETS[pos]))
+    PIECE_OFFSETS = 6 * BOARD_SIZE ** 2 + np.arange(BOARD_SIZE ** 2)
+
+    # LINE_IDS[square][kind] is the line of the square, a row, a column, a
+    # diagonal or an anti-diagonal, and LINE_COUNTS[kind][square][byte] the
+    # number of squares attacked along it.
+    LINE_KINDS = [(ru.ROOK, ru.QUEEN), (ru.ROOK, ru.QUEEN),
+                  (ru.BISHOP, ru.QUEEN), (ru.BISHOP, ru.QUEEN)]
+    l = lines()
+    LINE_MATRIX = byte_matrix(l)
+    LINE_IDS = np.zeros((BOARD_SIZE ** 2, len(LINE_KINDS)), np.intp)
+    LINE_COUNTS = np.zeros((len(LINE_KINDS), BOARD_SIZE ** 2, 256), np.int32)
+    counts = {}     # (length, index in the line): counts by byte
+    for i, line in enumerate(l):
+        k = [0, BOARD_SIZE, 2 * BOARD_SIZE, 4 * BOARD_SIZE - 1]
+        kind = max(j for j in xrange(len(k)) if k[j] <= i)
+        for j, pos in enumerate(line):
+            if((len(line), j) not in counts):
+                counts[len(line), j] = [
+                    line_count(np.unpackbits(np.uint8(byte))[:len(line)], j)
+                    for byte in xrange(256)]
+            LINE_IDS[square(pos), kind] = i
+            LINE_COUNTS[kind, square(pos)] = counts[len(line), j]
+    # LINE_WEIGHTS[kind][code + 6] is the points per square attacked along
+    # the lines of the kind.
+    LINE_WEIGHTS = np.zeros((len(LINE_KINDS), 13), np.int32)
+    for k, types in enumerate(LINE_KINDS):
+        for type_ in types:
+            LINE_WEIGHTS[k, type_ + 1 + 6] = MOBILITY_WEIGHTS[type_]
+            LINE_WEIGHTS[k, -type_ - 1 + 6] = -MOBILITY_WEIGHTS[type_]
+    SLIDERS = (LINE_WEIGHTS != 0).any(axis=0)
+    # MOBILITY_TABLE[code + 6][square][kind][byte] is the points of the piece
+    # along the line of the kind: the flat index of a piece is its row in
+    # PIECE_TABLE times MOBILITY_ROW, plus KIND_OFFSETS, plus the byte.
+    MOBILITY_TABLE = (LINE_WEIGHTS.T[:, np.newaxis, :, np.newaxis] *
+                      LINE_COUNTS.transpose(1, 0, 2)[np.newaxis])
+    MOBILITY_ROW = len(LINE_KINDS) * 256
+    KIND_OFFSETS = np.arange(len(LINE_KINDS)) * 256
+
+    # The columns with the rows from the white side, then from the black one.
+    r = range(1, BOARD_SIZE + 1)
+    PAWN_MATRIX = byte_matrix([[(x, y) for y in r] for x in r] +
+                              [[(x, y) for y in reversed(r)] for x in r])
+    # By byte of the rows of the pawns of a column: the number of pawns, the
+    # farthest row plus one (0 for none), and, for the farthest row of the
+    # enemy pawns plus one, the bonus of the passed pawns.
+    bits = [np.unpackbits(np.uint8(byte)) for byte in xrange(256)]
+    POPCOUNT = np.array([b.sum() for b in bits], np.int32)
+    FARTHEST = np.array([max([0] + [r + 1 for r in xrange(BOARD_SIZE)
+                                    if b[r]]) for b in bits], np.intp)
+    PASSED_TABLE = np.array([[sum(PASSED_PAWN[r] for r in xrange(BOARD_SIZE)
+                                  if b[r] and r + 1 >= far)
+                              for b in bits]
+                             for far in xrange(BOARD_SIZE + 1)], np.int32)
@@ -0,0 +1,129 @@
+"""Unittest of the module vectorized.py."""
+
+import random
+import unittest
+import game
+import rules
+from AI import alphabeta
+from AI import vectorized
+
+"""Functions"""
+def random_positions(n, seed=0):
+    """Return the list of the (Board, color) of n positions of random
+    games."""
+
+    rand = random.Random(seed)
+    l = []
+    g = game.Game()
+    while(len(l) < n):
+        color = g.get_playing_color()
+        moves = sorted(g.board.legal_moves(color))
+        if(not moves or len(g.history) >= 150):
+            g = game.Game()
+            continue
+        m = rand.choice(moves)
+        g.move(color, m.src, m.dest, type_=m.type_)
+        if(m.type_ in [rules.PROMOTION, rules.CAPTURE_PROMOTION]):
+            g.promote(m.dest, rand.choice([rules.QUEEN, rules.KNIGHT]))
+        board = rules.Board([])
+        board.set_fen(g.to_fen())
+        l.append((board, g.get_playing_color()))
+    return l
+
+class EvaluateBoard(unittest.TestCase):
+    """Test the score of one board."""
+
+    def test_pawn_structure(self):
+        """The doubled, isolated and passed pawns."""
+
+        board = rules.Board([])
+        # White: a2 and a3 doubled, a2, a3 and c2 isolated, none passed
+        # because of b5. Black: b5 isolated, not passed either.
+        color = board.set_fen("4k3/8/8/1p6/8/P7/P1P5/4K3 w - -")
+        self.assertEqual(vectorized.evaluate_board(board, color) -
+                         alphabeta.evaluate(board, color),
+                         -10 - 30 - (-10))
+
+        # Without b5, the three white pawns are passed.
+        color = board.set_fen("4k3/8/8/8/8/P7/P1P5/4K3 b - -")
+        self.assertEqual(vectorized.evaluate_board(board, color) -
+                         alphabeta.evaluate(board, color),
+                         -(-10 - 30 + 5 + 10 + 5))
+
+    def test_mobility(self):
+        """The squares attacked by the pieces, up to the first piece of each
+        ray."""
+
+        board = rules.Board([])
+        color = board.set_fen("4k3/8/8/8/8/8/8/R3K2N w - -")
+        # The rook attacks 7 squares of its column and b1 to e1, the knight
+        # f2 and g3.
+        self.assertEqual(vectorized.evaluate_board(board, color) -
+                         alphabeta.evaluate(board, color),
+                         2 * (7 + 4) + 4 * 2)
+
+@unittest.skipIf(vectorized.np is None, "NumPy is not installed")
+class Evaluate(unittest.TestCase):
+    """Test the scores of batches of positions."""
+
+    def test_random_positions(self):
+        """The batch gives the scores of the per-position loop."""
+
+        positions = random_positions(500)
+        a = vectorized.pack_boards([board for board, color in positions])
+        colors = vectorized.np.array([color for board, color in positions])
+        self.assertEqual(list(vectorized.evaluate(a, colors)),
+                         [vectorized.evaluate_board(board, color)
+                          for board, color in positions])
+
+    def test_pack_fens(self):
+        """The FEN strings give the arrays of the boards."""
+
+        positions = random_positions(100, 1)
+        fens = [board.get_fen(color) for board, color in positions]
+        a, colors = vectorized.pack_fens(fens)
+        self.assertTrue((a == vectorized.pack_boards(
+            [board for board, color in positions])).all())
+        self.assertEqual(list(colors),
+                         [color for board, color in positions])
+
+    def test_invalid_fen(self):
+        """A FEN string whose rows don't fill the board is refused."""
+
+        for fen in ["rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN w KQkq -",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNRR w KQkq -",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq -"]:
+            self.assertRaises(ValueError, vectorized.pack_fens,
+                              [rules.INITIAL_FEN, fen])
+
+    def test_blocks(self):
+        """The positions scored by blocks get the scores of one batch."""
+
+        positions = random_positions(100, 2)
+        a = vectorized.pack_boards([board for board, color in positions])
+        colors = vectorized.np.array([color for board, color in positions])
+        n = 2 * vectorized.BLOCK_SIZE // len(positions) + 1
+        a = vectorized.np.tile(a, (n, 1))
+        colors = vectorized.np.tile(colors, n)
+        self.assertTrue((vectorized.evaluate(a, colors) ==
+                         vectorized.evaluate_block(a, colors)).all())
+
+    def test_empty(self):
+        """An empty batch gives no scores."""
+
+        a, colors = vectorized.pack_fens([])
+        self.assertEqual(len(vectorized.evaluate(a, colors)), 0)
+
+    def test_sides(self):
+        """The score of a position is the opposite for the other side."""
+
+        a, colors = vectorized.pack_fens([rules.INITIAL_FEN,
+                                          "4k3/8/8/1p6/8/P7/P1P5/4K3 w - -",
+                                          "4k3/8/8/1p6/8/P7/P1P5/4K3 b - -"])
+        scores = vectorized.evaluate(a, colors)
+        self.assertEqual(scores[0], 0)
+        self.assertEqual(scores[1], -scores[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+"""Archive module
+
+This module stores recorded games in a compact binary file, and reads any
+of them back without reading the others.
+
+The file begins with a header: the magic string, the version, the number of
+games and the offset of the index. Then come the games, each one being a
+record of its result, its initial position (empty for the initial position
+of chess) and its moves on two bytes each. The index at the end gives the
+offset of each record, so the reader, which maps the file in memory with
+mmap, finds game n at once.
+
+A move is packed in 16 bits, from the low bits: the source square (6 bits),
+the destination square (6 bits), the type of the piece of a promotion
+(3 bits, 0 being no promotion) and a castling flag.
+"""
+
+import mmap
+import struct
+
+import rules as ru
+import game as gm
+import pgn
+
+"""Constants"""
+MAGIC = 'CHESSARC'
+VERSION = 1
+HEADER = struct.Struct('<8sHIQ')    # Magic, version, games, index offset
+RECORD = struct.Struct('<BBH')      # Result, length of the FEN, plies
+OFFSET = struct.Struct('<Q')
+BOARD_SIZE = ru.BOARD_SIZE
+
+"""Functions"""
+def encode_move(m, promotion=None):
+    """Return the Move m, promotion being the type of the new piece or None,
+    as a 16-bit number."""
+
+    (s_x, s_y), (d_x, d_y), type_ = m
+    n = (s_y - 1) * BOARD_SIZE + s_x - 1
+    n |= ((d_y - 1) * BOARD_SIZE + d_x - 1) << 6
+    n |= (promotion or 0) << 12
+    if(type_ == ru.CASTLING):
+        n |= 1 << 15
+    return n
+
+def decode_move(board, n):
+    """Return the (Move, promotion) given by encode_move(), the type of the
+    Move being found on the board where it is played."""
+
+    src = ((n & 63) % BOARD_SIZE + 1, (n & 63) // BOARD_SIZE + 1)
+    dest = (((n >> 6) & 63) % BOARD_SIZE + 1,
+            ((n >> 6) & 63) // BOARD_SIZE + 1)
+    promotion = (n >> 12) & 7 or None
+
+    if(n >> 15):
+        type_ = ru.CASTLING
+    elif(promotion is not None):
+        if(dest in board):
+            type_ = ru.CAPTURE_PROMOTION
+        else:
+            type_ = ru.PROMOTION
+    elif(dest in board):
+        type_ = ru.CAPTURE
+    elif(board[src].get_type() == ru.PAWN and src[0] != dest[0]):
+        type_ = ru.EN_PASSANT
+    else:
+        type_ = ru.NORMAL_MOVE
+    return ru.Move(src, dest, type_), promotion
+
+def from_pgn(pgn_path, path):
+    """Write the archive path with the games of the PGN file pgn_path.
+
+    Return the number of games written, the games which can't be played
+    being skipped.
+    """
+
+    writer = ArchiveWriter(path)
+    with open(pgn_path) as f:
+        for pgn_game in pgn.read_games(f):
+            writer.add_pgn(pgn_game)
+    writer.close()
+    return writer.games
+
+
+"""Classes"""
+class ArchiveWriter():
+    """The class ArchiveWriter writes an archive, one game at a time.
+
+    Only the offsets of the games are kept in memory until close() writes
+    the index.
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        self.offsets = []
+        self.games = 0
+
+    def add_record(self, fen, moves, result):
+        """Add a game starting from the position of the FEN string fen (None
+        for the initial position), with its list of encoded moves and its
+        result ('1-0', '0-1', '1/2-1/2' or '*')."""
+
+        if(fen is None or fen == ru.INITIAL_FEN):
+            fen = ''
+        self.offsets.append(self.f.tell())
+        self.f.write(RECORD.pack(pgn.RESULTS.index(result), len(fen),
+                                 len(moves)))
+        self.f.write(fen)
+        self.f.write(struct.pack('<%dH' % len(moves), *moves))
+        self.games += 1
+
+    def add_game(self, g, result='*'):
+        """Add the Game g."""
+
+        moves = [encode_move(m, g.promotions.get(i))
+                 for i, m in enumerate(g.history)]
+        self.add_record(g.initial_fen, moves, result)
+
+    def add_pgn(self, pgn_game):
+        """Add the PgnGame pgn_game, playing its moves on a board.
+
+        Return False, adding nothing, if a move is not legal.
+        """
+
+        board = ru.Board([])
+        fen = pgn_game.headers.get('FEN', ru.INITIAL_FEN)
+        color = board.set_fen(fen)
+        moves = []
+        for san in pgn_game.moves:
+            parsed = pgn.parse_san(board, color, san)
+            if(parsed is None):
+                return False
+            m, promotion = parsed
+            moves.append(encode_move(m, promotion))
+            board.make(m, promotion)
+            color = ru.enemy_color(color)
+        self.add_record(fen, moves, pgn_game.result)
+        return True
+
+    def close(self):
+        """Write the index and the header, and close the file."""
+
+        index = self.f.tell()
+        for offset in self.offsets:
+            self.f.write(OFFSET.pack(offset))
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, self.games, index))
+        self.f.close()
+        self.offsets = []
+
+
+class Archive():
+    """The class Archive reads the games of an archive file.
+
+    The file is mapped in memory: reading a game only touches its record and
+    its entry of the index.
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.games, self.index = HEADER.unpack_from(self.map)
+        assert(magic == MAGIC and version == VERSION)
+
+    def __len__(self):
+        return self.games
+
+    def close(self):
+        """Unmap and close the file."""
+
+        self.map.close()
+        self.f.close()
+
+    def record(self, n):
+        """Return the (FEN, moves, result) of the game n, the moves being
+        encoded and the FEN being None for the initial position."""
+
+        if(n < 0 or n >= self.games):
+            raise IndexError("game %d not in the archive" % n)
+        offset, = OFFSET.unpack_from(self.map, self.index + OFFSET.size * n)
+        result, fen_length, plies = RECORD.unpack_from(self.map, offset)
+        offset += RECORD.size
+        fen = self.map[offset:offset + fen_length] or None
+        moves = struct.unpack_from('<%dH' % plies, self.map,
+                                   offset + fen_length)
+        return fen, moves, pgn.RESULTS[result]
+
+    def game(self, n, bitboard=False):
+        """Return the Game n, its moves being played with Game.move() and
+        Game.promote()."""
+
+        fen, moves, result = self.record(n)
+        g = gm.Game(bitboard, fen)
+        for code in moves:
+            m, promotion = decode_move(g.board, code)
+            color = g.board[m.src].color
+            m_type = g.move(color, m.src, m.dest, type_=m.type_)
+            assert(m_type != gm.INVALID_MOVE)
+            if(promotion is not None):
+                g.promote(m.dest, promotion)
+        return g
@@ -0,0 +1,81 @@
+"""Unittest of the module archive.py."""
+
+from StringIO import StringIO
+import os
+import tempfile
+import unittest
+import archive
+import game
+import pgn
+import pgn_test
+import rules
+
+class Archive(unittest.TestCase):
+    """Test writing and reading archives."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.arc')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_from_pgn(self):
+        """The games are read back as they were written, and the moves take
+        two bytes."""
+
+        pgn_path = self.path + '.pgn'
+        with open(pgn_path, 'w') as f:
+            f.write(pgn_test.OPERA_GAME * 3 + "1. e4 e5 2. Ke3 *\n\n" +
+                    "1. d4 d5 *\n")
+        try:
+            self.assertEqual(archive.from_pgn(pgn_path, self.path), 4)
+        finally:
+            os.remove(pgn_path)
+
+        a = archive.Archive(self.path)
+        self.assertEqual(len(a), 4)
+        fen, moves, result = a.record(3)
+        self.assertEqual((fen, len(moves), result), (None, 2, '*'))
+        fen, moves, result = a.record(1)
+        self.assertEqual((fen, len(moves), result), (None, 33, '1-0'))
+
+        [(pgn_game, g)] = list(pgn.load_games(StringIO(pgn_test.OPERA_GAME)))
+        self.assertEqual(a.game(2).to_fen(), g.to_fen())
+        self.assertEqual(a.game(2).history, g.history)   # 12...Rd8 included
+        self.assertRaises(IndexError, a.record, 4)
+        a.close()
+
+        header = archive.HEADER.size + archive.RECORD.size
+        self.assertEqual(os.path.getsize(self.path),
+                         header + 3 * (33 * 2 + archive.RECORD.size) + 2 * 2 +
+                         4 * archive.OFFSET.size)
+
+    def test_promotion_and_fen(self):
+        """The initial position and the choice of the promotions are kept."""
+
+        fen = "4k3/1P6/8/8/8/8/p7/1N2K2R w K - 0 1"
+        g = game.Game(fen=fen)
+        g.move(rules.WHITE_COLOR, (5, 1), (7, 1))
+        self.assertEqual(g.move(rules.BLACK_COLOR, (1, 2), (2, 1)),
+                         game.PROMOTE)
+        g.promote((2, 1), rules.KNIGHT)
+        g.move(rules.WHITE_COLOR, (2, 7), (2, 8))
+        g.promote((2, 8), rules.ROOK)
+        writer = archive.ArchiveWriter(self.path)
+        writer.add_game(game.Game())
+        writer.add_game(g, '1-0')
+        writer.close()
+
+        a = archive.Archive(self.path)
+        self.assertEqual(a.game(0).to_fen(), rules.INITIAL_FEN)
+        g_2 = a.game(1)
+        self.assertEqual(g_2.initial_fen, fen)
+        self.assertEqual(g_2.history, g.history)
+        self.assertEqual(g_2.promotions, {1: rules.KNIGHT, 2: rules.ROOK})
+        self.assertEqual(g_2.to_fen(), g.to_fen())
+        a.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Batch module
+
+This module replays many recorded games through Game.move() to check that
+all their moves are legal, the games being shared out between the processes
+of a multiprocessing pool.
+
+The reports come back one per game, in the order of the games, as soon as
+they are ready, so a file of any size can be checked with a constant memory.
+
+Usage: python batch.py games.pgn [processes]
+"""
+
+import multiprocessing
+import sys
+import time
+from collections import namedtuple
+
+import rules as ru
+import game as gm
+import pgn
+
+"""Constants"""
+CHUNK_SIZE = 16     # Games sent to a process at once
+
+# The outcome of a game
+UNFINISHED = 'unfinished'
+CHECK_MATE = 'check mate'
+STALEMATE = 'stalemate'
+
+# The report of a game: its number, the list of what Game.move() returned for
+# each move played, the (ply, move) of the first illegal move or None, and
+# the outcome of the position reached.
+Report = namedtuple('Report', 'index, results, illegal, outcome')
+
+"""Functions"""
+def validate_game((index, moves)):
+    """Return the Report of the game number index.
+
+    The game is a PgnGame or a list of moves, each move being a string in
+    SAN or a (src, dest) or (src, dest, promotion) tuple. The game stops at
+    the first illegal move.
+    """
+
+    g = gm.Game()
+    if(isinstance(moves, pgn.PgnGame)):
+        g.from_fen(moves.headers.get('FEN', ru.INITIAL_FEN))
+        moves = moves.moves
+    color = g.get_playing_color()
+    results = []
+    for ply, move in enumerate(moves):
+        type_ = None
+        if(isinstance(move, basestring)):
+            parsed = pgn.parse_san(g.board, color, move)
+            if(parsed is None):
+                return Report(index, results, (ply, move), UNFINISHED)
+            (src, dest, type_), promotion = parsed
+        else:
+            src, dest = move[:2]
+            promotion = None
+            if(len(move) > 2):
+                promotion = move[2]
+
+        result = g.move(color, src, dest, type_=type_)
+        results.append(result)
+        if(result == gm.INVALID_MOVE):
+            return Report(index, results, (ply, move), UNFINISHED)
+        if(result == gm.PROMOTE):
+            if(promotion is None):
+                return Report(index, results, (ply, move), UNFINISHED)
+            g.promote(dest, promotion)
+        color = ru.enemy_color(color)
+
+    outcome = UNFINISHED
+    if(g.board.is_pat(color)):
+        if(g.board.is_check(color)):
+            outcome = CHECK_MATE
+        else:
+            outcome = STALEMATE
+    return Report(index, results, None, outcome)
+
+def validate(games, processes=None):
+    """Generate the Reports of the iterable of games, in their order.
+
+    The games are replayed by a pool of processes, one per CPU if processes
+    is None.
+    """
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for report in pool.imap(validate_game, enumerate(games), CHUNK_SIZE):
+            yield report
+    finally:
+        pool.terminate()
+
+def run(path, processes=None, out=sys.stdout):
+    """Check the games of the PGN file path, printing a line for each game
+    with an illegal move and a summary. Return the number of such games."""
+
+    start = time.time()
+    games = moves = bad = 0
+    with open(path) as f:
+        for report in validate(pgn.read_games(f), processes):
+            games += 1
+            moves += len(report.results)
+            if(report.illegal is not None):
+                bad += 1
+                ply, move = report.illegal
+                out.write("game %d: illegal move %s at ply %d\n" %
+                          (report.index + 1, move, ply + 1))
+    t = time.time() - start
+    out.write("%d games, %d moves, %d with an illegal move, in %.1fs "
+              "(%.0f games/s)\n" % (games, moves, bad, t,
+                                    games / max(t, 1e-9)))
+    return bad
+
+
+if __name__ == '__main__':
+    processes = None
+    if(len(sys.argv) > 2):
+        processes = int(sys.argv[2])
+    if(run(sys.argv[1], processes)):
+        sys.exit(1)
@@ -0,0 +1,46 @@
+"""Unittest of the module batch.py."""
+
+from StringIO import StringIO
+import unittest
+import batch
+import game
+import pgn
+import pgn_test
+import rules
+
+class Validate(unittest.TestCase):
+    """Test checking games with a pool of processes."""
+
+    def test_reports(self):
+        """Each game has its report, in the order of the games."""
+
+        scholar = [((5, 2), (5, 4)), ((5, 7), (5, 5)), ((6, 1), (3, 4)),
+                   ((2, 8), (3, 6)), ((4, 1), (8, 5)), ((7, 8), (6, 6)),
+                   ((8, 5), (6, 7))]
+        games = [scholar, ['e4', 'e5', 'Ke3', 'Nc6'],
+                 scholar[:2] + [((6, 1), (6, 3))],
+                 ['f3', 'e5', 'g4', 'Qh4'],
+                 [((7, 2), (7, 4)), ((8, 7), (8, 5)), ((7, 4), (8, 5)),
+                  ((7, 7), (7, 6)), ((8, 5), (7, 6)), ((7, 8), (6, 6)),
+                  ((7, 6), (7, 7)), ((6, 6), (8, 5)),
+                  ((7, 7), (8, 8), rules.KNIGHT)]]
+        games += list(pgn.read_games(StringIO(pgn_test.OPERA_GAME * 20)))
+        reports = list(batch.validate(games, 2))
+
+        self.assertEqual([r.index for r in reports], range(len(games)))
+        self.assertEqual(reports[0].outcome, batch.CHECK_MATE)
+        self.assertEqual(reports[0].results[-1], game.CHECK_MATE)
+        self.assertEqual(reports[1].illegal, (2, 'Ke3'))
+        self.assertEqual(reports[1].results, [game.VALID_MOVE] * 2)
+        self.assertEqual(reports[2].illegal, (2, ((6, 1), (6, 3))))
+        self.assertEqual(reports[2].results[-1], game.INVALID_MOVE)
+        self.assertEqual(reports[3].outcome, batch.CHECK_MATE)
+        self.assertEqual(reports[4].results[-1], game.PROMOTE)
+        self.assertEqual(reports[4].outcome, batch.UNFINISHED)
+        for r in reports[5:]:
+            self.assertEqual((len(r.results), r.illegal, r.outcome),
+                             (33, None, batch.CHECK_MATE))
+
+
+if __name__ == '__main__':
+    unittest.main()
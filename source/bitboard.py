@@ -0,0 +1,203 @@
+"""Bitboard module
+
+This module contains the class BitBoard, a board which also stores the
+position as bitboards to answer the attack questions quickly.
+
+A bitboard is a 64-bit integer with one bit per square, the square (x, y)
+being the bit number (y - 1)*8 + (x - 1).
+"""
+
+import rules as ru
+
+"""Constants"""
+BOARD_SIZE = ru.BOARD_SIZE
+
+# The bit number and the bit of each square, and the square of each bit number.
+INDEX = {}
+BIT = {}
+SQUARE = []
+for y in xrange(1, BOARD_SIZE + 1):
+    for x in xrange(1, BOARD_SIZE + 1):
+        INDEX[x, y] = len(SQUARE)
+        BIT[x, y] = 1 << len(SQUARE)
+        SQUARE.append((x, y))
+
+"""Functions"""
+def to_bitboard(squares):
+    """Return the bitboard of the list of coordinates 'squares'."""
+
+    b = 0
+    for pos in squares:
+        b |= BIT[pos]
+    return b
+
+def squares(b):
+    """Return the list of the coordinates of the bits set in 'b'."""
+
+    l = []
+    while(b):
+        low = b & -b
+        l.append(SQUARE[low.bit_length() - 1])
+        b ^= low
+    return l
+
+def ray_attacks(rays, occupied, index):
+    """Return the bitboard of the squares attacked along the 'rays' from the
+    square number 'index', the pieces of 'occupied' stopping the rays.
+
+    rays is a list of (positive, table) where table gives the ray of each
+    square and positive says if the ray goes toward the high bits.
+    """
+
+    a = 0
+    for positive, table in rays:
+        ray = table[index]
+        blockers = ray & occupied
+        if(blockers):
+            if(positive):
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first]
+        a |= ray
+    return a
+
+def ray_tables(directions):
+    """Return the list of (positive, table) of the rays going in the
+    'directions', as used by ray_attacks()."""
+
+    l = []
+    for (i, j) in directions:
+        table = []
+        for (x, y) in SQUARE:
+            ray = []
+            s_x, s_y = x + i, y + j
+            while(ru.on_board((s_x, s_y))):
+                ray.append((s_x, s_y))
+                s_x, s_y = s_x + i, s_y + j
+            table.append(to_bitboard(ray))
+        l.append((j > 0 or (j == 0 and i > 0), table))
+    return l
+
+
+"""Precomputed tables"""
+KNIGHT_ATTACKS = [to_bitboard(ru.KNIGHT_TARGETS[pos]) for pos in SQUARE]
+KING_ATTACKS = [to_bitboard(ru.KING_TARGETS[pos]) for pos in SQUARE]
+# The squares attacked by a 'color' pawn standing on each square.
+PAWN_ATTACKS = {}
+for color, d in [(ru.WHITE_COLOR, ru.WHITE_PAWN_DIRECTION),
+                 (ru.BLACK_COLOR, ru.BLACK_PAWN_DIRECTION)]:
+    PAWN_ATTACKS[color] = [to_bitboard([(x + i, y + d) for i in [-1, 1]
+                                        if ru.on_board((x + i, y + d))])
+                           for (x, y) in SQUARE]
+
+DIAGONAL_RAYS = ray_tables(ru.FOUR_DIAGONALS)
+CARDINAL_RAYS = ray_tables(ru.CARDINAL_DIRECTION)
+
+
+"""Classes"""
+class BitBoard(ru.Board):
+    """The class BitBoard is a Board which keeps a bitboard of each type of
+    piece of each color, and of the squares occupied by each color.
+
+    The pieces are still stored in the dict, so the BitBoard can be used
+    everywhere a Board is. Only the attack detection changes: who_controls(),
+    is_attacked() and is_check() use the bitboards instead of walking on the
+    squares, so the BitBoard never builds the attack maps of the Board, and
+    its changes skip them.
+
+    The dict, the positions and the kings stay, since the move generation,
+    the pins and make() read them, but they are updated with the bitboards
+    in one go instead of through the Board.
+    """
+
+    def set_pieces(self, pieces):
+        ru.Board.set_pieces(self, pieces)
+        self.__build_bitboards()
+
+    def set_fen(self, fen):
+        color = ru.Board.set_fen(self, fen)
+        self.__build_bitboards()
+        return color
+
+    def __build_bitboards(self):
+        # Build the bitboards of the pieces of the dict.
+        self.pieces = [[0] * 6, [0] * 6]    # pieces[color][type_]
+        self.occupied = [0, 0]              # occupied[color]
+        for pos, p in self.dict_.iteritems():
+            self.__put(pos, p)
+
+    def __put(self, pos, p):
+        # Set the bits of the piece p standing at pos.
+        bit = BIT[pos]
+        self.pieces[p.color][p.type_] |= bit
+        self.occupied[p.color] |= bit
+
+    """The bitboards follow every change of the dict"""
+    def __setitem__(self, key, value):
+        # The dict, the positions, the kings, the key and the bitboards are
+        # updated here without the checks of the Board on the attack maps.
+        bit = BIT[key]
+        p = self.dict_.get(key)
+        if(p is not None):
+            self.positions[p.color].discard(key)
+            if(self.kings[p.color] == key):
+                self.kings[p.color] = None
+            self.zobrist ^= ru.ZOBRIST_PIECES[p.color][p.type_][key]
+            self.pieces[p.color][p.type_] ^= bit
+            self.occupied[p.color] ^= bit
+        self.dict_[key] = value
+        color, type_ = value.color, value.type_
+        self.positions[color].add(key)
+        if(type_ == ru.KING):
+            self.kings[color] = key
+        self.zobrist ^= ru.ZOBRIST_PIECES[color][type_][key]
+        self.pieces[color][type_] |= bit
+        self.occupied[color] |= bit
+    def __delitem__(self, key):
+        p = self.dict_.pop(key)
+        self.positions[p.color].discard(key)
+        if(self.kings[p.color] == key):
+            self.kings[p.color] = None
+        self.zobrist ^= ru.ZOBRIST_PIECES[p.color][p.type_][key]
+        bit = BIT[key]
+        self.pieces[p.color][p.type_] ^= bit
+        self.occupied[p.color] ^= bit
+
+    def attackers(self, (x, y), color):
+        """Return the bitboard of the 'color' pieces which control the
+        coordinates (x, y)."""
+
+        index = INDEX[x, y]
+        p = self.pieces[color]
+        occupied = self.occupied[0] | self.occupied[1]
+
+        a = PAWN_ATTACKS[ru.enemy_color(color)][index] & p[ru.PAWN]
+        a |= KNIGHT_ATTACKS[index] & p[ru.KNIGHT]
+        a |= KING_ATTACKS[index] & p[ru.KING]
+        diagonal_sliders = p[ru.BISHOP] | p[ru.QUEEN]
+        if(diagonal_sliders):
+            a |= (ray_attacks(DIAGONAL_RAYS, occupied, index) &
+                  diagonal_sliders)
+        cardinal_sliders = p[ru.ROOK] | p[ru.QUEEN]
+        if(cardinal_sliders):
+            a |= (ray_attacks(CARDINAL_RAYS, occupied, index) &
+                  cardinal_sliders)
+        return a
+
+    def who_controls(self, (x, y), color):
+        """Return the list of 'color' pieces position which control the
+        coordinates (x, y)."""
+
+        return squares(self.attackers((x, y), color))
+
+    def is_attacked(self, (x, y), color):
+        """Return True if a 'color' piece controls the coordinates (x, y)."""
+
+        return self.attackers((x, y), color) != 0
+
+    def is_check(self, color):
+        """Return True if the 'color' king is in check."""
+
+        return self.is_attacked(self.where_is_king(color),
+                                ru.enemy_color(color))
@@ -0,0 +1,91 @@
+"""Unittest of the module bitboard.py.
+
+The BitBoard must answer exactly like the Board."""
+
+import copy
+import unittest
+import bitboard
+import game
+import game_test
+import rules
+
+"""Constants"""
+W = rules.WHITE_COLOR
+B = rules.BLACK_COLOR
+
+class PlayRecordedGamesOnBitBoard(game_test.PlayRecordedGames):
+    """Test playing severals games with a BitBoard."""
+
+    def setUp(self):
+        self.g = game.Game(bitboard=True)
+
+class SameAttacks(unittest.TestCase):
+    """Compare the attacks seen by a BitBoard and by a Board."""
+
+    def test_italian_game(self):
+        """1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. c3 Nf6 5. d4 exd4 6. cxd4 Bb4+"""
+
+        moves = [((5, 2), (5, 4)), ((5, 7), (5, 5)), ((7, 1), (6, 3)),
+                 ((2, 8), (3, 6)), ((6, 1), (3, 4)), ((6, 8), (3, 5)),
+                 ((3, 2), (3, 3)), ((7, 8), (6, 6)), ((4, 2), (4, 4)),
+                 ((5, 5), (4, 4)), ((3, 3), (4, 4)), ((3, 5), (2, 4))]
+        g, g_bb = game.Game(), game.Game(bitboard=True)
+        c = W
+        for src, dest in moves:
+            self.assertEqual(g.move(c, src, dest), g_bb.move(c, src, dest))
+            for x in xrange(1, rules.BOARD_SIZE + 1):
+                for y in xrange(1, rules.BOARD_SIZE + 1):
+                    for color in [W, B]:
+                        self.assertEqual(
+                            sorted(g.board.who_controls((x, y), color)),
+                            sorted(g_bb.board.who_controls((x, y), color)))
+            self.assertEqual(sorted(g.board.legal_moves(W)),
+                             sorted(g_bb.board.legal_moves(W)))
+            c = rules.enemy_color(c)
+        self.assertTrue(g_bb.board.is_check(W))
+
+    def test_set_fen(self):
+        """The bitboards of a position loaded from a FEN string."""
+
+        g, g_bb = game.Game(), game.Game(bitboard=True)
+        g_bb.move(W, (5, 2), (5, 4))
+        fen = "r3k2r/8/8/3Pp3/8/8/8/R3K2R w KQkq e6 0 1"
+        g.from_fen(fen)
+        g_bb.from_fen(fen)
+        for x in xrange(1, rules.BOARD_SIZE + 1):
+            for y in xrange(1, rules.BOARD_SIZE + 1):
+                for color in [W, B]:
+                    self.assertEqual(
+                        sorted(g.board.who_controls((x, y), color)),
+                        sorted(g_bb.board.who_controls((x, y), color)))
+        self.assertEqual(sorted(g.board.legal_moves(W)),
+                         sorted(g_bb.board.legal_moves(W)))
+
+    def test_make_unmake(self):
+        """The bitboards, the positions and the key follow the moves as if
+        they were built again."""
+
+        b = bitboard.BitBoard([])
+        color = b.set_fen("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/"
+                          "R2Q1RK1 w kq - 0 1")
+        start = copy.deepcopy((b.pieces, b.occupied, b.positions, b.kings,
+                               b.zobrist))
+        for m in list(b.legal_moves(color)):
+            promotion = None
+            if(m.type_ in [rules.PROMOTION, rules.CAPTURE_PROMOTION]):
+                promotion = rules.KNIGHT
+            token = b.make(m, promotion)
+            fresh = bitboard.BitBoard([])
+            fresh.set_pieces(b.dict_)
+            self.assertEqual((b.pieces, b.occupied, b.positions, b.kings),
+                             (fresh.pieces, fresh.occupied, fresh.positions,
+                              fresh.kings))
+            self.assertEqual(b.zobrist,
+                             b.zobrist_key(rules.enemy_color(color)))
+            b.unmake(token)
+            self.assertEqual((b.pieces, b.occupied, b.positions, b.kings,
+                              b.zobrist), start)
+
+
+if __name__ == '__main__':
+    unittest.main()
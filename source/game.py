@@ -5,6 +5,7 @@ He use the module rules to work and to know if everything is valid or not.
 """
 
 import rules as ru
+import bitboard as bb
 
 """Constants"""
 BOARD_SIZE = 8
@@ -29,8 +30,13 @@ VALID_MOVE,
 PROMOTE,
 CHECK,
 CHECK_MATE,
-PAT
-) = range(6)
+PAT,
+DRAW
+) = range(7)
+
+FIFTY_MOVES = 100   # Plies without a capture or a pawn move for a draw
+REPETITIONS = 3     # Times a position is reached for a draw
+CHECKPOINT_EVERY = 16   # Plies between two boards kept for seek()
 
 class Player():
     """The class player is used to know data about the player.
@@ -73,15 +79,87 @@ class Player():
 class Game():
     """The class Game contains all the mecanism to play chess."""
 
-    def __init__(self):
-        """Create the board, the player and initialize the history."""
+    def __init__(self, bitboard=False, fen=None,
+                 checkpoint_every=CHECKPOINT_EVERY):
+        """Create the board, the player and initialize the history.
+
+        If bitboard is True, the board is a BitBoard which detects the attacks
+        with bitboards. If fen is given, the game starts from the position of
+        the FEN string instead of the initial position. The board is kept
+        every checkpoint_every plies, for seek().
+        """
 
         self.history = []
         self.undo_history = []
         self.undo_promotion_history = []
-        self.board = ru.Board(self.history);
+        self.tokens = []    # What Board.unmake() needs to undo each move
+        self.undo_states = []   # (token, halfmove clock, key, reversible
+                                # plies) of each undone move
+        if(bitboard):
+            self.board = bb.BitBoard(self.history)
+        else:
+            self.board = ru.Board(self.history);
         self.white_player = Player(WHITE_COLOR)
         self.black_player = Player(BLACK_COLOR)
+        self.halfmove_clocks = [0]  # After each move: moves since a capture
+                                    # or a pawn move, in plies
+        self.first_ply = 0  # The number of plies played before the history
+        self.initial_fen = ru.INITIAL_FEN   # The position before the history
+        self.promotions = {}    # Ply: type of the piece the pawn became
+        self.keys = [self.board.zobrist]    # The Zobrist key after each move
+        self.reversible_plies = [0]     # After each move: plies since a
+                                        # capture, a pawn move or a change of
+                                        # the castling rights
+        self.legal_cache = None     # (src, dest): Move of the player to
+                                    # move, None until asked
+        self.checkpoint_every = checkpoint_every
+        self.checkpoints = [self.board.snapshot()]  # [i]: Board.snapshot()
+                                                    # after i *
+                                                    # checkpoint_every plies
+        if(fen is not None):
+            self.from_fen(fen)
+
+    def from_fen(self, fen):
+        """Set up the game at the position of the FEN string 'fen'.
+
+        The history, the undo history and the captured pieces are cleared.
+        The castling rights, the 'en passant' square and the move clocks are
+        taken from the string.
+        """
+
+        color = self.board.set_fen(fen)
+        del self.history[:]     # The board shares the list
+        self.undo_history = []
+        self.undo_promotion_history = []
+        self.tokens = []
+        self.undo_states = []
+        self.initial_fen = fen
+        self.promotions = {}
+        self.white_player = Player(WHITE_COLOR)
+        self.black_player = Player(BLACK_COLOR)
+        if(color == BLACK_COLOR):
+            self.white_player.played()
+            self.black_player.must_play()
+
+        fields = fen.split()
+        halfmove_clock, fullmove_number = 0, 1
+        if(len(fields) > 4):
+            halfmove_clock = int(fields[4])
+        if(len(fields) > 5):
+            fullmove_number = int(fields[5])
+        self.halfmove_clocks = [halfmove_clock]
+        self.keys = [self.board.zobrist]
+        self.reversible_plies = [0]
+        self.legal_cache = None
+        self.checkpoints = [self.board.snapshot()]
+        self.first_ply = 2 * (fullmove_number - 1) + color
+
+    def to_fen(self):
+        """Return the FEN string of the position of the game."""
+
+        fullmove_number = (self.first_ply + len(self.history)) // 2 + 1
+        return self.board.get_fen(self.get_playing_color(),
+                                  self.halfmove_clocks[-1], fullmove_number)
 
     def __get_player(self, color):
         """Return the 'color' player attribute."""
@@ -92,11 +170,94 @@ class Game():
             return self.black_player
         sys.exit("Unknown color while looking for the player attribute")
         
+    def get_playing_color(self):
+        """Return the color of the player who must play."""
+
+        if(self.white_player.is_playing()):
+            return WHITE_COLOR
+        return BLACK_COLOR
+
     def get_board(self):
         """Return the board."""
         
         return self.board.dict_
 
+    def position_key(self):
+        """Return the 64-bit Zobrist key of the position.
+
+        Two positions with the same pieces, player to move, castling rights
+        and 'en passant' column have the same key.
+        """
+
+        return self.board.zobrist
+
+    def repetitions(self):
+        """Return how many times the position was reached, counting this
+        one.
+
+        A capture, a pawn move or a change of the castling rights can't be
+        taken back, so the positions before it are not looked at: the cost
+        doesn't grow with the length of the game.
+        """
+
+        n = 1
+        for i in xrange(2, self.reversible_plies[-1] + 1, 2):
+            if(self.keys[-1 - i] == self.keys[-1]):
+                n += 1
+        return n
+
+    def is_draw(self):
+        """Return True if the position was reached three times or if fifty
+        moves were played without a capture or a pawn move."""
+
+        return (self.halfmove_clocks[-1] >= FIFTY_MOVES or
+                self.repetitions() >= REPETITIONS)
+
+    def __legal_moves(self):
+        """Return the dict giving the legal Move of the player to move for
+        each (src, dest).
+
+        The moves are generated the first time they are asked for in a
+        position, and kept until the position changes. A castling can also
+        be played with the rook, going next to the king.
+        """
+
+        if(self.legal_cache is None):
+            color = self.get_playing_color()
+            self.legal_cache = {}
+            if(self.__get_player(color).is_playing()):
+                castlings = []
+                for m in self.board.legal_moves(color):
+                    self.legal_cache[m.src, m.dest] = m
+                    if(m.type_ == CASTLING):
+                        castlings.append(m)
+                # The rook move, which replaces its normal move
+                for m in castlings:
+                    x, y = m.dest
+                    if(x == ru.KINGSIDE_KING_POS_X):
+                        rook = (BOARD_SIZE, y), (ru.KINGSIDE_ROOK_POS_X, y)
+                    else:
+                        rook = (1, y), (ru.QUEENSIDE_ROOK_POS_X, y)
+                    self.legal_cache[rook] = ru.Move(rook[0], rook[1],
+                                                     CASTLING)
+        return self.legal_cache
+
+    def legal_moves(self):
+        """Return the list of the legal Moves of the player to move.
+
+        A castling is given twice: as a move of the king and as a move of
+        the rook. A promotion is given once, the type of the new piece being
+        chosen with promote().
+        """
+
+        return self.__legal_moves().values()
+
+    def legal_destinations(self, (x, y)):
+        """Return the set of the squares where the piece at (x, y) can go,
+        empty if it is not a piece of the player to move."""
+
+        return set(dest for src, dest in self.__legal_moves() if src == (x, y))
+
     def undo(self):
         """Undo the last Move and store it in undo_history."""
 
@@ -107,42 +268,17 @@ class Game():
         self.undo_history.append(self.history.pop())
         c = self.board[dest].color
 
-        assert(dest in self.board and src not in self.board)
-        self.board[src] = self.board[dest]
-        del self.board[dest]
-
         if(t in [CAPTURE, CAPTURE_PROMOTION, EN_PASSANT]):
             assert(len(self.__get_player(c).captured_pieces) != 0)
-            if(t == EN_PASSANT):
-                x, y = dest
-                y -= ru.Pawn(c).get_direction()
-                dest = (x, y)
-            self.board[dest] = self.__get_player(c).captured_pieces.pop()
-
+            self.__get_player(c).captured_pieces.pop()
         if(t in [PROMOTION, CAPTURE_PROMOTION]):
-            self.undo_promotion_history.append(self.board[src])
-            self.board[src] = Pawn(c, self.board, self.history)
-
-        if(t == CASTLING): # There is a second piece to move, which moved from
-            x, y = dest    # the src to the dest which are calculated here.
-            if(x == ru.KINGSIDE_KING_POS_X):
-                dest = (x - 1, y)
-                src = (BOARD_SIZE, y)
-            elif(x == ru.QUEENSIDE_KING_POS_X):
-                dest = (x + 1, y)
-                src = (1, y)
-            elif(x == ru.KINGSIDE_ROOK_POS_X):
-                dest = (x + 1, y)
-                src = ru.King(c).get_initial_pos()
-            elif(x == ru.QUEENSIDE_ROOK_POS_X):
-                dest = (x - 1, y)
-                src = ru.King(c).get_initial_pos()
-            else:
-                sys.exit("Unknown x position while undo a castling")
-
-            assert(dest in self.board)
-            self.board[src] = self.board[dest]
-            del self.board[dest]
+            self.undo_promotion_history.append(self.board[dest])
+            self.promotions.pop(len(self.history), None)
+        token = self.tokens.pop()
+        self.board.unmake(token)
+        self.legal_cache = None
+        self.undo_states.append((token, self.halfmove_clocks.pop(),
+                                 self.keys.pop(), self.reversible_plies.pop()))
 
         self.__get_player(c).must_play()
         self.__get_player(ru.enemy_color(c)).played()
@@ -153,64 +289,198 @@ class Game():
         if(len(self.undo_history) == 0):
             return None
 
-        src, dest, t = self.undo_history[-1]
+        src, dest, t = self.undo_history.pop()
+        self.undo_states.pop()
 
-        m_type = self.move(self.board[src].color, src, dest, player_move=False)
-        self.history.append(self.undo_history.pop())
+        m_type = self.move(self.board[src].color, src, dest, player_move=False,
+                           type_=t)
         assert(m_type != INVALID_MOVE)
         if(t in [PROMOTION, CAPTURE_PROMOTION]):
-            self.board[dest] = self.undo_promotion_history.pop()
+            p = self.undo_promotion_history.pop()
+            self.board[dest] = p
+            self.legal_cache = None
+            self.keys[-1] = self.board.zobrist
+            if(p.get_type() != ru.PAWN):
+                self.promotions[len(self.history) - 1] = p.get_type()
+            self.__checkpoint()
+
+    def seek(self, ply):
+        """Go to the position after 'ply' plies of the history and the undo
+        history, as undo() and redo() would, and return True, or return None
+        if there is no such ply.
+
+        The board is set back from the last checkpoint before the ply, or
+        from the position of the game if it is nearer, and the moves after
+        it are played again without being checked: fewer than
+        checkpoint_every of them. What else the moves changed was kept by
+        undo(), and is moved between the history and the undo history by
+        slices of lists.
+        """
+
+        n = len(self.history)
+        if(ply < 0 or ply > n + len(self.undo_history)):
+            return None
+        start = ply - ply % self.checkpoint_every
+        if(ply < n):
+            self.__seek_back(ply, ply - start < n - ply)
+        elif(ply > n):
+            self.__seek_forward(ply, start > n)
+        if(ply != n):
+            self.legal_cache = None
+            color = (self.first_ply + ply) % 2
+            self.__get_player(color).must_play()
+            self.__get_player(ru.enemy_color(color)).played()
+            # As move() does after a mate or a stalemate, which it looks
+            # for unless the pawn is still to promote. Only the last position
+            # can be one.
+            if(not self.undo_history and self.history and
+               self.history[-1].type_ not in [PROMOTION, CAPTURE_PROMOTION]
+               and not self.__legal_moves()):
+                self.__get_player(color).played()
+        return True
+
+    def __seek_back(self, ply, restore):
+        """Undo the moves after ply. If restore is True, the board is set
+        back from the last checkpoint before the ply instead of taking them
+        back one by one."""
+
+        n = len(self.history)
+        self.undo_history.extend(reversed(self.history[ply:]))
+        self.undo_states.extend(reversed(zip(self.tokens[ply:],
+                                             self.halfmove_clocks[ply + 1:],
+                                             self.keys[ply + 1:],
+                                             self.reversible_plies[ply + 1:])))
+        for i in xrange(n - 1, ply - 1, -1):
+            t = self.history[i].type_
+            if(t in [CAPTURE, EN_PASSANT, PROMOTION, CAPTURE_PROMOTION]):
+                color = self.tokens[i][2].color
+                if(t != PROMOTION):
+                    self.__get_player(color).captured_pieces.pop()
+                if(t != CAPTURE and t != EN_PASSANT):
+                    self.undo_promotion_history.append(
+                        ru.piece(self.promotions.pop(i, ru.PAWN), color))
+            if(not restore):
+                self.board.unmake(self.tokens[i])
+        del self.history[ply:]
+        del self.tokens[ply:]
+        del self.halfmove_clocks[ply + 1:]
+        del self.keys[ply + 1:]
+        del self.reversible_plies[ply + 1:]
+        if(restore):
+            self.__restore(ply)
+
+    def __seek_forward(self, ply, restore):
+        """Redo the moves up to ply. If restore is True, the board is set
+        from the last checkpoint before the ply instead of playing them one
+        by one."""
+
+        n = len(self.history)
+        k = ply - n
+        self.history.extend(self.undo_history[:-k - 1:-1])
+        tokens, clocks, keys, reversible = zip(*self.undo_states[:-k - 1:-1])
+        del self.undo_history[-k:]
+        del self.undo_states[-k:]
+        self.tokens.extend(tokens)
+        self.halfmove_clocks.extend(clocks)
+        self.keys.extend(keys)
+        self.reversible_plies.extend(reversible)
+        for i in xrange(n, ply):
+            t = self.history[i].type_
+            if(t in [CAPTURE, EN_PASSANT, PROMOTION, CAPTURE_PROMOTION]):
+                token = self.tokens[i]
+                if(t != PROMOTION):
+                    self.__get_player(token[2].color).captured_pieces.append(
+                        token[3])
+                if(t != CAPTURE and t != EN_PASSANT):
+                    p = self.undo_promotion_history.pop()
+                    if(p.get_type() != ru.PAWN):
+                        self.promotions[i] = p.get_type()
+            if(not restore):
+                self.board.make(self.history[i], self.promotions.get(i))
+        if(restore):
+            self.__restore(ply)
+
+    def __restore(self, ply):
+        """Set the board from the last checkpoint before ply, and play the
+        moves of the history after it."""
+
+        start = ply - ply % self.checkpoint_every
+        self.board.restore(self.checkpoints[start // self.checkpoint_every])
+        for i in xrange(start, ply):
+            self.board.make(self.history[i], self.promotions.get(i))
+
+    def __checkpoint(self):
+        """Keep the board if the number of plies of the history is a multiple
+        of checkpoint_every."""
+
+        ply = len(self.history)
+        if(ply % self.checkpoint_every == 0):
+            i = ply // self.checkpoint_every
+            if(i < len(self.checkpoints)):
+                self.checkpoints[i] = self.board.snapshot()
+            else:
+                self.checkpoints.append(self.board.snapshot())
         
-    def move(self, color, (src_x, src_y), (dest_x, dest_y), player_move=True):
+    def move(self, color, (src_x, src_y), (dest_x, dest_y), player_move=True,
+             type_=None):
         """Move the 'color' piece from (src_x, src_y) to (dest_x, dest_y).
 
         The player_move parameter is use to know if the move is play by a
         player or if it's an automatic move of the redo method.
+
+        A rook going next to its king can be a castling played with the rook.
+        The type_ of the move, if given, tells if it is one. A king can only
+        go two squares by castling.
         
-        If the move or the parameters are invalid, it return INVALID_MOVE.
+        The move is looked up in the legal moves of the position, generated
+        once for all the moves asked for in it. If the move or the parameters
+        are invalid, it return INVALID_MOVE.
         If the move is valid, it can return:
         VALID_MOVE if the piece moved.
         PROMOTE if there is a pawn to promote.
         CHECK if now the ennemy of 'color' is in check.
         CHECK mate if 'color' won the game.
         PAT if the next player can't play.
+        DRAW if the position was reached three times or if fifty moves were
+        played without a capture or a pawn move, on the move which makes the
+        draw only and unless the move checks: is_draw() tells it for all the
+        positions. The draw is only claimed: the game can go on, as it does
+        in the recorded games.
         """
 
-        # Wrongs parameters
-        if(not self.__get_player(color).is_playing() or
-           color not in [WHITE_COLOR, BLACK_COLOR] or (src_x, src_y) ==
-           (dest_x, dest_y) or src_x not in range(1, BOARD_SIZE+1) or
-           src_y not in range(1, BOARD_SIZE+1) or
-           dest_x not in range(1, BOARD_SIZE+1) or
-           dest_y not in range(1, BOARD_SIZE+1) or
-           (src_x, src_y) not in self.board or
-           self.board[src_x, src_y].color != color):
+        if(color not in [WHITE_COLOR, BLACK_COLOR] or
+           not self.__get_player(color).is_playing()):
             return INVALID_MOVE
-
-            
-        m = self.board[src_x, src_y].can_move((src_x, src_y), (dest_x, dest_y))
-
+        m = self.__legal_moves().get(((src_x, src_y), (dest_x, dest_y)))
         if(m is None):
             return INVALID_MOVE
-        assert(type(m) == ru.Move)
-
-        self.history.append(m)
+        if(m.type_ == CASTLING and type_ is not None and type_ != CASTLING):
+            # Only the rook moves: the king can't go two squares alone.
+            if(self.board[m.src].get_type() != ru.ROOK):
+                return INVALID_MOVE
+            m = ru.Move(m.src, m.dest, NORMAL_MOVE)
 
+        drawn = self.is_draw()
         if(m.type_ in [CAPTURE, CAPTURE_PROMOTION]):
             self.__get_player(color).captured_pieces.append(self.board[dest_x,
                                                                        dest_y])
         if(m.type_ == EN_PASSANT):
-            y = dest_y - ru.Pawn(color).get_direction()
             self.__get_player(color).captured_pieces.append(self.board[dest_x,
-                                                                            y])
-            del self.board[dest_x,y]
-                                                                  
-        self.board[dest_x, dest_y] = self.board[src_x, src_y]
-        del self.board[src_x, src_y]
-
-        if(m.type_ == CASTLING):
-            self.board[dest_x, dest_y].castling((dest_x, dest_y))
-
+                                                                        src_y])
+        if(m.type_ in [CAPTURE, CAPTURE_PROMOTION, EN_PASSANT] or
+           self.board[src_x, src_y].get_type() == ru.PAWN):
+            self.halfmove_clocks.append(0)
+        else:
+            self.halfmove_clocks.append(self.halfmove_clocks[-1] + 1)
+        self.history.append(m)
+        castling = self.board.castling
+        self.tokens.append(self.board.make(m))
+        self.legal_cache = None
+        self.keys.append(self.board.zobrist)
+        if(self.halfmove_clocks[-1] == 0 or self.board.castling != castling):
+            self.reversible_plies.append(0)
+        else:
+            self.reversible_plies.append(self.reversible_plies[-1] + 1)
 
         self.__get_player(color).played()
         self.__get_player(ru.enemy_color(color)).must_play()
@@ -218,19 +488,27 @@ class Game():
         if(player_move):            # This is for not clear the history while
             self.undo_history = []  # using the redo method.
             self.undo_promotion_history = []
+            self.undo_states = []
+            del self.checkpoints[len(self.history) // self.checkpoint_every
+                                 + 1:]
+        self.__checkpoint()
         
         if(m.type_ in [PROMOTION, CAPTURE_PROMOTION]):
             return PROMOTE
 
-        if(self.board.is_check(ru.enemy_color(color))):
-            if(self.board.is_check_mate(ru.enemy_color(color))):
-                self.__get_player(ru.enemy_color(color)).played()
+        # The moves of the enemy tell the mate and the stalemate, and are
+        # kept to check the next move.
+        check = self.board.is_check(ru.enemy_color(color))
+        if(not self.__legal_moves()):
+            self.__get_player(ru.enemy_color(color)).played()
+            if(check):
                 return CHECK_MATE
-            return CHECK
+            return PAT
 
-        #if(self.board.is_pat(ru.enemy_color(color))):
-         #   return PAT
-            
+        if(check):
+            return CHECK
+        if(not drawn and self.is_draw()):
+            return DRAW
         return VALID_MOVE
 
     def promote(self, (x, y), type_):
@@ -240,3 +518,7 @@ class Game():
         """
 
         self.board.promote((x, y), type_)
+        self.legal_cache = None
+        self.keys[-1] = self.board.zobrist
+        self.promotions[len(self.history) - 1] = type_
+        self.__checkpoint()
@@ -3,8 +3,10 @@
 For now, the main goal is to play several games."""
 
 from collections import namedtuple
+import random
 import unittest
 import game
+import rules
 
 """Constants"""
 W = game.WHITE_COLOR
@@ -15,6 +17,7 @@ V = game.VALID_MOVE
 P = game.PROMOTE
 C = game.CHECK
 M = game.CHECK_MATE
+S = game.PAT
 
 Move = namedtuple('Move', 'src, dest, type_')
 
@@ -99,6 +102,26 @@ class PlayRecordedGames(unittest.TestCase):
 
         self.play_game(moves)
 
+    def test_game_3(self):
+        """Sam Loyd's stalemate.
+
+        1. e3 a5 2. Qh5 Ra6 3. Qxa5 h5 4. h4 Rah6 5. Qxc7 f6 6. Qxd7+ Kf7
+        7. Qxb7 Qd3 8. Qxb8 Qh7 9. Qxc8 Kg6 10. Qe6
+        """
+
+        moves = [Move((5, 2), (5, 3), V), Move((1, 7), (1, 5), V),
+                 Move((4, 1), (8, 5), V), Move((1, 8), (1, 6), V),
+                 Move((8, 5), (1, 5), V), Move((8, 7), (8, 5), V),
+                 Move((8, 2), (8, 4), V), Move((1, 6), (8, 6), V),
+                 Move((1, 5), (3, 7), V), Move((6, 7), (6, 6), V),
+                 Move((3, 7), (4, 7), C), Move((5, 8), (6, 7), V),
+                 Move((4, 7), (2, 7), V), Move((4, 8), (4, 3), V),
+                 Move((2, 7), (2, 8), V), Move((4, 3), (8, 7), V),
+                 Move((2, 8), (3, 8), V), Move((6, 7), (7, 6), V),
+                 Move((3, 8), (5, 6), S)]
+
+        self.play_game(moves)
+
     def test_en_passant(self):
         """'en passant' rule."""
 
@@ -112,6 +135,375 @@ class PlayRecordedGames(unittest.TestCase):
         self.assertNotIn((2, 5), self.g.board) # The piece has been taken
 
         
+class PositionKey(unittest.TestCase):
+    """Test the Zobrist key of the positions."""
+
+    def play(self, g, moves):
+        """Play the list of (src, dest) 'moves', white first."""
+
+        c = W
+        for src, dest in moves:
+            self.assertNotEqual(g.move(c, src, dest), I)
+            self.assertEqual(g.position_key(),
+                             g.board.zobrist_key(game.ru.enemy_color(c)))
+            c = game.ru.enemy_color(c)
+
+    def test_transposition(self):
+        """The same position reached in two ways has the same key."""
+
+        g_1, g_2 = game.Game(), game.Game()
+        self.play(g_1, [((7, 1), (6, 3)), ((7, 8), (6, 6)),
+                        ((2, 1), (3, 3))])
+        self.play(g_2, [((2, 1), (3, 3)), ((7, 8), (6, 6)),
+                        ((7, 1), (6, 3))])
+        self.assertEqual(g_1.position_key(), g_2.position_key())
+
+        # The knights going back and forth give back the initial position.
+        g_3 = game.Game()
+        self.play(g_3, [((7, 1), (6, 3)), ((7, 8), (6, 6)),
+                        ((6, 3), (7, 1)), ((6, 6), (7, 8))])
+        self.assertEqual(g_3.position_key(), game.Game().position_key())
+
+    def test_castling_rights(self):
+        """Losing a castling right changes the key."""
+
+        g_1, g_2 = game.Game(), game.Game()
+        moves = [((5, 2), (5, 4)), ((5, 7), (5, 5))]
+        self.play(g_1, moves + [((5, 1), (5, 2)), ((5, 8), (5, 7)),
+                                ((5, 2), (5, 1)), ((5, 7), (5, 8))])
+        self.play(g_2, moves)
+        self.assertNotEqual(g_1.position_key(), g_2.position_key())
+
+    def test_undo_redo(self):
+        """The key follows undo, redo and promote."""
+
+        g = game.Game()
+        keys = [g.position_key()]
+        moves = [((8, 2), (8, 4)), ((7, 7), (7, 5)), ((8, 4), (7, 5)),
+                 ((8, 7), (8, 6)), ((7, 5), (8, 6)), ((7, 8), (6, 6)),
+                 ((8, 6), (8, 7)), ((8, 8), (7, 8))]
+        c = W
+        for src, dest in moves:
+            g.move(c, src, dest)
+            keys.append(g.position_key())
+            c = game.ru.enemy_color(c)
+        self.assertEqual(g.move(W, (8, 7), (7, 8)), P)
+        pawn_key = g.position_key()
+        g.promote((7, 8), game.ru.QUEEN)
+        self.assertNotEqual(g.position_key(), pawn_key)
+        self.assertEqual(g.position_key(), g.board.zobrist_key(B))
+        queen_key = g.position_key()
+
+        for k in reversed(keys):
+            g.undo()
+            self.assertEqual(g.position_key(), k)
+        for k in keys[1:]:
+            g.redo()
+            self.assertEqual(g.position_key(), k)
+        g.redo()
+        self.assertEqual(g.position_key(), queen_key)
+
+
+class CastlingRights(unittest.TestCase):
+    """Test the castling rights kept by the board."""
+
+    FEN = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+
+    def test_undo_redo(self):
+        """A rook going back to its square loses its right, which undo gives
+        back and redo takes again."""
+
+        g = game.Game(fen=self.FEN)
+        moves = [(W, (8, 1), (8, 2)), (B, (1, 8), (1, 7)),
+                 (W, (8, 2), (8, 1)), (B, (1, 7), (1, 8))]
+        for c, src, dest in moves:
+            self.assertEqual(g.move(c, src, dest), V)
+        lost = (game.ru.ALL_CASTLING - game.ru.WHITE_KINGSIDE -
+                game.ru.BLACK_QUEENSIDE)
+        self.assertEqual(g.board.castling, lost)
+        self.assertEqual(g.move(W, (5, 1), (7, 1)), I)
+
+        for c, src, dest in moves:
+            g.undo()
+        self.assertEqual(g.board.castling, game.ru.ALL_CASTLING)
+        for c, src, dest in moves:
+            g.redo()
+        self.assertEqual(g.board.castling, lost)
+        self.assertEqual(g.move(W, (5, 1), (7, 1)), I)
+        self.assertEqual(g.move(W, (5, 1), (3, 1)), V)
+        self.assertEqual(g.move(B, (5, 8), (3, 8)), I)
+        self.assertEqual(g.move(B, (5, 8), (7, 8)), V)
+
+    def test_capture(self):
+        """A rook taken on its square takes the right with it."""
+
+        g = game.Game(fen=self.FEN)
+        self.assertEqual(g.move(W, (1, 1), (1, 8)), C)
+        self.assertEqual(g.board.castling,
+                         game.ru.WHITE_KINGSIDE + game.ru.BLACK_KINGSIDE)
+        self.assertEqual(g.to_fen(), "R3k2r/8/8/8/8/8/8/4K2R b Kk - 0 1")
+
+
+class LegalMoves(unittest.TestCase):
+    """Test the legal moves kept by the game."""
+
+    def test_destinations(self):
+        """The destinations follow the moves, undo, redo and promote."""
+
+        g = game.Game()
+        self.assertEqual(len(g.legal_moves()), 20)
+        self.assertEqual(g.legal_destinations((5, 2)), set([(5, 3), (5, 4)]))
+        self.assertEqual(g.legal_destinations((5, 7)), set())
+        self.assertEqual(g.legal_destinations((5, 4)), set())
+        self.assertEqual(g.move(W, (5, 2), (5, 4)), V)
+        self.assertEqual(g.legal_destinations((5, 7)), set([(5, 6), (5, 5)]))
+        g.undo()
+        self.assertEqual(g.legal_destinations((5, 7)), set())
+        self.assertEqual(g.legal_destinations((7, 1)), set([(6, 3), (8, 3)]))
+        g.redo()
+        self.assertEqual(g.legal_destinations((7, 1)), set())
+
+        g = game.Game(fen="4k3/1P6/8/8/8/8/8/R3K2R w KQ - 0 1")
+        self.assertEqual(g.legal_destinations((8, 1)),
+                         set([(8, 2), (8, 3), (8, 4), (8, 5), (8, 6), (8, 7),
+                              (8, 8), (7, 1), (6, 1)]))
+        self.assertEqual(g.move(W, (2, 7), (2, 8)), P)
+        g.promote((2, 8), game.ru.QUEEN)
+        self.assertEqual(g.legal_destinations((5, 8)),
+                         set([(4, 7), (5, 7), (6, 7)]))
+
+    def test_invalid_moves(self):
+        """The moves not in the set are refused."""
+
+        g = game.Game(fen="4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1")
+        self.assertEqual(g.move(W, (5, 1), (8, 1)), I)    # Own rook
+        self.assertEqual(g.move(W, (1, 1), (5, 1)), I)    # Own king
+        self.assertEqual(g.move(B, (5, 8), (5, 7)), I)    # Not its turn
+        self.assertEqual(g.move(W, (5, 1), (5, 1)), I)
+        self.assertEqual(g.move(W, (8, 1), (6, 1)), V)    # Castling
+        self.assertEqual(g.to_fen(), "4k3/8/8/8/8/8/8/R4RK1 b - - 1 1")
+
+    def test_castling_type(self):
+        """A rook next to its king can go there alone, a king can't go two
+        squares without the rook."""
+
+        fen = "4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1"
+        g = game.Game(fen=fen)
+        self.assertEqual(g.move(W, (5, 1), (7, 1), type_=game.NORMAL_MOVE), I)
+        self.assertEqual(g.move(W, (5, 1), (3, 1), type_=game.NORMAL_MOVE), I)
+        self.assertEqual(g.to_fen(), fen)
+        self.assertEqual(g.move(W, (8, 1), (6, 1), type_=game.NORMAL_MOVE), V)
+        self.assertEqual(g.to_fen(), "4k3/8/8/8/8/8/8/R3KR2 b Q - 1 1")
+
+    def test_check_mate(self):
+        """No moves are left after a mate."""
+
+        g = game.Game(fen="6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+        self.assertEqual(g.move(W, (1, 1), (1, 8)), M)
+        self.assertEqual(g.legal_moves(), [])
+        self.assertEqual(g.move(B, (7, 8), (8, 8)), I)
+
+
+class Fen(unittest.TestCase):
+    """Test setting up and writing the positions with FEN strings."""
+
+    def test_initial_position(self):
+        """The initial position and the clocks after a few moves."""
+
+        g = game.Game()
+        fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+        self.assertEqual(g.to_fen(), fen)
+        g.move(W, (5, 2), (5, 4))
+        g.move(B, (4, 7), (4, 5))
+        g.move(W, (5, 4), (4, 5))
+        g.move(B, (7, 8), (6, 6))
+        g.move(W, (7, 1), (6, 3))
+        self.assertEqual(g.to_fen(), "rnbqkb1r/ppp1pppp/5n2/3P4/8/5N2/"
+                                     "PPPP1PPP/RNBQKB1R b KQkq - 2 3")
+        g.undo()
+        g.undo()
+        g.undo()
+        self.assertEqual(g.to_fen(), "rnbqkbnr/ppp1pppp/8/3p4/4P3/8/"
+                                     "PPPP1PPP/RNBQKBNR w KQkq - 0 2")
+        self.assertEqual(game.Game(fen=g.to_fen()).position_key(),
+                         g.position_key())
+
+    def test_from_fen(self):
+        """The game goes on from the position."""
+
+        fen = "r3k2r/8/8/8/4Pp2/8/8/R3K2R b Kq e3 5 40"
+        g = game.Game()
+        g.from_fen(fen)
+        self.assertEqual(g.to_fen(), fen)
+        self.assertEqual(g.get_playing_color(), B)
+        self.assertEqual(g.move(W, (1, 1), (1, 2)), I)
+        self.assertEqual(g.move(B, (6, 4), (5, 3)), V)
+        self.assertEqual(g.to_fen(),
+                         "r3k2r/8/8/8/8/4p3/8/R3K2R w Kq - 0 41")
+
+        # Only the rights of the string are left.
+        self.assertEqual(g.move(W, (5, 1), (3, 1)), I)
+        self.assertEqual(g.move(W, (5, 1), (7, 1)), V)
+        self.assertEqual(g.move(B, (5, 8), (7, 8)), I)
+        self.assertEqual(g.move(B, (5, 8), (3, 8)), V)
+        self.assertEqual(g.to_fen(),
+                         "2kr3r/8/8/8/8/4p3/8/R4RK1 w - - 2 42")
+
+    def test_bitboard(self):
+        """A BitBoard is set up the same way."""
+
+        fen = ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R "
+               "w KQkq - 0 1")
+        g_1, g_2 = game.Game(fen=fen), game.Game(bitboard=True, fen=fen)
+        self.assertEqual(g_2.to_fen(), fen)
+        self.assertEqual(g_1.position_key(), g_2.position_key())
+        self.assertEqual(sorted(g_1.board.legal_moves(W)),
+                         sorted(g_2.board.legal_moves(W)))
+
+
+class Draws(unittest.TestCase):
+    """Test the draws by repetition and by the 50-move rule."""
+
+    def test_threefold_repetition(self):
+        """The third time the position comes, the game is a draw."""
+
+        g = game.Game()
+        knights = [(W, (7, 1), (6, 3)), (B, (7, 8), (6, 6)),
+                   (W, (6, 3), (7, 1)), (B, (6, 6), (7, 8))]
+        for c, src, dest in knights + knights[:3]:
+            self.assertEqual(g.move(c, src, dest), V)
+        self.assertEqual(g.repetitions(), 2)
+        self.assertEqual(g.move(B, (6, 6), (7, 8)), game.DRAW)
+        self.assertEqual(g.repetitions(), 3)
+        self.assertEqual(g.move(W, (7, 1), (6, 3)), V)     # Still a draw
+        self.assertTrue(g.is_draw())
+
+        # Undoing the move which repeated the position drops the count.
+        g.undo()
+        self.assertEqual(g.repetitions(), 3)
+        g.undo()
+        self.assertEqual(g.repetitions(), 2)
+        self.assertFalse(g.is_draw())
+        g.redo()
+        self.assertEqual(g.repetitions(), 3)
+        self.assertTrue(g.is_draw())
+
+    def test_irreversible_moves(self):
+        """The positions before a pawn move or a change of the castling
+        rights are not looked at."""
+
+        g = game.Game(fen="4k3/8/8/8/8/8/P7/R3K3 w Q - 0 1")
+        for c, src, dest in [(W, (1, 1), (2, 1)), (B, (5, 8), (5, 7)),
+                             (W, (2, 1), (1, 1)), (B, (5, 7), (5, 8))]:
+            self.assertEqual(g.move(c, src, dest), V)
+        self.assertEqual(g.reversible_plies, [0, 0, 1, 2, 3])
+        self.assertEqual(g.repetitions(), 1)
+        g.move(W, (1, 2), (1, 3))
+        self.assertEqual(g.reversible_plies[-1], 0)
+
+    def test_fifty_moves(self):
+        """The game is a draw after fifty moves without a capture or a pawn
+        move, unless the last one mates."""
+
+        g = game.Game(fen="7k/8/6K1/8/8/8/8/5Q2 w - - 99 80")
+        self.assertEqual(g.move(W, (6, 1), (6, 8)), M)
+        g.undo()
+        self.assertEqual(g.move(W, (6, 1), (6, 2)), game.DRAW)
+        g.undo()
+        self.assertEqual(g.move(W, (7, 6), (7, 5)), game.DRAW)
+
+    def test_check_in_a_draw(self):
+        """A move which checks tells the check, the draw being given by
+        is_draw()."""
+
+        g = game.Game(fen="7k/8/6K1/8/8/8/8/5Q2 w - - 99 80")
+        self.assertEqual(g.move(W, (6, 1), (1, 1)), game.CHECK)
+        self.assertTrue(g.is_draw())
+        self.assertEqual(g.move(B, (8, 8), (7, 8)), V)
+        self.assertEqual(g.move(W, (1, 1), (1, 8)), M)
+
+
+class Seek(unittest.TestCase):
+    """Test the jumps to a ply of the history or the undo history."""
+
+    def play_random(self, g, plies, seed=0):
+        """Play up to plies random moves in the Game g."""
+
+        rand = random.Random(seed)
+        for i in xrange(plies):
+            moves = sorted(g.legal_moves())
+            if(not moves):
+                break
+            m = rand.choice(moves)
+            if(g.move(g.get_playing_color(), m.src, m.dest,
+                      type_=m.type_) == P):
+                g.promote(m.dest, rand.choice([rules.QUEEN, rules.KNIGHT]))
+
+    def state(self, g):
+        """Return all that the moves change in the Game g."""
+
+        return (g.history[:], g.undo_history[:], g.undo_promotion_history[:],
+                g.tokens[:], g.undo_states[:], g.halfmove_clocks[:],
+                g.keys[:], g.reversible_plies[:], dict(g.promotions),
+                g.white_player.captured_pieces[:],
+                g.black_player.captured_pieces[:],
+                g.white_player.is_playing(), g.black_player.is_playing(),
+                dict(g.board.dict_), g.board.castling, g.board.ep,
+                g.board.zobrist, g.to_fen())
+
+    def test_undo_redo(self):
+        """seek() gives the game undo() and redo() give."""
+
+        for seed, bitboard in [(0, False), (1, False), (2, True)]:
+            g = game.Game(bitboard, checkpoint_every=5)
+            expected = game.Game(bitboard)
+            self.play_random(g, 300, seed)
+            self.play_random(expected, 300, seed)
+            n = len(g.history)
+            for ply in [0, n, n // 2, n // 2 + 1, n // 2 - 1, 3, n - 2, 11,
+                        10, 7, n - 1, 0]:
+                self.assertTrue(g.seek(ply))
+                while(len(expected.history) > ply):
+                    expected.undo()
+                while(len(expected.history) < ply):
+                    expected.redo()
+                self.assertEqual(self.state(g), self.state(expected))
+                self.assertEqual(sorted(g.legal_moves()),
+                                 sorted(expected.legal_moves()))
+
+    def test_end(self):
+        """The plies out of the game are refused, and a move played after a
+        seek() drops the undone moves."""
+
+        g = game.Game(checkpoint_every=4)
+        self.play_random(g, 40)
+        self.assertIsNone(g.seek(41))
+        self.assertIsNone(g.seek(-1))
+        self.assertTrue(g.seek(30))
+        self.assertTrue(g.seek(9))
+        m = sorted(g.legal_moves())[0]
+        self.assertNotEqual(g.move(g.get_playing_color(), m.src, m.dest,
+                                   type_=m.type_), I)
+        self.assertIsNone(g.seek(11))
+        self.assertEqual(len(g.checkpoints), 3)
+        fen = g.to_fen()
+        self.assertTrue(g.seek(1))
+        self.assertTrue(g.seek(10))
+        self.assertEqual(g.to_fen(), fen)
+
+    def test_check_mate(self):
+        """After a seek() to a mate, nobody can play, as after the move."""
+
+        g = game.Game()
+        for src, dest in [((6, 2), (6, 3)), ((5, 7), (5, 5)),
+                          ((7, 2), (7, 4)), ((4, 8), (8, 4))]:
+            g.move(g.get_playing_color(), src, dest)
+        g.seek(0)
+        g.seek(4)
+        self.assertFalse(g.white_player.is_playing())
+        self.assertFalse(g.black_player.is_playing())
+        self.assertEqual(g.move(W, (5, 2), (5, 4)), I)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,326 @@
+"""Load test module
+
+This module measures how the server copes with many games at once: it
+plays random games against it, at the pace of players thinking think_ms
+milliseconds per move on average, and reports the moves per second and the
+median and 99th percentile of the latency of the moves, from the MOVE line
+sent to the OK line received.
+
+The clients are a few connections, each one playing many games, both sides
+at times, as the protocol allows: a machine would run out of file
+descriptors long before 10000 games with a socket per player. A finished
+game is replaced by a new one, so the number of games stays the same; the
+moves are measured once all the games have started.
+
+Without an address, a server is started in a child process. The server and
+the clients share the processors of the machine.
+
+With watch, it measures instead the time the server takes to play a move of
+a game with many watchers, which all get the move: the server and the
+watchers run in this process, and the watchers read their lines between two
+moves.
+
+Usage: python loadtest.py [seconds] [think_ms] [games ...] [host:port]
+       python loadtest.py watch [watchers ...]
+"""
+
+import asynchat
+import asyncore
+import heapq
+import multiprocessing
+import random
+import socket
+import sys
+import time
+from collections import namedtuple
+
+import rules as ru
+import game as gm
+import server as sv
+
+"""Constants"""
+GAMES = [1000, 5000, 10000]
+SECONDS = 10
+THINK_MS = 1000         # Mean time of a player between two moves
+CONNECTIONS = 64
+RECORDED_GAMES = 64     # Random games played again and again
+MAX_PLIES = 120
+POLL_TIMEOUT = 0.05
+WATCHERS = [0, 100, 1000, 5000, 9000]
+CONNECT_BATCH = 500     # Connections made before the server accepts them
+
+# The outcome of a run: the number of games, the moves played while all the
+# games were running and in how many seconds, the moves per second, the
+# median and 99th percentile latencies in ms, and the errors received.
+LoadResult = namedtuple('LoadResult', 'games, moves, seconds, '
+                                      'moves_per_second, p50_ms, p99_ms, '
+                                      'errors')
+
+"""Functions"""
+def random_games(n, max_plies=MAX_PLIES, seed=0):
+    """Return the lists of the moves, in coordinate notation, of n random
+    games of at most max_plies plies."""
+
+    rand = random.Random(seed)
+    games = []
+    for i in xrange(n):
+        g = gm.Game()
+        moves = []
+        while(len(moves) < max_plies):
+            legal = sorted(g.legal_moves())
+            if(not legal):
+                break
+            m = rand.choice(legal)
+            promotion = None
+            if(g.move(g.get_playing_color(), m.src, m.dest,
+                      type_=m.type_) == gm.PROMOTE):
+                promotion = ru.QUEEN
+                g.promote(m.dest, promotion)
+            moves.append(sv.move_text(m.src, m.dest, promotion))
+        games.append(moves)
+    return games
+
+def percentile(values, p):
+    """Return the p-th percentile of the sorted list values, 0 if empty."""
+
+    if(not values):
+        return 0.
+    return values[min(len(values) - 1, int(len(values) * p / 100.))]
+
+def broadcast_cost(watchers, seed=0):
+    """Return the mean seconds the server takes to play a move of a random
+    game watched by 'watchers' connections, and the number of watchers which
+    missed moves."""
+
+    server = sv.Server(0, 1, host='127.0.0.1')
+    sockets = []
+    try:
+        def flush():
+            # Let the server send its lines and the clients read them.
+            asyncore.loop(0, True, server.map, 1)
+            for s in sockets:
+                try:
+                    while(s.recv(65536)):
+                        pass
+                except socket.error:
+                    pass
+
+        def connect(n):
+            # Open n connections, batch by batch for the backlog.
+            while(len(sockets) < n):
+                batch = min(n - len(sockets), CONNECT_BATCH)
+                for i in xrange(batch):
+                    sockets.append(socket.create_connection(
+                        ('127.0.0.1', server.port)))
+                while(len(server.map) < len(sockets) + 2):
+                    asyncore.loop(0, True, server.map, 1)
+            for s in sockets:
+                s.setblocking(0)
+
+        connect(1)
+        sockets[0].sendall("PLAY 0\nPLAY 0\n")
+        while(not server.sessions or
+              server.sessions.values()[0].turn_start is None):
+            asyncore.loop(POLL_TIMEOUT, True, server.map, 1)
+        session = server.sessions.values()[0]
+        connect(watchers + 1)
+        for s in sockets[1:]:
+            s.sendall("WATCH %d\n" % session.id_)
+        while(len(session.watchers) < watchers):
+            flush()
+        flush()
+
+        seconds, moves = 0., 0
+        for text in random_games(1, seed=seed)[0]:
+            if(session.over):
+                break
+            start = time.time()
+            server.move(session, session.game.get_playing_color(), text)
+            seconds += time.time() - start
+            moves += 1
+            flush()
+        lagging = len([missed for missed in session.watchers.itervalues()
+                       if missed is not None])
+        return seconds / moves, lagging
+    finally:
+        for s in sockets:
+            s.close()
+        server.close_all()
+
+def serve(queue):
+    """Run a server on a free port, given in the queue, until the process
+    is terminated."""
+
+    server = sv.Server(0, 1)
+    queue.put(server.port)
+    server.serve()
+
+
+"""Classes"""
+class Client(asynchat.async_chat):
+    """The class Client is a connection to the server, which gives the lines
+    it reads to the LoadTest."""
+
+    def __init__(self, test, address):
+        asynchat.async_chat.__init__(self, socket.create_connection(address),
+                                     map=test.map)
+        self.test = test
+        self.set_terminator('\n')
+        self.buffer = []
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        line = ''.join(self.buffer)
+        self.buffer = []
+        self.test.line(self, line.split())
+
+    def send_line(self, line):
+        """Send a line of the protocol."""
+
+        self.push(line + '\n')
+
+class LoadTest():
+    """The class LoadTest keeps a number of games running on the server and
+    times their moves."""
+
+    def __init__(self, address, games, think_ms=THINK_MS,
+                 connections=CONNECTIONS, seed=0):
+        self.map = {}
+        self.clients = [Client(self, address) for i in xrange(connections)]
+        self.games = games
+        self.think = think_ms / 1000.
+        self.recorded = random_games(RECORDED_GAMES, seed=seed)
+        self.rand = random.Random(seed)
+        self.next_client = 0
+
+        self.sessions = {}  # Id: [white Client, black Client, plies]
+        self.queue = []     # Heap of the (time, id) of the moves to play
+        self.sent = {}      # Id: time the last move was sent
+        self.started = 0
+        self.measure_start = None
+        self.latencies = []
+        self.errors = 0
+
+    def new_game(self):
+        """Ask for a new game, whose sides are played by the next two
+        connections."""
+
+        for i in xrange(2):
+            self.clients[self.next_client].send_line("PLAY 0")
+            self.next_client = (self.next_client + 1) % len(self.clients)
+
+    def line(self, client, words):
+        """Handle a line of the server read by the client."""
+
+        now = time.time()
+        if(words[0] in ['OK', 'MOVE', 'START', 'END']):
+            id_ = int(words[1])
+        if(words[0] == 'START'):
+            s = self.sessions.setdefault(id_, [None, None, 0])
+            s[ru.COLOR_LETTERS.index(words[2])] = client
+            if(None not in s[:2]):
+                self.started += 1
+                if(self.started == self.games):
+                    self.measure_start = now
+                self.__schedule(id_, now)
+        elif(words[0] == 'OK'):
+            sent = self.sent.pop(id_)
+            if(self.measure_start is not None):
+                self.latencies.append(now - sent)
+        elif(words[0] == 'MOVE'):
+            self.sessions[id_][2] += 1
+            self.__schedule(id_, now)
+        elif(words[0] == 'END'):
+            # A connection playing both sides gets the line once.
+            if(self.sessions.pop(id_, None) is not None):
+                self.sent.pop(id_, None)
+                self.new_game()
+        elif(words[0] == 'ERROR'):
+            self.errors += 1
+
+    def __schedule(self, id_, now):
+        # Play the next move of the game after the player thought.
+        heapq.heappush(self.queue,
+                       (now + self.rand.uniform(0, 2 * self.think), id_))
+
+    def __play(self, id_, now):
+        # Play the next move of the game, or resign at the end of its moves.
+        s = self.sessions.get(id_)
+        if(s is None):
+            return
+        if(id_ in self.sent):   # The OK of the last move is on its way
+            heapq.heappush(self.queue, (now + POLL_TIMEOUT, id_))
+            return
+        moves = self.recorded[id_ % len(self.recorded)]
+        client = s[s[2] % 2]
+        if(s[2] >= len(moves)):
+            client.send_line("RESIGN %d" % id_)
+        else:
+            self.sent[id_] = now
+            client.send_line("MOVE %d %s" % (id_, moves[s[2]]))
+
+    def run(self, seconds):
+        """Start the games, let them run for seconds once all of them
+        started, and return the LoadResult."""
+
+        for i in xrange(self.games):
+            self.new_game()
+        deadline = None
+        while(deadline is None or time.time() < deadline):
+            now = time.time()
+            while(self.queue and self.queue[0][0] <= now):
+                self.__play(heapq.heappop(self.queue)[1], now)
+            timeout = POLL_TIMEOUT
+            if(self.queue):
+                timeout = max(0, min(timeout, self.queue[0][0] - now))
+            asyncore.loop(timeout, True, self.map, 1)
+            if(deadline is None and self.measure_start is not None):
+                deadline = self.measure_start + seconds
+        asyncore.close_all(self.map)
+
+        t = time.time() - self.measure_start
+        l = sorted(self.latencies)
+        return LoadResult(self.games, len(l), t, len(l) / t,
+                          percentile(l, 50) * 1000, percentile(l, 99) * 1000,
+                          self.errors)
+
+
+if __name__ == '__main__':
+    seconds, think_ms, games, address = SECONDS, THINK_MS, [], None
+    args = sys.argv[1:]
+    if(args and args[0] == 'watch'):
+        print "%8s %9s %8s" % ('watchers', 'us/move', 'lagging')
+        for n in [int(n) for n in args[1:]] or WATCHERS:
+            cost, lagging = broadcast_cost(n)
+            print "%8d %9.0f %8d" % (n, cost * 1e6, lagging)
+            sys.stdout.flush()
+        sys.exit()
+    if(args and ':' in args[-1]):
+        host, port = args.pop().split(':')
+        address = (host, int(port))
+    if(args):
+        seconds = float(args.pop(0))
+    if(args):
+        think_ms = int(args.pop(0))
+    games = [int(n) for n in args] or GAMES
+
+    process = None
+    if(address is None):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=serve, args=(queue,))
+        process.start()
+        address = ('127.0.0.1', queue.get())
+    try:
+        print "%6s %8s %10s %9s %9s %6s" % ('games', 'moves', 'moves/s',
+                                            'p50 ms', 'p99 ms', 'errors')
+        for n in games:
+            r = LoadTest(address, n, think_ms).run(seconds)
+            print "%6d %8d %10.0f %9.1f %9.1f %6d" % (
+                r.games, r.moves, r.moves_per_second, r.p50_ms, r.p99_ms,
+                r.errors)
+            sys.stdout.flush()
+    finally:
+        if(process is not None):
+            process.terminate()
@@ -0,0 +1,122 @@
+"""Perft module
+
+This module counts the leaf nodes of the move tree (perft) to check the move
+generation of the rules module against known values, and to measure how fast
+the rules engine is.
+
+Usage: python perft.py [max_depth] [bitboard]
+"""
+
+import sys
+import time
+
+import rules as ru
+import bitboard as bb
+
+"""Constants"""
+PROMOTION_TYPES = [ru.QUEEN, ru.ROOK, ru.BISHOP, ru.KNIGHT]
+
+# The reference positions with the known number of leaf nodes at depth 1, 2,
+# 3...
+POSITIONS = [
+    ("Initial position",
+     "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete",
+     "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("En passant and pins",
+     "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("Promotions",
+     "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Promotion and castling",
+     "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+]
+
+"""Functions"""
+def new_board(fen, bitboard=False):
+    """Return the board set up from 'fen' and the color to move.
+
+    If bitboard is True, the board is a BitBoard.
+    """
+
+    if(bitboard):
+        b = bb.BitBoard([])
+    else:
+        b = ru.Board([])
+    return b, b.set_fen(fen)
+
+def perft(board, color, depth):
+    """Return the number of leaf nodes of the move tree of 'color' at
+    'depth'."""
+
+    if(depth == 0):
+        return 1
+
+    n = 0
+    e_c = ru.enemy_color(color)
+    for m in list(board.legal_moves(color)):
+        if(m.type_ in [ru.PROMOTION, ru.CAPTURE_PROMOTION]):
+            promotions = PROMOTION_TYPES
+        else:
+            promotions = [None]
+        if(depth == 1):
+            n += len(promotions)
+            continue
+        for type_ in promotions:
+            token = board.make(m, type_)
+            n += perft(board, e_c, depth - 1)
+            board.unmake(token)
+    return n
+
+def divide(board, color, depth):
+    """Return a dict giving the perft at depth - 1 after each Move, the
+    promotions being counted together."""
+
+    d = {}
+    for m in list(board.legal_moves(color)):
+        if(m.type_ in [ru.PROMOTION, ru.CAPTURE_PROMOTION]):
+            promotions = PROMOTION_TYPES
+        else:
+            promotions = [None]
+        d[m] = 0
+        for type_ in promotions:
+            token = board.make(m, type_)
+            d[m] += perft(board, ru.enemy_color(color), depth - 1)
+            board.unmake(token)
+    return d
+
+def run(max_depth, bitboard=False, out=sys.stdout):
+    """Run perft on the reference positions up to 'max_depth'.
+
+    Print the number of nodes, the expected one and the nodes per second for
+    each depth. Return True if all the counts are right.
+    """
+
+    ok = True
+    for name, fen, counts in POSITIONS:
+        out.write("%s\n  %s\n" % (name, fen))
+        for depth in xrange(1, min(max_depth, len(counts)) + 1):
+            board, color = new_board(fen, bitboard)
+            start = time.time()
+            n = perft(board, color, depth)
+            t = time.time() - start
+            if(n == counts[depth - 1]):
+                result = "ok"
+            else:
+                result = "FAILED, expected %d" % counts[depth - 1]
+                ok = False
+            out.write("  depth %d: %10d nodes %8.2fs %10.0f nodes/s  %s\n" %
+                      (depth, n, t, n / max(t, 1e-9), result))
+    return ok
+
+
+if __name__ == '__main__':
+    max_depth = 3
+    if(len(sys.argv) > 1):
+        max_depth = int(sys.argv[1])
+    if(not run(max_depth, 'bitboard' in sys.argv[2:])):
+        sys.exit(1)
@@ -0,0 +1,53 @@
+"""Unittest of the module perft.py.
+
+The move generation must give the known perft values. Only the small depths
+are run here; run perft.py itself to go deeper."""
+
+import unittest
+import perft
+
+"""Constants"""
+MAX_NODES = 10000   # Skip the depths with more leaf nodes
+
+class ReferencePositions(unittest.TestCase):
+    """Test the perft values of the reference positions."""
+
+    def check(self, bitboard):
+        """Compare the perft values with the known ones."""
+
+        for name, fen, counts in perft.POSITIONS:
+            for depth, n in enumerate(counts, start=1):
+                if(n > MAX_NODES):
+                    break
+                board, color = perft.new_board(fen, bitboard)
+                self.assertEqual(perft.perft(board, color, depth), n,
+                                 "%s at depth %d" % (name, depth))
+
+    def test_board(self):
+        """With a Board."""
+
+        self.check(False)
+
+    def test_bitboard(self):
+        """With a BitBoard."""
+
+        self.check(True)
+
+    def test_unmake(self):
+        """The board is the same after the perft."""
+
+        for name, fen, counts in perft.POSITIONS:
+            board, color = perft.new_board(fen)
+            before = dict((pos, (p.color, p.get_type()))
+                          for pos, p in board.dict_.iteritems())
+            state = board.castling, board.ep, board.zobrist
+            perft.perft(board, color, 2)
+            after = dict((pos, (p.color, p.get_type()))
+                         for pos, p in board.dict_.iteritems())
+            self.assertEqual(before, after)
+            self.assertEqual(state, (board.castling, board.ep,
+                                     board.zobrist))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,288 @@
+"""PGN module
+
+This module reads and writes games in the Portable Game Notation, the text
+format of the chess databases.
+
+read_games() streams the games of a file one at a time, so that a file of
+any size is read with a constant memory. The moves are written in SAN, the
+Standard Algebraic Notation: parse_san() turns them into Moves with the move
+generator of the board, and move_to_san() writes them back.
+"""
+
+import os
+import re
+from collections import namedtuple
+
+import rules as ru
+import game as gm
+
+"""Constants"""
+SAVES_DIRECTORY = 'saves'
+RESULTS = ['1-0', '0-1', '1/2-1/2', '*']
+# The tags every game has, in this order.
+SEVEN_TAG_ROSTER = [('Event', '?'), ('Site', '?'), ('Date', '????.??.??'),
+                    ('Round', '?'), ('White', '?'), ('Black', '?'),
+                    ('Result', '*')]
+LINE_LENGTH = 79
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# A token of the moves: a comment or variation delimiter, a NAG or a word.
+TOKEN = re.compile(r'[{}();]|\$\d+|[^\s{}();]+')
+MOVE_NUMBER = re.compile(r'^\d+\.*')
+
+# A game read from a PGN file: the dict of the tags, the list of the moves
+# in SAN and the result.
+PgnGame = namedtuple('PgnGame', 'headers, moves, result')
+
+"""Functions"""
+def square_name((x, y)):
+    """Return the name of the square (x, y), like 'e4'."""
+
+    return chr(ord('a') + x - 1) + str(y)
+
+def read_games(f):
+    """Generate the PgnGames of the file f, one at a time.
+
+    Only the current game is kept in memory. The comments, the variations
+    and the annotations are skipped.
+    """
+
+    headers, moves = {}, []
+    in_moves = False    # True once the moves of the game have begun
+    in_comment = False
+    depth = 0           # Of the variations
+    for line in f:
+        line = line.strip()
+        if(not in_comment and line.startswith('[')):
+            if(in_moves):   # The game had no result
+                yield PgnGame(headers, moves, '*')
+                headers, moves, in_moves, depth = {}, [], False, 0
+            m = TAG.match(line)
+            if(m is not None):
+                headers[m.group(1)] = re.sub(r'\\(.)', r'\1', m.group(2))
+            continue
+        if(line.startswith('%')):
+            continue
+
+        for token in TOKEN.findall(line):
+            if(in_comment):
+                in_comment = token != '}'
+            elif(token == '{'):
+                in_comment = True
+            elif(token == ';'):
+                break   # The rest of the line is a comment
+            elif(token == '('):
+                depth += 1
+            elif(token == ')'):
+                depth -= 1
+            elif(depth > 0 or token.startswith('$') or token == 'e.p.'):
+                continue
+            elif(token in RESULTS):
+                yield PgnGame(headers, moves, token)
+                headers, moves, in_moves, depth = {}, [], False, 0
+            else:
+                in_moves = True
+                token = MOVE_NUMBER.sub('', token).rstrip('!?')
+                if(token):
+                    moves.append(token)
+    if(in_moves or headers):
+        yield PgnGame(headers, moves, headers.get('Result', '*'))
+
+def parse_san(board, color, san):
+    """Return the (Move, promotion) written san for the 'color' player,
+    promotion being the type of the new piece or None.
+
+    Return None if no legal move, or more than one, is written san.
+    """
+
+    san = san.rstrip('+#!?')
+    moves = list(board.legal_moves(color))
+    if(san in ['O-O', '0-0', 'O-O-O', '0-0-0']):
+        if(len(san) == 3):
+            x = ru.KINGSIDE_KING_POS_X
+        else:
+            x = ru.QUEENSIDE_KING_POS_X
+        for m in moves:
+            if(m.type_ == ru.CASTLING and m.dest[0] == x):
+                return m, None
+        return None
+
+    promotion = None
+    if(len(san) > 2 and san[-1] in 'QRBN'):
+        promotion = ru.PIECE_LETTERS.index(san[-1])
+        san = san[:-1].rstrip('=')
+    type_ = ru.PAWN
+    if(san[:1] in ['K', 'Q', 'R', 'B', 'N']):
+        type_ = ru.PIECE_LETTERS.index(san[0])
+        san = san[1:]
+    san = san.replace('x', '').replace(':', '')
+    if(len(san) < 2 or san[-2] not in 'abcdefgh' or
+       san[-1] not in '12345678'):
+        return None
+    dest = (ord(san[-2]) - ord('a') + 1, int(san[-1]))
+    disambiguation = san[:-2]
+
+    found = None
+    for m in moves:
+        if(m.dest != dest or board[m.src].type_ != type_):
+            continue
+        name = square_name(m.src)
+        if(any(char not in name for char in disambiguation)):
+            continue
+        if(found is not None):
+            return None     # Ambiguous
+        found = m
+    if(found is None):
+        return None
+    if((found.type_ in [ru.PROMOTION, ru.CAPTURE_PROMOTION]) !=
+       (promotion is not None)):
+        return None
+    return found, promotion
+
+def move_to_san(board, color, m, promotion=None):
+    """Return the SAN of the legal Move m of the 'color' player, promotion
+    being the type of the piece a pawn becomes."""
+
+    p = board[m.src]
+    capture = m.type_ in [ru.CAPTURE, ru.EN_PASSANT, ru.CAPTURE_PROMOTION]
+    if(m.type_ == ru.CASTLING):
+        # Played with the king or with the rook
+        if(m.dest[0] in [ru.KINGSIDE_KING_POS_X, ru.KINGSIDE_ROOK_POS_X]):
+            san = 'O-O'
+        else:
+            san = 'O-O-O'
+    elif(p.type_ == ru.PAWN):
+        san = square_name(m.dest)
+        if(capture):
+            san = square_name(m.src)[0] + 'x' + san
+        if(promotion is not None):
+            san += '=' + ru.PIECE_LETTERS[promotion]
+    else:
+        # The other pieces of the same type which can go to the same square
+        others = [n.src for n in board.legal_moves(color)
+                  if n.dest == m.dest and n.src != m.src and
+                  board[n.src].type_ == p.type_]
+        name = square_name(m.src)
+        if(not others):
+            disambiguation = ''
+        elif(all(src[0] != m.src[0] for src in others)):
+            disambiguation = name[0]
+        elif(all(src[1] != m.src[1] for src in others)):
+            disambiguation = name[1]
+        else:
+            disambiguation = name
+        san = ru.PIECE_LETTERS[p.type_] + disambiguation
+        if(capture):
+            san += 'x'
+        san += square_name(m.dest)
+
+    token = board.make(m, promotion)
+    e_c = ru.enemy_color(color)
+    if(board.is_check(e_c)):
+        if(board.is_pat(e_c)):
+            san += '#'
+        else:
+            san += '+'
+    board.unmake(token)
+    return san
+
+def replay(pgn_game, bitboard=False):
+    """Return the Game of the PgnGame pgn_game, its moves being played with
+    Game.move() and Game.promote(), or None if a move is not legal."""
+
+    g = gm.Game(bitboard, pgn_game.headers.get('FEN'))
+    for san in pgn_game.moves:
+        color = g.get_playing_color()
+        parsed = parse_san(g.board, color, san)
+        if(parsed is None):
+            return None
+        m, promotion = parsed
+        if(g.move(color, m.src, m.dest, type_=m.type_) == gm.INVALID_MOVE):
+            return None
+        if(promotion is not None):
+            g.promote(m.dest, promotion)
+    return g
+
+def load_games(f, bitboard=False):
+    """Generate the (PgnGame, Game) of the games of the file f, the Game
+    being None if the moves can't be played."""
+
+    for pgn_game in read_games(f):
+        yield pgn_game, replay(pgn_game, bitboard)
+
+def escape(value):
+    """Return the value of a tag with its quotes and backslashes escaped."""
+
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+def write_game(f, g, headers={}):
+    """Write the Game g in the file f, with the tags of the dict headers.
+
+    The missing tags of the Seven Tag Roster are written with their unknown
+    value, but the result of a finished game is found from the board.
+    """
+
+    board = ru.Board([])
+    color = board.set_fen(g.initial_fen)
+    words = []
+    for i, m in enumerate(g.history):
+        promotion = g.promotions.get(i)
+        word = move_to_san(board, color, m, promotion)
+        number = (g.first_ply + i) // 2 + 1
+        if(color == ru.WHITE_COLOR):    # A move number stays with its move
+            word = '%d. %s' % (number, word)
+        elif(i == 0):
+            word = '%d... %s' % (number, word)
+        words.append(word)
+        board.make(m, promotion)
+        color = ru.enemy_color(color)
+
+    result = '*'
+    if(board.is_pat(color)):
+        if(not board.is_check(color)):
+            result = '1/2-1/2'
+        elif(color == ru.WHITE_COLOR):
+            result = '0-1'
+        else:
+            result = '1-0'
+    result = headers.get('Result', result)
+    words.append(result)
+
+    tags = dict(headers)
+    tags['Result'] = result
+    if(g.initial_fen != ru.INITIAL_FEN):
+        tags['SetUp'] = '1'
+        tags['FEN'] = g.initial_fen
+    for name, value in SEVEN_TAG_ROSTER:
+        f.write('[%s "%s"]\n' % (name, escape(tags.pop(name, value))))
+    for name in sorted(tags):
+        f.write('[%s "%s"]\n' % (name, escape(tags[name])))
+    f.write('\n')
+
+    line = ''
+    for word in words:
+        if(line and len(line) + 1 + len(word) > LINE_LENGTH):
+            f.write(line + '\n')
+            line = ''
+        line += (' ' if line else '') + word
+    f.write(line + '\n\n')
+
+def save_game(g, name, headers={}):
+    """Save the Game g in the file name.pgn of the saves directory and return
+    the path of the file."""
+
+    if(not os.path.isdir(SAVES_DIRECTORY)):
+        os.makedirs(SAVES_DIRECTORY)
+    path = os.path.join(SAVES_DIRECTORY, name + '.pgn')
+    with open(path, 'w') as f:
+        write_game(f, g, headers)
+    return path
+
+def load_game(name):
+    """Return the Game saved as name in the saves directory, or None if it
+    can't be played."""
+
+    with open(os.path.join(SAVES_DIRECTORY, name + '.pgn')) as f:
+        for pgn_game in read_games(f):
+            return replay(pgn_game)
+    return None
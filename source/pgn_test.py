@@ -0,0 +1,162 @@
+"""Unittest of the module pgn.py."""
+
+from StringIO import StringIO
+import unittest
+import game
+import pgn
+import rules
+
+"""Constants"""
+W = rules.WHITE_COLOR
+B = rules.BLACK_COLOR
+
+OPERA_GAME = """[Event "Paris"]
+[Site "Paris FRA"]
+[Date "1858.??.??"]
+[Round "?"]
+[White "Paul Morphy"]
+[Black "Duke Karl / Count Isouard"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 4. dxe5 Bxf3 5. Qxf3 dxe5 6. Bc4 Nf6 7. Qb3 Qe7
+8. Nc3 c6 9. Bg5 b5 10. Nxb5 cxb5 11. Bxb5+ Nbd7 12. O-O-O Rd8 13. Rxd7 Rxd7
+14. Rd1 Qe6 15. Bxd7+ Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0
+
+"""
+
+class ReadGames(unittest.TestCase):
+    """Test reading the games of a file."""
+
+    def test_stream(self):
+        """The games come one by one, without the comments, the variations
+        and the annotations."""
+
+        f = StringIO("""[Event "First"]
+[White "A \\"quoted\\" name"]
+
+1. e4 {A comment
+on two lines (with a parenthesis)} e5 2. Nf3!? (2. f4 exf4 (2... d5))
+2... Nc6 $1 ; The rest is a comment 3. Bb5
+3.Bb5 a6 *
+
+[Event "Second"]
+
+1. d4 d5 1/2-1/2
+""")
+        games = pgn.read_games(f)
+        first = next(games)
+        self.assertEqual(first.headers, {'Event': 'First',
+                                         'White': 'A "quoted" name'})
+        self.assertEqual(first.moves, ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'])
+        self.assertEqual(first.result, '*')
+        self.assertEqual(next(games), pgn.PgnGame({'Event': 'Second'},
+                                                  ['d4', 'd5'], '1/2-1/2'))
+        self.assertRaises(StopIteration, next, games)
+
+    def test_replay(self):
+        """The Opera Game is played to the check mate."""
+
+        [(pgn_game, g)] = list(pgn.load_games(StringIO(OPERA_GAME)))
+        self.assertEqual(len(g.history), 33)
+        self.assertTrue(g.board.is_check(B))
+        self.assertTrue(g.board.is_pat(B))
+
+    def test_illegal_move(self):
+        """A game with an illegal or ambiguous move can't be played."""
+
+        for moves in ["1. e5", "1. e4 e5 2. Nf3 Nc6 3. Nc3 Nf6 4. Nd5 Nd4 "
+                      "5. Ne5 Ne4 6. Nc4 Nc5 7. Ne3"]:
+            [(pgn_game, g)] = list(pgn.load_games(StringIO(moves + " *")))
+            self.assertEqual(g, None)
+
+
+class San(unittest.TestCase):
+    """Test reading and writing the moves in SAN."""
+
+    def test_disambiguation(self):
+        """The square, the column or the row of the piece is given when
+        another one can go to the same square."""
+
+        board = rules.Board([])
+        board.set_fen("4k3/8/8/8/1N3N2/8/1N6/R3K2R w KQ - 0 1")
+        for san, src, dest in [('Nb4d3', (2, 4), (4, 3)),
+                               ('Nfd3', (6, 4), (4, 3)),
+                               ('N2d3', (2, 2), (4, 3)),
+                               ('Nb2d3', (2, 2), (4, 3)),
+                               ('Rd1', (1, 1), (4, 1)),
+                               ('Rf1', (8, 1), (6, 1)),
+                               ('O-O', (5, 1), (7, 1))]:
+            m, promotion = pgn.parse_san(board, W, san)
+            self.assertEqual((m.src, m.dest), (src, dest))
+            self.assertEqual(promotion, None)
+            if(len(san) == 4):
+                self.assertEqual(pgn.move_to_san(board, W, m), san)
+        for san in ['Nd3', 'Nbd3', 'N4d3', 'Nd4']:
+            self.assertEqual(pgn.parse_san(board, W, san), None)
+
+        m, promotion = pgn.parse_san(board, W, 'O-O-O')
+        self.assertEqual(pgn.move_to_san(board, W, m), 'O-O-O')
+
+    def test_promotion(self):
+        """The piece of a promotion is read and written."""
+
+        board = rules.Board([])
+        board.set_fen("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1")
+        self.assertEqual(pgn.parse_san(board, W, 'b8'), None)
+        m, promotion = pgn.parse_san(board, W, 'b8=N')
+        self.assertEqual(promotion, rules.KNIGHT)
+        self.assertEqual(pgn.move_to_san(board, W, m, rules.QUEEN), 'b8=Q+')
+        self.assertEqual(pgn.parse_san(board, W, 'b8R')[1], rules.ROOK)
+
+
+class WriteGames(unittest.TestCase):
+    """Test writing the games."""
+
+    def test_same_text(self):
+        """The Opera Game is written as it was read."""
+
+        [(pgn_game, g)] = list(pgn.load_games(StringIO(OPERA_GAME)))
+        f = StringIO()
+        pgn.write_game(f, g, pgn_game.headers)
+        self.assertEqual(f.getvalue(), OPERA_GAME)
+
+    def test_promotion_and_fen(self):
+        """The choice of the promotion and the initial position are
+        written."""
+
+        g = game.Game(fen="7k/1P6/8/8/8/8/6p1/K7 b - - 0 30")
+        self.assertEqual(g.move(B, (7, 2), (7, 1)), game.PROMOTE)
+        g.promote((7, 1), rules.KNIGHT)
+        self.assertEqual(g.move(W, (2, 7), (2, 8)), game.PROMOTE)
+        g.promote((2, 8), rules.QUEEN)
+        f = StringIO()
+        pgn.write_game(f, g)
+        self.assertIn('[FEN "7k/1P6/8/8/8/8/6p1/K7 b - - 0 30"]\n',
+                      f.getvalue())
+        self.assertIn('\n30... g1=N 31. b8=Q+ *\n', f.getvalue())
+
+        f.seek(0)
+        [(pgn_game, g_2)] = list(pgn.load_games(f))
+        self.assertEqual(g_2.to_fen(), g.to_fen())
+        self.assertEqual(g_2.promotions, {0: rules.KNIGHT, 1: rules.QUEEN})
+
+    def test_rook_castling(self):
+        """A castling played with the rook is written as the castling of
+        its side."""
+
+        fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+        g = game.Game(fen=fen)
+        self.assertEqual(g.move(W, (8, 1), (6, 1)), game.VALID_MOVE)
+        self.assertEqual(g.move(B, (1, 8), (4, 8)), game.VALID_MOVE)
+        f = StringIO()
+        pgn.write_game(f, g)
+        self.assertIn('\n1. O-O O-O-O *\n', f.getvalue())
+
+        f.seek(0)
+        [(pgn_game, g_2)] = list(pgn.load_games(f))
+        self.assertEqual(g_2.to_fen(), g.to_fen())
+        self.assertEqual(g.to_fen().split()[0], "2kr3r/8/8/8/8/8/8/R4RK1")
+
+
+if __name__ == '__main__':
+    unittest.main()
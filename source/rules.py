@@ -4,6 +4,7 @@ This module contains the class Rules to know all the rules to play chess.
 """
 
 import sys
+import random
 from collections import namedtuple
 from math import copysign
 
@@ -11,6 +12,7 @@ from math import copysign
 BOARD_SIZE = 8
 WHITE_KING_POS = (5, 1)
 BLACK_KING_POS = (5, 8)
+KING_POS_X = 5
 
 KINGSIDE_KING_POS_X = 7
 QUEENSIDE_KING_POS_X = 3
@@ -52,24 +54,64 @@ CAPTURE_PROMOTION
 
 Move = namedtuple('Move', 'src, dest, type_')
 
+# Castling rights, stored as a 4-bit field on the board.
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = 15
+
+# The castling rights kept when a move starts from or arrives on a square.
+CASTLING_MASK = {WHITE_KING_POS: ALL_CASTLING - WHITE_KINGSIDE -
+                                                               WHITE_QUEENSIDE,
+                 (1, 1): ALL_CASTLING - WHITE_QUEENSIDE,
+                 (BOARD_SIZE, 1): ALL_CASTLING - WHITE_KINGSIDE,
+                 BLACK_KING_POS: ALL_CASTLING - BLACK_KINGSIDE -
+                                                               BLACK_QUEENSIDE,
+                 (1, BOARD_SIZE): ALL_CASTLING - BLACK_QUEENSIDE,
+                 (BOARD_SIZE, BOARD_SIZE): ALL_CASTLING - BLACK_KINGSIDE}
+
+KING_POS = {WHITE_COLOR: WHITE_KING_POS, BLACK_COLOR: BLACK_KING_POS}
+PAWN_DIRECTION = {WHITE_COLOR: WHITE_PAWN_DIRECTION,
+                  BLACK_COLOR: BLACK_PAWN_DIRECTION}
+PAWN_ROW = {WHITE_COLOR: WHITE_PAWN_ROW, BLACK_COLOR: BLACK_PAWN_ROW}
+PROMOTION_ROW = {WHITE_COLOR: BOARD_SIZE, BLACK_COLOR: 1}
+# For each color: the castling right, the column of the rook and the column
+# where the king goes.
+CASTLING_SIDES = {WHITE_COLOR: [(WHITE_KINGSIDE, BOARD_SIZE,
+                                                         KINGSIDE_KING_POS_X),
+                                (WHITE_QUEENSIDE, 1, QUEENSIDE_KING_POS_X)],
+                  BLACK_COLOR: [(BLACK_KINGSIDE, BOARD_SIZE,
+                                                         KINGSIDE_KING_POS_X),
+                                (BLACK_QUEENSIDE, 1, QUEENSIDE_KING_POS_X)]}
+
+# The letter of each piece type in the FEN notation, white pieces being in
+# upper case.
+PIECE_LETTERS = 'PBNRQK'
+INITIAL_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+COLOR_LETTERS = 'wb'
+CASTLING_LETTERS = [(WHITE_KINGSIDE, 'K'), (WHITE_QUEENSIDE, 'Q'),
+                    (BLACK_KINGSIDE, 'k'), (BLACK_QUEENSIDE, 'q')]
+
 """Functions"""
-def new_board(B, history):
-    """Initialize the chessboard which is a dict.
+def piece(type_, color):
+    """Return the shared Piece of type_ and color."""
 
-    The parameter history and B is used to bound the history and the class
-    Board to the pieces.
-    """
+    return PIECES[color][type_]
+
+def new_board():
+    """Initialize the chessboard which is a dict."""
     
     b = {}
 
     for x in xrange(1, BOARD_SIZE+1):
-        b[x, WHITE_PAWN_ROW] = Piece(PAWN, WHITE_COLOR, B, history).create()
-        b[x, BLACK_PAWN_ROW] = Piece(PAWN, BLACK_COLOR, B, history).create()
+        b[x, WHITE_PAWN_ROW] = PIECES[WHITE_COLOR][PAWN]
+        b[x, BLACK_PAWN_ROW] = PIECES[BLACK_COLOR][PAWN]
 
     for x, type_ in enumerate([ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP,
                                KNIGHT, ROOK], start=1):
-        b[x, 1] = Piece(type_, WHITE_COLOR, B, history).create()
-        b[x, BOARD_SIZE] = Piece(type_, BLACK_COLOR, B, history).create()
+        b[x, 1] = PIECES[WHITE_COLOR][type_]
+        b[x, BOARD_SIZE] = PIECES[BLACK_COLOR][type_]
 
     return b
     
@@ -100,33 +142,259 @@ def enemy_color(color):
         return WHITE_COLOR
     sys.exit("Unknown color while looking for the enemy color")
 
-    
+def on_board((x, y)):
+    """Return True if (x, y) is a square of the chessboard."""
+
+    return 1 <= x <= BOARD_SIZE and 1 <= y <= BOARD_SIZE
+
+def jump_table(offsets):
+    """Return a dict giving for each square the list of the squares reached
+    by adding one of the offsets."""
+
+    t = {}
+    for x in xrange(1, BOARD_SIZE + 1):
+        for y in xrange(1, BOARD_SIZE + 1):
+            t[x, y] = [(x + i, y + j) for (i, j) in offsets
+                       if on_board((x + i, y + j))]
+    return t
+
+def ray_table(directions):
+    """Return a dict giving for each square the list of the rays going out
+    of it in the directions. A ray is the list of the squares crossed, from
+    the nearest to the farthest, and empty rays are dropped."""
+
+    t = {}
+    for x in xrange(1, BOARD_SIZE + 1):
+        for y in xrange(1, BOARD_SIZE + 1):
+            t[x, y] = []
+            for (i, j) in directions:
+                ray = []
+                s_x, s_y = x + i, y + j
+                while(on_board((s_x, s_y))):
+                    ray.append((s_x, s_y))
+                    s_x, s_y = s_x + i, s_y + j
+                if(ray):
+                    t[x, y].append(ray)
+    return t
+
+
+"""Precomputed tables"""
+SQUARES = [(x, y) for x in xrange(1, BOARD_SIZE + 1)
+                  for y in xrange(1, BOARD_SIZE + 1)]
+KNIGHT_TARGETS = jump_table(KNIGHT_MOVES)
+KING_TARGETS = jump_table(CARDINAL_DIRECTION + FOUR_DIAGONALS)
+DIAGONAL_RAYS = ray_table(FOUR_DIAGONALS)
+CARDINAL_RAYS = ray_table(CARDINAL_DIRECTION)
+QUEEN_RAYS = ray_table(CARDINAL_DIRECTION + FOUR_DIAGONALS)
+SLIDER_RAYS = {BISHOP: DIAGONAL_RAYS, ROOK: CARDINAL_RAYS, QUEEN: QUEEN_RAYS}
+PAWN_TARGETS = {WHITE_COLOR: jump_table([(-1, WHITE_PAWN_DIRECTION),
+                                         (1, WHITE_PAWN_DIRECTION)]),
+                BLACK_COLOR: jump_table([(-1, BLACK_PAWN_DIRECTION),
+                                         (1, BLACK_PAWN_DIRECTION)])}
+
+# The random 64-bit numbers of the Zobrist keys. The seed is fixed so a key
+# means the same position from one run to another.
+zobrist_random = random.Random(2013)
+ZOBRIST_PIECES = [[dict((pos, zobrist_random.getrandbits(64))
+                        for pos in SQUARES)
+                   for type_ in xrange(6)]
+                  for color in xrange(2)]
+ZOBRIST_BLACK_TO_MOVE = zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING_RIGHTS = [zobrist_random.getrandbits(64) for i in xrange(4)]
+ZOBRIST_CASTLING = []
+for rights in xrange(ALL_CASTLING + 1):
+    k = 0
+    for i in xrange(4):
+        if(rights & (1 << i)):
+            k ^= ZOBRIST_CASTLING_RIGHTS[i]
+    ZOBRIST_CASTLING.append(k)
+# The number of the 'en passant' column, the first one being for no column.
+ZOBRIST_EP = [0] + [zobrist_random.getrandbits(64) for x in xrange(BOARD_SIZE)]
+
+
 """Classes"""
 class Board():
     """The class Board represents a board as a dict.
     
     It gathers all the methods wich only need the board.
+
+    The board keeps attack maps: for each color and each square, the set of
+    the positions of the pieces which control the square. They follow every
+    change of the dict, so who_controls() is only a look-up. They are built
+    the first time they are needed, so a board which finds the attacks in
+    another way never has them.
+
+    The positions of the pieces of each color, and of each king, are kept
+    the same way, so neither where_is_king() nor the move generation walk
+    on the whole board.
     """
-    
+
     def __init__(self, history):
-        self.dict_ = new_board(self, history)
+        self.history = history
+        self.kings = [None, None]               # [color]: position
+        self.positions = [set(), set()]         # [color]: positions
+        self.dict_ = {}
+        self.attack_maps = None     # [color][pos]: positions of attackers
+        self.attack_targets = None  # [pos]: squares controlled from pos
+        self.set_pieces(new_board())
+        self.castling = ALL_CASTLING
+        self.ep = None   # The square a pawn can go to by taking 'en passant'
+        self.zobrist = self.zobrist_key(WHITE_COLOR)
 
     """The class board acts like a dict"""
     def __getitem__(self, key):
         return self.dict_[key]
     def __setitem__(self, key, value):
-        self.dict_[key] = value
+        if(key in self.dict_):
+            Board.__delitem__(self, key)
+        self.__put(key, value)
+        self.zobrist ^= ZOBRIST_PIECES[value.color][value.type_][key]
+        if(self.attack_maps is not None):
+            self.__cut_rays(key)
+            self.__add_attacks(key, value)
     def __delitem__(self, key):
-        del self.dict_[key]
+        p = self.dict_.pop(key)
+        self.positions[p.color].discard(key)
+        if(self.kings[p.color] == key):
+            self.kings[p.color] = None
+        self.zobrist ^= ZOBRIST_PIECES[p.color][p.type_][key]
+        if(self.attack_maps is not None):
+            for pos in self.attack_targets.pop(key):
+                self.attack_maps[p.color][pos].discard(key)
+            self.__extend_rays(key)
     def __contains__(self, key):
         return key in self.dict_
 
+    def __put(self, pos, p):
+        # Put the piece p at pos, which is empty, in the dict and the lists
+        # of positions.
+        self.dict_[pos] = p
+        self.positions[p.color].add(pos)
+        if(p.type_ == KING):
+            self.kings[p.color] = pos
+
+    def set_pieces(self, pieces):
+        """Replace all the pieces of the board by the dict 'pieces' giving
+        the piece at each position.
+
+        The lists of positions are built again in one go, which is faster
+        than putting the pieces one by one, and the attack maps are dropped
+        until they are needed. The Zobrist key is not updated.
+        """
+
+        self.dict_.clear()
+        self.dict_.update(pieces)
+        kings, positions = self.kings, self.positions
+        kings[WHITE_COLOR] = kings[BLACK_COLOR] = None
+        positions[WHITE_COLOR].clear()
+        positions[BLACK_COLOR].clear()
+        for pos, p in pieces.iteritems():
+            positions[p.color].add(pos)
+            if(p.type_ == KING):
+                kings[p.color] = pos
+        self.attack_maps = None
+        self.attack_targets = None
+
+    def snapshot(self):
+        """Return what restore() needs to set the position back: the pieces,
+        the castling rights, the 'en passant' square and the Zobrist key."""
+
+        return (tuple(self.dict_.iteritems()), self.castling, self.ep,
+                self.zobrist)
+
+    def restore(self, snapshot):
+        """Set the position given by snapshot()."""
+
+        pieces, self.castling, self.ep, self.zobrist = snapshot
+        self.set_pieces(dict(pieces))
+
+    def __build_attack_maps(self):
+        # Build the attack maps of the pieces on the board.
+        self.attack_maps = [dict((pos, set()) for pos in SQUARES)
+                            for color in [WHITE_COLOR, BLACK_COLOR]]
+        self.attack_targets = {}
+        for pos, p in self.dict_.iteritems():
+            self.__add_attacks(pos, p)
+
+    def __add_attacks(self, pos, p):
+        # Add to the attack maps the squares controlled by the piece p
+        # standing at pos.
+        t = p.type_
+        if(t == PAWN):
+            targets = PAWN_TARGETS[p.color][pos]
+        elif(t == KNIGHT):
+            targets = KNIGHT_TARGETS[pos]
+        elif(t == KING):
+            targets = KING_TARGETS[pos]
+        else:
+            targets = []
+            for ray in SLIDER_RAYS[t][pos]:
+                for square in ray:
+                    targets.append(square)
+                    if(square in self.dict_):
+                        break
+        self.attack_targets[pos] = set(targets)
+        attackers = self.attack_maps[p.color]
+        for square in targets:
+            attackers[square].add(pos)
+
+    def __cut_rays(self, (x, y)):
+        # Remove from the attack maps the squares behind (x, y), where a
+        # piece just arrived, for the sliders controlling (x, y).
+        for color in [WHITE_COLOR, BLACK_COLOR]:
+            attackers = self.attack_maps[color]
+            for (a_x, a_y) in attackers[x, y]:
+                if(self.dict_[a_x, a_y].type_ not in SLIDER_RAYS):
+                    continue
+                i, j = cmp(x, a_x), cmp(y, a_y)
+                square = (x + i, y + j)
+                while(square in attackers):     # On the board
+                    attackers[square].discard((a_x, a_y))
+                    self.attack_targets[a_x, a_y].discard(square)
+                    if(square in self.dict_):
+                        break
+                    square = (square[0] + i, square[1] + j)
+
+    def __extend_rays(self, (x, y)):
+        # Add to the attack maps the squares behind (x, y), which a piece
+        # just left, for the sliders controlling (x, y).
+        for color in [WHITE_COLOR, BLACK_COLOR]:
+            attackers = self.attack_maps[color]
+            for (a_x, a_y) in attackers[x, y]:
+                if(self.dict_[a_x, a_y].type_ not in SLIDER_RAYS):
+                    continue
+                i, j = cmp(x, a_x), cmp(y, a_y)
+                square = (x + i, y + j)
+                while(square in attackers):     # On the board
+                    attackers[square].add((a_x, a_y))
+                    self.attack_targets[a_x, a_y].add(square)
+                    if(square in self.dict_):
+                        break
+                    square = (square[0] + i, square[1] + j)
+
+    def zobrist_key(self, color):
+        """Return the Zobrist key of the position, 'color' being the player
+        to move.
+
+        It is computed from scratch: the board keeps the key of the position
+        up to date in the attribute zobrist.
+        """
+
+        k = ZOBRIST_CASTLING[self.castling]
+        if(self.ep is not None):
+            k ^= ZOBRIST_EP[self.ep[0]]
+        if(color == BLACK_COLOR):
+            k ^= ZOBRIST_BLACK_TO_MOVE
+        for pos, p in self.dict_.iteritems():
+            k ^= ZOBRIST_PIECES[p.color][p.type_][pos]
+        return k
+
     def where_is_king(self, color):
         """Return the coordinates of the 'color' king."""
     
-        for (x, y), p in self.dict_.iteritems():
-            if(p.get_type() == KING and p.color == color):
-                return (x, y)
+        if(color in [WHITE_COLOR, BLACK_COLOR] and
+           self.kings[color] is not None):
+            return self.kings[color]
 
         # Error message
         if(color == WHITE_COLOR):
@@ -141,56 +409,9 @@ class Board():
         """Return the list of 'color' pieces position which control the
         coordinates (x, y)."""
         
-        l = []
-
-        # Is it controlled by a pawn?
-        for i in [-1, 1]:
-            pos = (x + i, y - Pawn(color).get_direction())
-            if(pos in self.dict_ and self.dict_[pos].color == color and
-               self.dict_[pos].get_type() == PAWN):
-                   l.append(pos)
-                   
-        # Is it controlled by a knight?
-        for (i, j) in KNIGHT_MOVES:
-            pos = (x + i, y +j)
-            if(pos in self.dict_ and self.dict_[pos].color == color and
-               self.dict_[pos].get_type() == KNIGHT):
-                   l.append(pos)
-            
-        # Is it controlled by a bishop/queen?
-        for (i, j) in FOUR_DIAGONALS:
-            tmp_x, tmp_y = x + i, y + j
-            while((tmp_x, tmp_y) not in self.dict_):
-                tmp_x, tmp_y = tmp_x + i, tmp_y + j
-                if(tmp_x not in range(1, BOARD_SIZE+1) or
-                   tmp_y not in range(1, BOARD_SIZE+1)):
-                    break
-            else:
-                if(self.dict_[tmp_x, tmp_y].color == color and
-                   self.dict_[tmp_x, tmp_y].get_type() in [BISHOP, QUEEN]):
-                       l.append((tmp_x, tmp_y))
-        
-        # Is it controlled by a rook/queen?
-        for (i, j) in CARDINAL_DIRECTION:
-            tmp_x, tmp_y = x + i, y + j
-            while((tmp_x, tmp_y) not in self.dict_):
-                tmp_x, tmp_y = tmp_x + i, tmp_y + j
-                if(tmp_x not in range(1, BOARD_SIZE+1) or
-                   tmp_y not in range(1, BOARD_SIZE+1)):
-                    break
-            else:
-                if(self.dict_[tmp_x, tmp_y].color == color and
-                   self.dict_[tmp_x, tmp_y].get_type() in [ROOK, QUEEN]):
-                       l.append((tmp_x, tmp_y))
-                       
-        # Is it controlled by a king?
-        for (i, j) in CARDINAL_DIRECTION + FOUR_DIAGONALS:
-            pos = (x + i, y + j)
-            if(pos in self.dict_ and self.dict_[pos].color == color and
-               self.dict_[pos].get_type() == KING):
-                   l.append(pos)
-
-        return l
+        if(self.attack_maps is None):
+            self.__build_attack_maps()
+        return list(self.attack_maps[color][x, y])
         
     def is_check(self, color):
         """Return True if the 'color' king is in check."""
@@ -226,7 +447,7 @@ class Board():
         e_x, e_y = l[0]
         l = self.who_controls((e_x, e_y), color)
         for (i, j) in l:
-            if(self.dict_[i, j].can_move((i, j), (e_x, e_y))):
+            if(self.can_move((i, j), (e_x, e_y))):
                 return False
 
         # Can the player block the check?
@@ -235,22 +456,19 @@ class Board():
         for (i, j) in get_path((x, y), (e_x, e_y)):
             l = self.who_controls((i, j), color)
             for (p_x, p_y) in l:
-                if(self.dict_[p_x, p_y].can_move((p_x, p_y), (i, j))):
+                if(self.can_move((p_x, p_y), (i, j))):
                     return False
         return True
 
     def is_pat(self, color):
-        """Return True if 'color' can't play any moves."""
+        """Return True if 'color' can't play any moves.
 
-        row = col = range(1, BOARD_SIZE + 1)
-        # NAIF METHOD, should be fix !
-        for (x, y), p in self.dict_.iteritems():
-            if(p.color == color):
-                l = [(i, j) for i in row for j in col if i != x or j != y]
-                for (i, j) in l:
-                    if(p.can_move((x, y), (i, j))):
-                        return False
+        It stops at the first legal move found, the king moves being tried
+        first.
+        """
 
+        for m in self.legal_moves(color):
+            return False
         return True
         
     def promote(self, (x, y), type_):
@@ -262,518 +480,563 @@ class Board():
         assert((x, y) in self.dict_ and self.dict_[x, y].get_type() == PAWN and
                type_ in [KNIGHT, BISHOP, ROOK, QUEEN])
 
-        c, h = self.dict_[x, y].color, self.dict_[x, y].history
-        self.dict_[x, y] = Piece(type_, c, self.dict_, h).create()
-
-
-class Piece():
-    """The class Piece should only be used to create a piece.
-
-    It give to all pieces the get_type(), is_pined() and
-    let_king_under_attack() methods.
-    """
-
-    def __init__(self, type_, color, board, history):
-        self.type_ = type_
-        self.color = color
-        self.board = board
-        self.history = history
-
-    def create(self):
-        """Return the type_ piece"""
-
-        if(self.type_ == PAWN):
-            return Pawn(self.color, self.board, self.history)
-        if(self.type_ == BISHOP):
-            return Bishop(self.color, self.board)
-        if(self.type_ == KNIGHT):
-            return Knight(self.color, self.board)
-        if(self.type_ == ROOK):
-            return Rook(self.color, self.board, self.history)
-        if(self.type_ == QUEEN):
-            return Queen(self.color, self.board)
-        if(self.type_ == KING):
-            return King(self.color, self.board, self.history)
-
-        sys.exit("Unknown piece type while creating it")
-
-    def get_type(self):
-        """Return the type of the piece."""
-        
-        return self.type_
-
-    def is_pined(self, (x, y)):
-        """Return True if the piece at (x, y) can't move because it protects
-        the king from being attacked."""
+        self[x, y] = PIECES[self.dict_[x, y].color][type_]
 
-        tmp = self.board[x, y]
-        c, e_c = tmp.color, enemy_color(tmp.color)
-        (k_x, k_y) = self.board.where_is_king(c)
-        l = self.board.who_controls((k_x, k_y), e_c)
+    def set_fen(self, fen):
+        """Set up the position described by the FEN string 'fen'.
 
-        del self.board[x, y]
-        l_2 = self.board.who_controls((k_x, k_y), e_c)
+        The pieces, the castling rights and the 'en passant' square are read
+        from the first four fields. Return the color of the player to move.
 
-        self.board[x, y] = tmp
-        return len(l_2) > len(l)
-
-    def let_king_under_attack(self, (s_x, s_y), (d_x, d_y)):
-        """Return True if the piece at (s_x, s_y) can't move at (d_x, d_y)
-        because it will let his king in check position."""
-
-        assert((s_x, s_y) in self.board)
-
-        c = self.board[s_x, s_y].color
-        e_c = enemy_color(c)
-        l = self.board.who_controls(self.board.where_is_king(c), e_c)          
-
-        if(len(l) >= 2):
-            return True
-
-        if(len(l) == 1):
-            if((d_x, d_y) == l[0] and not self.board[s_x, s_y].is_pined((s_x,
-                                                                        s_y))):
-                return False
-            else:
-                return True
-
-        if(not self.board[s_x, s_y].is_pined((s_x, s_y))):
-            return False
-        else:   # Search for the position of the piece who pins (s_x, s_y)
-            tmp = self.board[s_x, s_y]
-            del self.board[s_x, s_y]
-            
-            l = self.board.who_controls(self.board.where_is_king(c), e_c)
-            self.board[s_x, s_y] = tmp
-            assert(len(l) == 1)
-
-            if(l[0] == (d_x, d_y)):
-                return False
-            else:
-                return True
-                
-
-class Pawn(Piece):
-    """The class Pawn represents a pawn in chess game.
-
-    A pawn can move forward one square, if that square is unoccupied. If it
-    has not yet moved, each pawn has the option of moving two squares forward
-    provided both squares in front of the pawn are unoccupied.
-    A pawn cannot move backwards.
-    Pawns are the only pieces that capture differently from how they move.
-    They can capture an enemy piece on either of the two squares diagonally in
-    front of them but cannot move to these spaces if they are vacant.
-    Pawn have two special moves: promotion and 'en passant'.
-    """
-
-    def __init__(self, color, board={}, history=[]):
-        self.color = color
-        self.board = board
-        self.history = history
-        self.type_ = PAWN
-
-    def get_direction(self):
-        """Return the pawn direction depending on his color."""
-        
-        if(self.color == WHITE_COLOR):
-            return WHITE_PAWN_DIRECTION
-        if(self.color == BLACK_COLOR):
-            return BLACK_PAWN_DIRECTION
-        sys.exit("Unknown color while looking for the direction of the pawn")
-
-    def get_initial_row(self):
-        """Return the initial row of the pawn."""
-
-        if(self.color == WHITE_COLOR):
-            return WHITE_PAWN_ROW
-        if(self.color == BLACK_COLOR):
-            return BLACK_PAWN_ROW
-        sys.exit("Unknown color while looking for the initial row of pawns")
-
-    def get_promotion_row(self):
-        """Return the promotion row of the pawn"""
-
-        if(self.color == WHITE_COLOR):
-            return BOARD_SIZE
-        if(self.color == BLACK_COLOR):
-            return 1
-        sys.exit("Unknown color while looking for the promotion row of pawns")
-
-    def can_move(self, (s_x, s_y), (d_x, d_y)):
-        """Say if the pawn at (s_x, s_y) can go to (d_x, d_y).
-
-        Pawn have two special moves called 'en passant' and promotion.
-        Return the Move if the pawn can, else return None.
+        The pieces are shared by all the positions, and the dict and the
+        lists of positions of the board are filled again in place, so that a
+        board can be used again and again to load many positions.
         """
-        
-        assert(self.board[s_x, s_y].get_type() == self.type_ and
-               self.board[s_x, s_y].color == self.color and
-               s_x in range(1, BOARD_SIZE + 1) and
-               s_y in range(1, BOARD_SIZE + 1) and
-               d_x in range(1, BOARD_SIZE + 1) and
-               d_y in range(1, BOARD_SIZE + 1) and
-               (s_x, s_y) != (d_x, d_y))
-        if(self.let_king_under_attack((s_x, s_y), (d_x, d_y))):
-            return None
-        
-        d = self.get_direction()
-
-        # Pawn moves two squares forward
-        if(s_x == d_x and (d_y - s_y) ==  2 * d and
-           s_y == self.get_initial_row()):
-            if (d_x, d_y) not in self.board and (d_x, d_y-d) not in self.board:
-                return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
-            else:
-                return None
 
-        # Pawn moves one square forward
-        if(s_x == d_x and (d_y - s_y) ==  d and (d_x, d_y) not in self.board):
-            if(d_y == self.get_promotion_row()):
-                return Move((s_x, s_y), (d_x, d_y), PROMOTION)
+        fields = fen.split()
+        dict_, positions, kings = self.dict_, self.positions, self.kings
+        dict_.clear()
+        positions[WHITE_COLOR].clear()
+        positions[BLACK_COLOR].clear()
+        kings[WHITE_COLOR] = kings[BLACK_COLOR] = None
+        zobrist = 0
+        for i, row in enumerate(fields[0].split('/')):
+            y, x = BOARD_SIZE - i, 1
+            for char in row:
+                skip, p, keys = FEN_CHARS[char]
+                if(p is not None):
+                    pos = x, y
+                    dict_[pos] = p
+                    positions[p.color].add(pos)
+                    if(p.type_ == KING):
+                        kings[p.color] = pos
+                    zobrist ^= keys[pos]
+                x += skip
+        self.attack_maps = None
+        self.attack_targets = None
+
+        self.castling = 0
+        if(len(fields) > 2):
+            for right, char in CASTLING_LETTERS:
+                if(char in fields[2]):
+                    self.castling |= right
+        self.ep = None
+        if(len(fields) > 3 and fields[3] != '-'):
+            x, y = ord(fields[3][0]) - ord('a') + 1, int(fields[3][1])
+            if(y == 3):
+                self.ep = self.__en_passant_square(((x, 2), (x, 4),
+                                                    NORMAL_MOVE))
             else:
-                return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
+                self.ep = self.__en_passant_square(((x, 7), (x, 5),
+                                                    NORMAL_MOVE))
+
+        color = WHITE_COLOR
+        zobrist ^= ZOBRIST_CASTLING[self.castling]
+        if(self.ep is not None):
+            zobrist ^= ZOBRIST_EP[self.ep[0]]
+        if(len(fields) > 1 and fields[1] == COLOR_LETTERS[BLACK_COLOR]):
+            color = BLACK_COLOR
+            zobrist ^= ZOBRIST_BLACK_TO_MOVE
+        self.zobrist = zobrist
+        return color
+
+    def get_fen(self, color, halfmove_clock=0, fullmove_number=1):
+        """Return the FEN string of the position, 'color' being the player
+        to move.
+
+        The 'en passant' square is only written if a pawn can take on it.
+        """
 
-        # Pawn moves one square diagonally
-        if(abs(s_x - d_x) == 1 and (d_y - s_y) ==  d):
-            if((d_x, d_y) in self.board and self.board[d_x, d_y].color ==
-                                                      enemy_color(self.color)):
-                if(d_y == self.get_promotion_row()):
-                    return Move((s_x, s_y), (d_x, d_y), CAPTURE_PROMOTION)
+        rows = []
+        for y in xrange(BOARD_SIZE, 0, -1):
+            row, empty = '', 0
+            for x in xrange(1, BOARD_SIZE + 1):
+                p = self.dict_.get((x, y))
+                if(p is None):
+                    empty += 1
+                    continue
+                if(empty):
+                    row += str(empty)
+                    empty = 0
+                if(p.color == WHITE_COLOR):
+                    row += PIECE_LETTERS[p.type_]
                 else:
-                    return Move((s_x, s_y), (d_x, d_y), CAPTURE)
-            if((d_x, d_y) not in self.board and self.history[-1] ==
-               Move((d_x, d_y + d), (d_x, d_y - d), NORMAL_MOVE)):
-                return Move((s_x, s_y), (d_x, d_y), EN_PASSANT)
-            else:
-                return None
-        return None
-
-class Bishop(Piece):
-    """The class Bishop represents a bishop in chess Game.
-
-    The bishop moves any number of vacant squares in any diagonal direction.
-    """
-
-    def __init__(self, color, board):
-        self.color = color
-        self.board = board
-        self.type_ = BISHOP
-
-    def can_move(self, (s_x, s_y), (d_x, d_y)):
-        """Say if the bishop at (s_x, s_y) can go to (d_x, d_y).
-
-        Return the Move if the bishop can, else return None.
+                    row += PIECE_LETTERS[p.type_].lower()
+            if(empty):
+                row += str(empty)
+            rows.append(row)
+
+        castling = ''.join(char for right, char in CASTLING_LETTERS
+                           if self.castling & right) or '-'
+        ep = '-'
+        if(self.ep is not None):
+            ep = chr(ord('a') + self.ep[0] - 1) + str(self.ep[1])
+        return "%s %s %s %s %d %d" % ('/'.join(rows), COLOR_LETTERS[color],
+                                      castling, ep, halfmove_clock,
+                                      fullmove_number)
+
+    def make(self, (src, dest, type_), promotion=None):
+        """Play the Move (src, dest, type_) on the board.
+
+        Nothing is checked: the move must be valid. The pawn of a promotion
+        becomes a 'promotion' piece, or stays a pawn until promote() is called
+        if promotion is None. Return the token to give to unmake() to take
+        the move back.
         """
 
-        assert(self.board[s_x, s_y].get_type() == self.type_ and
-               self.board[s_x, s_y].color == self.color and
-               s_x in range(1, BOARD_SIZE + 1) and
-               s_y in range(1, BOARD_SIZE + 1) and
-               d_x in range(1, BOARD_SIZE + 1) and
-               d_y in range(1, BOARD_SIZE + 1) and
-               (s_x, s_y) != (d_x, d_y))
-        if(self.let_king_under_attack((s_x, s_y), (d_x, d_y))):
-            return None
-
-        if(d_x == s_x or abs(float((d_y - s_y))/(d_x - s_x)) != 1.):
-            return None
-
-        for (i, j) in get_path((s_x, s_y), (d_x, d_y)):
-            if((i, j) in self.board):
-                return None
-
-        if((d_x, d_y) not in self.board):
-            return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
-
-        if(self.board[d_x, d_y].color == enemy_color(self.color)):
-            return Move((s_x, s_y), (d_x, d_y), CAPTURE)
-
-        return None
-            
-        
-class Knight(Piece):
-    """The class Knight represents a knight in chess game.
-
-    The knight moves two squares horizontally then one square vertically, or
-    one square horizontally then two squares vertically. Its move is not
-    blocked by other pieces: it jumps to the new location.
-    """
-
-    def __init__(self, color, board):
-        self.color = color
-        self.board = board
-        self.type_ = KNIGHT
-
-    def can_move(self, (s_x, s_y), (d_x, d_y)):
-        """Say if the knight at (s_x, s_y) can go to (d_x, d_y).
-
-        Return the Move if the knight can, else return None.
+        p = self.dict_[src]
+        taken_pos = dest
+        if(type_ == EN_PASSANT):
+            taken_pos = (dest[0], src[1])
+        taken = self.dict_.get(taken_pos)
+        if(taken is not None):
+            del self[taken_pos]
+
+        del self[src]
+        self[dest] = p
+        second = None   # The move of the second piece of a castling
+        if(type_ == CASTLING):
+            second = self.__castling_second_move(p.type_, dest)
+            self[second[1]] = self.dict_[second[0]]
+            del self[second[0]]
+        if(promotion is not None):
+            self.promote(dest, promotion)
+
+        token = (src, dest, p, taken, taken_pos, second, self.castling,
+                 self.ep)
+        self.zobrist ^= self.__state_key()
+        self.castling &= self.__castling_mask((src, dest, type_))
+        self.ep = self.__en_passant_square((src, dest, type_))
+        self.zobrist ^= self.__state_key() ^ ZOBRIST_BLACK_TO_MOVE
+        return token
+
+    def unmake(self, token):
+        """Take back the move which returned 'token' when played by make().
+
+        The moves played after it must have been taken back before.
         """
 
-        assert(self.board[s_x, s_y].get_type() == self.type_ and
-               self.board[s_x, s_y].color == self.color and
-               s_x in range(1, BOARD_SIZE + 1) and
-               s_y in range(1, BOARD_SIZE + 1) and
-               d_x in range(1, BOARD_SIZE + 1) and
-               d_y in range(1, BOARD_SIZE + 1) and
-               (s_x, s_y) != (d_x, d_y))
-        if(self.let_king_under_attack((s_x, s_y), (d_x, d_y))):
+        self.zobrist ^= self.__state_key()
+        src, dest, p, taken, taken_pos, second, self.castling, self.ep = token
+        self.zobrist ^= self.__state_key() ^ ZOBRIST_BLACK_TO_MOVE
+        if(second is not None):
+            self[second[0]] = self.dict_[second[1]]
+            del self[second[1]]
+        del self[dest]
+        self[src] = p
+        if(taken is not None):
+            self[taken_pos] = taken
+
+    def __state_key(self):
+        # Return the part of the Zobrist key given by the castling rights and
+        # the 'en passant' square.
+        if(self.ep is None):
+            return ZOBRIST_CASTLING[self.castling]
+        return ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_EP[self.ep[0]]
+
+    def __castling_second_move(self, type_, (x, y)):
+        # Return the (src, dest) of the rook, or of the king, once the king,
+        # or the rook, of type_ arrived at (x, y) by castling.
+        if(type_ == KING):
+            if(x == KINGSIDE_KING_POS_X):
+                return (BOARD_SIZE, y), (KINGSIDE_ROOK_POS_X, y)
+            return (1, y), (QUEENSIDE_ROOK_POS_X, y)
+        if(x == KINGSIDE_ROOK_POS_X):
+            return (KING_POS_X, y), (KINGSIDE_KING_POS_X, y)
+        return (KING_POS_X, y), (QUEENSIDE_KING_POS_X, y)
+
+    def __castling_mask(self, (src, dest, type_)):
+        # Return the castling rights kept after the Move (src, dest, type_).
+        mask = (CASTLING_MASK.get(src, ALL_CASTLING) &
+                CASTLING_MASK.get(dest, ALL_CASTLING))
+        if(type_ == CASTLING):  # The rook may be the piece which moved
+            if(dest[1] == 1):
+                mask &= CASTLING_MASK[WHITE_KING_POS]
+            else:
+                mask &= CASTLING_MASK[BLACK_KING_POS]
+        return mask
+
+    def __en_passant_square(self, (src, dest, type_)):
+        # Return the square where a pawn can take 'en passant' just after the
+        # Move (src, dest, type_), or None. There is no such square if no
+        # enemy pawn stands next to the pawn, so that the same positions have
+        # the same key.
+        if(type_ != NORMAL_MOVE or abs(dest[1] - src[1]) != 2):
             return None
-
-        if((d_x, d_y) not in self.board):
-            return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
-        if(self.board[d_x, d_y].color == enemy_color(self.color)):
-            return Move((s_x, s_y), (d_x, d_y), CAPTURE)
-            
+        p = self.dict_.get(dest)
+        if(p is None or p.type_ != PAWN):
+            return None
+        for pos in ((dest[0] - 1, dest[1]), (dest[0] + 1, dest[1])):
+            q = self.dict_.get(pos)
+            if(q is not None and q.type_ == PAWN and q.color != p.color):
+                return (dest[0], (src[1] + dest[1]) // 2)
         return None
 
-class Rook(Piece):
-    """The class Rook represents a rook in chess game.
-    The rook moves any number of vacant squares vertically or horizontally.
-    Rook have a special move shared with the king called castling.
-    """
-
-    def __init__(self, color, board, history):
-        self.color = color
-        self.board = board
-        self.history = history
-        self.type_ = ROOK
-
-    def castling(self, (x, y)):
-        """Move the king to perform a castling while the rook is at (x, y).
+    def is_attacked(self, (x, y), color):
+        """Return True if a 'color' piece controls the coordinates (x, y).
 
-        It assumes that the player can castling.
+        It is who_controls() for when the list of pieces is not needed.
         """
 
-        assert(y in [1, BOARD_SIZE] and (x, y) in self.board and
-               self.board[x, y].get_type() == ROOK and
-               self.board[x, y].color == self.color and
-               x in [KINGSIDE_ROOK_POS_X, QUEENSIDE_ROOK_POS_X])
-
-        k_pos = King(self.color).get_initial_pos()
-        assert(k_pos in self.board)
-               
-        if(x == KINGSIDE_ROOK_POS_X):
-            self.board[KINGSIDE_KING_POS_X, y] = self.board[k_pos]
-            del self.board[k_pos]
-
-        if(x == QUEENSIDE_ROOK_POS_X):
-            self.board[QUEENSIDE_KING_POS_X, y] = self.board[k_pos]
-            del self.board[k_pos]
+        if(self.attack_maps is None):
+            self.__build_attack_maps()
+        return len(self.attack_maps[color][x, y]) != 0
+
+    def __pins(self, (k_x, k_y), color):
+        # Return a dict giving for each pined 'color' piece the direction, as
+        # seen from the king at (k_x, k_y), in which it is still free to move.
+        pins = {}
+        for rays, types in ((DIAGONAL_RAYS, (BISHOP, QUEEN)),
+                            (CARDINAL_RAYS, (ROOK, QUEEN))):
+            for ray in rays[k_x, k_y]:
+                shield = None
+                for pos in ray:
+                    if(pos not in self.dict_):
+                        continue
+                    p = self.dict_[pos]
+                    if(shield is None and p.color == color):
+                        shield = pos
+                        continue
+                    if(shield is not None and p.color != color and
+                       p.type_ in types):
+                        pins[shield] = (ray[0][0] - k_x, ray[0][1] - k_y)
+                    break
+        return pins
 
-    def can_castling(self, (s_x, s_y), (d_x, d_y)):
-        """Return True if the rook can castling.
+    def legal_moves(self, color):
+        """Generate all the legal Moves of the 'color' player.
 
-        It uses the can_castling() method of the king.
+        The moves come from the movement patterns of the pieces, the pins
+        and the checks being computed once for the whole position. A castling
+        is given as a king move and each promotion as a single PROMOTION or
+        CAPTURE_PROMOTION Move, the type of the new piece being chosen later.
         """
 
-        if(self.color == WHITE_COLOR):
-            x, y = WHITE_KING_POS
-        elif(self.color == BLACK_COLOR):
-            x, y = BLACK_KING_POS
-        else:
-            sys.exit("Unknown color while looking for if the rook can castle")
+        b = self.dict_
+        e_c = enemy_color(color)
+        k_x, k_y = k_pos = self.where_is_king(color)
+        checkers = self.who_controls(k_pos, e_c)
+        pins = self.__pins(k_pos, color)
+
+        # The squares where a piece other than the king must go to parry the
+        # check, None if there is no check.
+        targets = None
+        if(len(checkers) >= 2):
+            targets = set()
+        elif(len(checkers) == 1):
+            targets = set(checkers)
+            if(b[checkers[0]].type_ in SLIDER_RAYS):
+                targets.update(get_path(k_pos, checkers[0]))
+
+        def is_legal(src, dest):
+            # Say if a piece other than the king can go from src to dest
+            # without letting his king in check.
+            if(targets is not None and dest not in targets):
+                return False
+            if(src in pins):
+                i, j = pins[src]
+                return (dest[0] - k_x) * j == (dest[1] - k_y) * i
+            return True
 
-        if((x, y) not in self.board or self.board[x, y].get_type() != KING or
-           self.board[x, y].color != self.color):
-            return False
+        # The king can't step back along the ray of a slider giving check:
+        # the square behind him is attacked once he left it.
+        behind = [(k_x + cmp(k_x, c_x), k_y + cmp(k_y, c_y))
+                  for c_x, c_y in checkers if b[c_x, c_y].type_ in SLIDER_RAYS]
+        for dest in KING_TARGETS[k_pos]:
+            p = b.get(dest)
+            if(p is not None and p.color == color or
+               dest in behind or self.is_attacked(dest, e_c)):
+                continue
+            if(p is None):
+                yield Move(k_pos, dest, NORMAL_MOVE)
+            else:
+                yield Move(k_pos, dest, CAPTURE)
+
+        if(len(checkers) >= 2):
+            return
+
+        # Castling
+        if(self.castling and not checkers and k_pos == KING_POS[color]):
+            for right, rook_x, king_x in CASTLING_SIDES[color]:
+                if(not self.castling & right):
+                    continue
+                rook = b.get((rook_x, k_y))
+                if(rook is None or rook.type_ != ROOK or rook.color != color):
+                    continue
+                path = get_path(k_pos, (rook_x, k_y))
+                if(any(pos in b for pos in path)):
+                    continue
+                if(any(self.is_attacked(pos, e_c) for pos in
+                       get_path(k_pos, (king_x, k_y)) + [(king_x, k_y)])):
+                    continue
+                yield Move(k_pos, (king_x, k_y), CASTLING)
+
+        for src in list(self.positions[color]):
+            p = b[src]
+            t = p.type_
+            x, y = src
+
+            if(t == PAWN):
+                if(color == WHITE_COLOR):
+                    d, row, last_row = (WHITE_PAWN_DIRECTION, WHITE_PAWN_ROW,
+                                        BOARD_SIZE)
+                else:
+                    d, row, last_row = BLACK_PAWN_DIRECTION, BLACK_PAWN_ROW, 1
+                dest = (x, y + d)
+                if(dest not in b):
+                    if(is_legal(src, dest)):
+                        if(y + d == last_row):
+                            yield Move(src, dest, PROMOTION)
+                        else:
+                            yield Move(src, dest, NORMAL_MOVE)
+                    dest = (x, y + 2*d)
+                    if(y == row and dest not in b and is_legal(src, dest)):
+                        yield Move(src, dest, NORMAL_MOVE)
+                for dest in ((x - 1, y + d), (x + 1, y + d)):
+                    q = b.get(dest)
+                    if(q is not None):
+                        if(q.color == e_c and is_legal(src, dest)):
+                            if(y + d == last_row):
+                                yield Move(src, dest, CAPTURE_PROMOTION)
+                            else:
+                                yield Move(src, dest, CAPTURE)
+                    elif(dest == self.ep and (dest[0], y) in b and
+                         b[dest[0], y].color == e_c and
+                         self.__en_passant_is_legal(src, dest, k_pos)):
+                        yield Move(src, dest, EN_PASSANT)
+
+            elif(t == KNIGHT):
+                for dest in KNIGHT_TARGETS[src]:
+                    q = b.get(dest)
+                    if(q is None):
+                        if(is_legal(src, dest)):
+                            yield Move(src, dest, NORMAL_MOVE)
+                    elif(q.color == e_c and is_legal(src, dest)):
+                        yield Move(src, dest, CAPTURE)
+
+            elif(t != KING):
+                for ray in SLIDER_RAYS[t][src]:
+                    for dest in ray:
+                        q = b.get(dest)
+                        if(q is None):
+                            if(is_legal(src, dest)):
+                                yield Move(src, dest, NORMAL_MOVE)
+                        else:
+                            if(q.color == e_c and is_legal(src, dest)):
+                                yield Move(src, dest, CAPTURE)
+                            break
+
+    def __en_passant_is_legal(self, src, dest, k_pos):
+        # Say if the pawn at src can take 'en passant' by going to dest,
+        # playing the move on the board to look at the king at k_pos.
+        taken = (dest[0], src[1])
+        pawn, enemy = self[src], self[taken]
+        del self[src]
+        del self[taken]
+        self[dest] = pawn
+        attacked = self.is_attacked(k_pos, enemy.color)
+        del self[dest]
+        self[src] = pawn
+        self[taken] = enemy
+        return not attacked
 
-        if(d_x == KINGSIDE_ROOK_POS_X and d_y == y):
-            return self.board[x, y].can_castling((x, y), (KINGSIDE_KING_POS_X,
-                                                                          d_y))
-        if(d_x == QUEENSIDE_ROOK_POS_X and d_y == y):
-            return self.board[x, y].can_castling((x, y), (QUEENSIDE_KING_POS_X,
-                                                                          d_y))
-        return False
-        
     def can_move(self, (s_x, s_y), (d_x, d_y)):
-        """Say if the rook at (s_x, s_y) can go to (d_x, d_y).
+        """Say if the piece at (s_x, s_y) can go to (d_x, d_y).
 
-        Return the Move if the rook can, else return None.
+        A rook going next to its king, or a king going two squares aside, is
+        a castling if the player can castle. Return the Move if the piece
+        can, else return None.
         """
 
-        assert(self.board[s_x, s_y].get_type() == self.type_ and
-               self.board[s_x, s_y].color == self.color and
-               s_x in range(1, BOARD_SIZE + 1) and
-               s_y in range(1, BOARD_SIZE + 1) and
-               d_x in range(1, BOARD_SIZE + 1) and
-               d_y in range(1, BOARD_SIZE + 1) and
+        assert((s_x, s_y) in self.dict_ and on_board((d_x, d_y)) and
                (s_x, s_y) != (d_x, d_y))
-        if(self.let_king_under_attack((s_x, s_y), (d_x, d_y))):
-            return None
 
-        if(s_x != d_x and s_y != d_y):
+        p = self.dict_[s_x, s_y]
+        t = p.type_
+        if(t == KING):
+            return self.__king_move(p, (s_x, s_y), (d_x, d_y))
+        if(self.let_king_under_attack((s_x, s_y), (d_x, d_y))):
             return None
+        if(t == PAWN):
+            return self.__pawn_move(p, (s_x, s_y), (d_x, d_y))
 
-        if(self.can_castling((s_x, s_y), (d_x, d_y))):
-            return Move((s_x, s_y), (d_x, d_y), CASTLING)
-            
-        for (i, j) in get_path((s_x, s_y), (d_x, d_y)):
-            if((i, j) in self.board):
+        if(t == KNIGHT):
+            if((d_x - s_x, d_y - s_y) not in KNIGHT_MOVES):
                 return None
+        else:
+            straight = s_x == d_x or s_y == d_y
+            diagonal = abs(d_x - s_x) == abs(d_y - s_y)
+            if((t == BISHOP and not diagonal) or
+               (t == ROOK and not straight) or
+               (t == QUEEN and not straight and not diagonal)):
+                return None
+            if(t == ROOK and self.__rook_can_castle(p, (d_x, d_y))):
+                return Move((s_x, s_y), (d_x, d_y), CASTLING)
+            for (i, j) in get_path((s_x, s_y), (d_x, d_y)):
+                if((i, j) in self.dict_):
+                    return None
 
-        if((d_x, d_y) not in self.board):
+        if((d_x, d_y) not in self.dict_):
             return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
-
-        if(self.board[d_x, d_y].color == enemy_color(self.color)):
+        if(self.dict_[d_x, d_y].color != p.color):
             return Move((s_x, s_y), (d_x, d_y), CAPTURE)
-
         return None
 
-class Queen(Piece):
-    """The class Queen represents a queen in chess game.
+    def __pawn_move(self, p, (s_x, s_y), (d_x, d_y)):
+        # Return the Move of the pawn p from (s_x, s_y) to (d_x, d_y), or
+        # None. Pawn have two special moves: 'en passant' and promotion.
+        d = PAWN_DIRECTION[p.color]
+        promotion_row = PROMOTION_ROW[p.color]
 
-    The queen can move any number of vacant squares diagonally, horizontally,
-    or vertically.
-    """
-    
-    def __init__(self, color, board):
-        self.color = color
-        self.board = board
-        self.type_ = QUEEN
-        
-    def can_move(self, (s_x, s_y), (d_x, d_y)):
-        """Say if the queen at (s_x, s_y) can go to (d_x, d_y).
+        # Pawn moves two squares forward
+        if(s_x == d_x and (d_y - s_y) == 2 * d and
+           s_y == PAWN_ROW[p.color]):
+            if((d_x, d_y) not in self.dict_ and
+               (d_x, d_y - d) not in self.dict_):
+                return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
+            return None
 
-        Return the Move if the queen can, else return None.
-        """
+        # Pawn moves one square forward
+        if(s_x == d_x and (d_y - s_y) == d and (d_x, d_y) not in self.dict_):
+            if(d_y == promotion_row):
+                return Move((s_x, s_y), (d_x, d_y), PROMOTION)
+            return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
 
-        assert(self.board[s_x, s_y].get_type() == self.type_ and
-               self.board[s_x, s_y].color == self.color and
-               s_x in range(1, BOARD_SIZE + 1) and
-               s_y in range(1, BOARD_SIZE + 1) and
-               d_x in range(1, BOARD_SIZE + 1) and
-               d_y in range(1, BOARD_SIZE + 1) and
-               (s_x, s_y) != (d_x, d_y))
-        if(self.let_king_under_attack((s_x, s_y), (d_x, d_y))):
-            return None
+        # Pawn moves one square diagonally
+        if(abs(s_x - d_x) == 1 and (d_y - s_y) == d):
+            if((d_x, d_y) in self.dict_ and
+               self.dict_[d_x, d_y].color != p.color):
+                if(d_y == promotion_row):
+                    return Move((s_x, s_y), (d_x, d_y), CAPTURE_PROMOTION)
+                return Move((s_x, s_y), (d_x, d_y), CAPTURE)
+            if((d_x, d_y) not in self.dict_ and self.ep == (d_x, d_y)):
+                return Move((s_x, s_y), (d_x, d_y), EN_PASSANT)
+        return None
 
-        if(s_x != d_x and s_y != d_y and abs(float((d_y - s_y))/(d_x - s_x)) !=
-                                                                           1.):
+    def __king_move(self, p, (s_x, s_y), (d_x, d_y)):
+        # Return the Move of the king p from (s_x, s_y) to (d_x, d_y), or
+        # None.
+        if(self.can_castle((s_x, s_y), (d_x, d_y))):
+            return Move((s_x, s_y), (d_x, d_y), CASTLING)
 
+        if(abs(s_x - d_x) > 1 or abs(s_y - d_y) > 1):
+            return None
+        if(self.is_attacked((d_x, d_y), enemy_color(p.color))):
             return None
 
-        for (i, j) in get_path((s_x, s_y), (d_x, d_y)):
-            if((i, j) in self.board):
-                return None
-
-        if((d_x, d_y) not in self.board):
+        if((d_x, d_y) not in self.dict_):
             return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
-
-        if(self.board[d_x, d_y].color == enemy_color(self.color)):
+        if(self.dict_[d_x, d_y].color != p.color):
             return Move((s_x, s_y), (d_x, d_y), CAPTURE)
-
         return None
 
-               
-class King(Piece):
-    """The class King represents a king in chess game.
-
-    The king can move exactly one square horizontally, vertically, or
-    diagonally.
-    The king have a special move shared with the rook called castling.
-    """
-    
-    def __init__(self, color, board={}, history=[]):
-        self.color = color
-        self.board = board
-        self.history = history
-        self.type_ = KING
+    def __rook_can_castle(self, p, (d_x, d_y)):
+        # Return True if the rook p going to (d_x, d_y) castles, the king
+        # going next to it.
+        k_pos = KING_POS[p.color]
+        k = self.dict_.get(k_pos)
+        if(k is None or k.type_ != KING or k.color != p.color or
+           d_y != k_pos[1]):
+            return False
+        if(d_x == KINGSIDE_ROOK_POS_X):
+            return self.can_castle(k_pos, (KINGSIDE_KING_POS_X, d_y))
+        if(d_x == QUEENSIDE_ROOK_POS_X):
+            return self.can_castle(k_pos, (QUEENSIDE_KING_POS_X, d_y))
+        return False
 
-    def castling(self, (x, y)):
-        """Move the rook to perform a castling while the king is at (x, y).
+    def can_castle(self, (s_x, s_y), (d_x, d_y)):
+        """Return True if the king at (s_x, s_y) can castle by going to
+        (d_x, d_y).
 
-        It is assumed that the player can castling.
+        Whether the king or the rook moved or the rook was taken is told by
+        the castling rights of the board, which the moves update, instead of
+        the history.
         """
 
-        assert(y in [1, BOARD_SIZE] and (x, y) in self.board and
-               self.board[x, y].get_type() == KING and
-               self.board[x, y].color == self.color and
-               x in [KINGSIDE_KING_POS_X, QUEENSIDE_KING_POS_X])
-
-        if(x == KINGSIDE_KING_POS_X):
-            assert((BOARD_SIZE, y) in self.board and
-                   (KINGSIDE_ROOK_POS_X, y) not in self.board)
-            
-            self.board[KINGSIDE_ROOK_POS_X, y] = self.board[BOARD_SIZE, y]
-            del self.board[BOARD_SIZE, y]
-
-        if(x == QUEENSIDE_KING_POS_X):
-            assert((1, y) in self.board and
-                   (QUEENSIDE_ROOK_POS_X, y) not in self.board)
-            
-            self.board[QUEENSIDE_ROOK_POS_X, y] = self.board[1, y]
-            del self.board[1, y]
-
-    def get_initial_pos(self):
-        """Return the initial coordinate of the king."""
-        if(self.color == WHITE_COLOR):
-            return WHITE_KING_POS
-        if(self.color == BLACK_COLOR):
-            return BLACK_KING_POS
-        sys.exit("Unknown color while looking for the initial king position")
-
-    def can_castling(self, (s_x, s_y), (d_x, d_y)):
-        """Return True if the king can castling."""
-
-        if(abs(s_x - d_x) != 2 or s_y != d_y or self.board.is_check(self.color)
-           or (s_x, s_y) != self.get_initial_pos()):
+        color = self.dict_[s_x, s_y].color
+        if(abs(s_x - d_x) != 2 or s_y != d_y or
+           (s_x, s_y) != KING_POS[color] or self.is_check(color)):
             return False
-
-        # Get the coordinate of the rook
-        y = d_y
-        if(d_x == KINGSIDE_KING_POS_X):
-            x = 1
-        elif(d_x == QUEENSIDE_KING_POS_X):
-            x = BOARD_SIZE
+        for right, rook_x, king_x in CASTLING_SIDES[color]:
+            if(d_x == king_x):
+                break
         else:
-            sys.exit("Unknown castling move")
-        if((x, y) not in self.board or self.board[x, y].get_type() != ROOK or
-           self.board[x, y].color != self.color):
             return False
-        
-        # Did the king or the rook move?
-        for m in self.history:
-            if(m.src == ((x, y) or (s_x, s_y))):
-                return False
+        if(not self.castling & right):
+            return False
+        rook = self.dict_.get((rook_x, d_y))
+        if(rook is None or rook.type_ != ROOK or rook.color != color):
+            return False
 
         # Are the squares that the king will pass through, empty and not under
         # enemy control?
         for (i, j) in get_path((s_x, s_y), (d_x, d_y)) + [(d_x, d_y)]:
-            if((i, j) in self.board or self.board.who_controls((i, j),
-                                                     enemy_color(self.color))):
+            if((i, j) in self.dict_ or
+               self.is_attacked((i, j), enemy_color(color))):
                 return False
-
         return True
-        
-    def can_move(self, (s_x, s_y), (d_x, d_y)):
-        """Say if the king at (s_x, s_y) can go to (d_x, d_y).
 
-        Return the Move if the king can, else return None.
+    def let_king_under_attack(self, (s_x, s_y), (d_x, d_y)):
+        """Return True if the piece at (s_x, s_y) can't move at (d_x, d_y)
+        because it will let its king in check position.
+
+        The move is tried on the board, so that a check can be parried by
+        taking the piece or by blocking it, and a pinned piece can move
+        along the pin.
         """
 
-        assert(self.board[s_x, s_y].get_type() == self.type_ and
-               self.board[s_x, s_y].color == self.color and
-               s_x in range(1, BOARD_SIZE + 1) and
-               s_y in range(1, BOARD_SIZE + 1) and
-               d_x in range(1, BOARD_SIZE + 1) and
-               d_y in range(1, BOARD_SIZE + 1) and
-               (s_x, s_y) != (d_x, d_y))
+        p = self.dict_[s_x, s_y]
+        taken = self.dict_.get((d_x, d_y))
+        del self[s_x, s_y]
+        self[d_x, d_y] = p
+        check = self.is_check(p.color)
+        if(taken is None):
+            del self[d_x, d_y]
+        else:
+            self[d_x, d_y] = taken
+        self[s_x, s_y] = p
+        return check
 
-        if(self.can_castling((s_x, s_y), (d_x, d_y))):
-            return Move((s_x, s_y), (d_x, d_y), CASTLING)
 
-        if(abs(s_x - d_x) > 1 or abs(s_y - d_y) > 1):
-            return None
+class Piece(object):
+    """The class Piece represents a chess piece: its type and its color.
 
-        if(self.board.who_controls((d_x, d_y), enemy_color(self.color))):
-            return None
+    The pieces are flyweights: there is one instance for each color and
+    type, PIECES[color][type_], shared by all the boards, and the rules
+    which need the board are methods of the Board. A piece holds no
+    reference to a board nor to a history, so a position is only a dict of
+    shared values.
+    """
 
-        if((d_x, d_y) not in self.board):
-            return Move((s_x, s_y), (d_x, d_y), NORMAL_MOVE)
-        if(self.board[d_x, d_y].color == enemy_color(self.color)):
-            return Move((s_x, s_y), (d_x, d_y), CAPTURE)
+    __slots__ = ('type_', 'color')
+
+    def __init__(self, type_, color):
+        self.type_ = type_
+        self.color = color
+
+    def __reduce__(self):
+        # Pickled as a reference to the shared instance.
+        return (piece, (self.type_, self.color))
+
+    def __repr__(self):
+        return "Piece(%d, %d)" % (self.type_, self.color)
+
+    def get_type(self):
+        """Return the type of the piece."""
+
+        return self.type_
 
-        return None
 
-        
\ No newline at end of file
+PIECES = [[Piece(type_, color) for type_ in xrange(6)]
+          for color in [WHITE_COLOR, BLACK_COLOR]]
+# The piece of each letter of the FEN notation.
+FEN_PIECES = dict([(char, PIECES[WHITE_COLOR][type_])
+                   for type_, char in enumerate(PIECE_LETTERS)] +
+                  [(char.lower(), PIECES[BLACK_COLOR][type_])
+                   for type_, char in enumerate(PIECE_LETTERS)])
+# What each character of a FEN row stands for: the number of squares it
+# covers, its piece or None for the empty squares, and the Zobrist keys of
+# the piece.
+FEN_CHARS = dict((str(n), (n, None, None)) for n in xrange(1, BOARD_SIZE + 1))
+FEN_CHARS.update((char, (1, p, ZOBRIST_PIECES[p.color][p.type_]))
+                 for char, p in FEN_PIECES.iteritems())
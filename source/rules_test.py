@@ -0,0 +1,251 @@
+"""Unittest of the module rules.py.
+
+It checks the move generation on positions reached by playing games."""
+
+import pickle
+import unittest
+import bitboard
+import game
+import rules
+
+"""Constants"""
+W = rules.WHITE_COLOR
+B = rules.BLACK_COLOR
+
+class LegalMoves(unittest.TestCase):
+    """Test the legal move generator of the board."""
+
+    def setUp(self):
+        self.g = game.Game()
+
+    def play(self, moves):
+        """Play the list of (src, dest) 'moves', white first."""
+
+        c = W
+        for src, dest in moves:
+            self.assertNotEqual(self.g.move(c, src, dest), game.INVALID_MOVE)
+            c = rules.enemy_color(c)
+        return c
+
+    def test_initial_position(self):
+        """20 moves at the beginning of the game."""
+
+        moves = list(self.g.board.legal_moves(W))
+        self.assertEqual(len(moves), 20)
+        self.assertEqual(len(set(moves)), 20)
+
+    def test_en_passant(self):
+        """The pawn can take 'en passant' just after the double push."""
+
+        c = self.play([((5, 2), (5, 4)), ((1, 7), (1, 6)),
+                       ((5, 4), (5, 5)), ((4, 7), (4, 5))])
+        self.assertIn(rules.Move((5, 5), (4, 6), rules.EN_PASSANT),
+                      list(self.g.board.legal_moves(c)))
+
+        c = self.play([((1, 2), (1, 3)), ((1, 6), (1, 5))])
+        self.assertNotIn(rules.Move((5, 5), (4, 6), rules.EN_PASSANT),
+                         list(self.g.board.legal_moves(c)))
+
+    def test_castling(self):
+        """The king can castle once the squares between are empty."""
+
+        c = self.play([((5, 2), (5, 4)), ((5, 7), (5, 5)),
+                       ((7, 1), (6, 3)), ((2, 8), (3, 6)),
+                       ((6, 1), (3, 4)), ((7, 8), (6, 6))])
+        self.assertIn(rules.Move((5, 1), (7, 1), rules.CASTLING),
+                      list(self.g.board.legal_moves(c)))
+
+        # The king moved, the right is lost even if he goes back.
+        c = self.play([((5, 1), (6, 1)), ((6, 8), (5, 7)),
+                       ((6, 1), (5, 1)), ((5, 7), (6, 8))])
+        self.assertNotIn(rules.Move((5, 1), (7, 1), rules.CASTLING),
+                         list(self.g.board.legal_moves(c)))
+
+    def test_check(self):
+        """In check, only the moves parrying it are legal."""
+
+        c = self.play([((6, 2), (6, 3)), ((5, 7), (5, 5)),
+                       ((7, 2), (7, 4)), ((4, 8), (8, 4))])
+        self.assertEqual(list(self.g.board.legal_moves(c)), [])
+
+        self.setUp()
+        c = self.play([((5, 2), (5, 4)), ((6, 7), (6, 6)),
+                       ((4, 1), (8, 5))])
+        self.assertEqual(list(self.g.board.legal_moves(c)),
+                         [rules.Move((7, 7), (7, 6), rules.NORMAL_MOVE)])
+
+    def test_pin(self):
+        """A pined piece can only move along the pin."""
+
+        c = self.play([((5, 2), (5, 4)), ((4, 7), (4, 6)),
+                       ((4, 2), (4, 4)), ((2, 8), (4, 7)),
+                       ((6, 1), (2, 5))])
+        moves = list(self.g.board.legal_moves(c))
+        self.assertNotIn((4, 7), [m.src for m in moves])
+        self.assertIn(rules.Move((3, 7), (3, 6), rules.NORMAL_MOVE), moves)
+
+class MakeUnmake(unittest.TestCase):
+    """Test playing moves on the board and taking them back."""
+
+    def position(self, board):
+        """Return everything make() can change on the board."""
+
+        return (dict((pos, (p.color, p.get_type()))
+                     for pos, p in board.dict_.iteritems()),
+                board.castling, board.ep)
+
+    def test_castling_with_the_rook(self):
+        """A castling played as a rook move moves the king too."""
+
+        board = rules.Board([])
+        board.set_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        before = self.position(board)
+        token = board.make(rules.Move((8, 1), (6, 1), rules.CASTLING))
+        self.assertEqual(board[7, 1].get_type(), rules.KING)
+        self.assertEqual(board.castling, rules.BLACK_KINGSIDE |
+                                         rules.BLACK_QUEENSIDE)
+        board.unmake(token)
+        self.assertEqual(self.position(board), before)
+
+    def test_en_passant_and_promotion(self):
+        """The taken pawn and the pawn of a promotion come back."""
+
+        board = rules.Board([])
+        board.set_fen("8/1P6/8/3pP3/8/8/8/4K2k w - d6 0 1")
+        before = self.position(board)
+        token = board.make(rules.Move((5, 5), (4, 6), rules.EN_PASSANT))
+        self.assertNotIn((4, 5), board)
+        self.assertEqual(board.ep, None)
+        board.unmake(token)
+        self.assertEqual(self.position(board), before)
+
+        token = board.make(rules.Move((2, 7), (2, 8), rules.PROMOTION),
+                           rules.KNIGHT)
+        self.assertEqual(board[2, 8].get_type(), rules.KNIGHT)
+        board.unmake(token)
+        self.assertEqual(self.position(board), before)
+
+
+class AttackMaps(unittest.TestCase):
+    """Test the attack maps kept by the board."""
+
+    def test_follow_moves(self):
+        """The maps give the attacks found by a BitBoard after each move of
+        Kiwipete and after taking it back."""
+
+        fen = ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R "
+               "w KQkq - 0 1")
+        board, reference = rules.Board([]), bitboard.BitBoard([])
+        board.set_fen(fen)
+        reference.set_fen(fen)
+        for m in list(board.legal_moves(W)) + [None]:
+            if(m is not None):
+                token = board.make(m)
+                reference.make(m)
+            for pos in rules.SQUARES:
+                for color in [W, B]:
+                    self.assertEqual(
+                        sorted(board.who_controls(pos, color)),
+                        sorted(reference.who_controls(pos, color)))
+            if(m is not None):
+                board.unmake(token)
+                reference.set_fen(fen)
+
+
+class PiecePositions(unittest.TestCase):
+    """Test the positions of the pieces kept by the board."""
+
+    def check(self, board):
+        """The kept positions are the ones of the dict."""
+
+        for color in [W, B]:
+            self.assertEqual(board.positions[color],
+                             set(pos for pos, p in board.dict_.iteritems()
+                                 if p.color == color))
+            self.assertEqual(board.where_is_king(color),
+                             [pos for pos, p in board.dict_.iteritems()
+                              if p.color == color and
+                              p.type_ == rules.KING][0])
+
+    def play(self, board, m):
+        """Play the Move m, a promotion being made to a queen."""
+
+        if(m.type_ in [rules.PROMOTION, rules.CAPTURE_PROMOTION]):
+            return board.make(m, rules.QUEEN)
+        return board.make(m)
+
+    def test_castling_and_promotion(self):
+        """After each move of a position with castlings and promotions, and
+        after taking it back."""
+
+        board = rules.Board([])
+        board.set_fen("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/"
+                      "R2Q1RK1 w kq - 0 1")
+        self.check(board)
+        for m in list(board.legal_moves(W)):
+            token = self.play(board, m)
+            self.check(board)
+            for n in list(board.legal_moves(B)):
+                board.unmake(self.play(board, n))
+                self.check(board)
+            board.unmake(token)
+            self.check(board)
+
+    def test_set_fen_again(self):
+        """A board loading one position after another keeps nothing of the
+        previous ones."""
+
+        board = rules.Board([])
+        board.who_controls((5, 4), W)   # Builds the attack maps
+        for fen in ["8/1P6/8/3pP3/8/8/8/4K2k w - d6 0 1",
+                    "r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1",
+                    rules.INITIAL_FEN]:
+            color = board.set_fen(fen)
+            self.check(board)
+            self.assertEqual(board.zobrist, board.zobrist_key(color))
+            self.assertEqual(board.get_fen(color), fen)
+        self.assertEqual(sorted(board.who_controls((5, 3), W)),
+                         [(4, 2), (6, 2)])
+
+
+class Pieces(unittest.TestCase):
+    """Test the shared pieces and the moves checked by the board."""
+
+    def test_shared(self):
+        """All the boards use the same pieces, which stay shared when
+        pickled and when a pawn is promoted."""
+
+        g_1, g_2 = game.Game(), game.Game()
+        self.assertIs(g_1.board[1, 1], g_2.board[8, 1])
+        self.assertIs(g_1.board[1, 1], rules.piece(rules.ROOK, W))
+        self.assertIs(pickle.loads(pickle.dumps(g_1.board[5, 8], 2)),
+                      rules.PIECES[B][rules.KING])
+        self.assertFalse(hasattr(g_1.board[5, 8], '__dict__'))
+
+        board = rules.Board([])
+        board.set_fen("4k3/P7/8/8/8/8/8/4K3 w - -")
+        board.make(rules.Move((1, 7), (1, 8), rules.PROMOTION), rules.KNIGHT)
+        self.assertIs(board[1, 8], rules.PIECES[W][rules.KNIGHT])
+
+    def test_can_move(self):
+        """The moves of each piece are checked by the board."""
+
+        board = rules.Board([])
+        board.set_fen("4k3/8/8/3p4/8/2N5/8/R3K2R w KQ -")
+        moves = [((3, 3), (4, 5), rules.CAPTURE),
+                 ((3, 3), (3, 5), None),
+                 ((1, 1), (1, 8), rules.NORMAL_MOVE),
+                 ((1, 1), (2, 2), None),
+                 ((1, 1), (4, 1), rules.CASTLING),
+                 ((5, 1), (7, 1), rules.CASTLING),
+                 ((5, 1), (5, 2), rules.NORMAL_MOVE),
+                 ((5, 1), (5, 3), None)]
+        for src, dest, type_ in moves:
+            m = board.can_move(src, dest)
+            if(type_ is None):
+                self.assertIsNone(m)
+            else:
+                self.assertEqual(m, rules.Move(src, dest, type_))
+
+if __name__ == '__main__':
+    unittest.main()
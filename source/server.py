@@ -0,0 +1,671 @@
+"""Server module
+
+This module hosts many games at once for clients playing through the
+network, with a line protocol.
+
+Python 2 has no asyncio: the server is an asyncore event loop, which polls
+all the connections from one thread. Each line of the protocol names its
+game, so a connection can play any number of games, one side or both. The
+client sends:
+PLAY seconds            play against the next client asking for a game with
+                        the same time, 0 for no clock
+AI seconds              play white against the engine
+SHOW seconds            watch a new game of the engine against itself
+MOVE game e2e4          play a move, e7e8q for a promotion, e1g1 for a
+                        castling
+RESIGN game
+WATCH game              watch a game, till its end
+UNWATCH game
+and the server answers:
+WAIT game               no opponent came yet, the client plays white
+START game w|b seconds
+OK game e2e4 white_ms black_ms      to the player who moved, with the time
+                                    left on the clocks
+MOVE game e2e4 white_ms black_ms    to the opponent and the watchers
+SNAPSHOT game ply white_ms black_ms fen     to a new watcher, the position
+                                            after ply plies
+MOVES game ply e2e4 ...             to a watcher which missed moves, those
+                                    from ply on, followed by a SNAPSHOT
+END game result reason              the result being as in PGN
+ERROR game|- message
+
+A move is checked by Game.move(), which looks it up in the legal moves of
+the position, generated once per ply: it takes a few hundred microseconds
+of the loop. The engine needs far longer, so its moves are searched by the
+processes of a multiprocessing pool; they come back through a pipe watched
+by the loop.
+
+What stopped the loop longest was not the moves but the full collections
+of the garbage collector, which walk every object of every game: 0.2 s
+at 1000 games, 2 s at 10000. The games make no reference cycles, so the
+loop only lets the collector look at the young objects, and runs a full
+collection every FULL_COLLECTION_EVERY seconds. The lines to a connection
+are also queued, and sent by the loop in one send per turn.
+
+Each player has a clock: the time from the move of the opponent to its own
+move is added to Player.time_spent, and a player whose time is over loses
+the game, at its next move or at the next look at the clocks.
+
+A game can have thousands of watchers, so a move is written once, in a
+string which the opponent and all the watchers share. A watcher whose
+connection is too slow to take the lines as they come, MAX_PENDING of them
+being already waiting, gets no more of them: once its lines are sent, it
+gets all the moves it missed in one line, and the position. The cost of a
+move is then at most a push per watcher, and the memory bound by the
+watchers times MAX_PENDING lines.
+
+Usage: python server.py [port] [processes]
+"""
+
+import asynchat
+import asyncore
+import gc
+import multiprocessing
+import os
+import socket
+import sys
+import time
+import Queue
+
+import rules as ru
+import game as gm
+import pgn
+from AI import alphabeta
+
+"""Constants"""
+PORT = 7000
+BACKLOG = 1024
+MAX_LINE = 256      # Longer lines close the connection
+CLOCK_EVERY = 1.    # Seconds between two looks at all the clocks
+FULL_COLLECTION_EVERY = 600.    # Seconds between two full collections
+# The thresholds of the garbage collector while the loop runs: the oldest
+# generation is never collected by the collector itself.
+GC_THRESHOLDS = (700, 10, 2 ** 30)
+POLL_TIMEOUT = 0.1  # Seconds
+MAX_PENDING = 64    # Lines waiting for a watcher before it misses moves
+SEND_BUFFER = 65536     # Bytes sent to a connection at most in one send
+MAX_WATCHERS = 10000    # Per game
+# The options of the engine playing the AI games.
+ENGINE_OPTIONS = {'max_depth': 3, 'time_ms': 1000, 'hash_mb': 4}
+
+COLOR_LETTERS = ru.COLOR_LETTERS
+PROMOTION_LETTERS = {'n': ru.KNIGHT, 'b': ru.BISHOP, 'r': ru.ROOK,
+                     'q': ru.QUEEN}
+RESULTS = ['1-0', '0-1']    # [color]: the result when 'color' wins
+DRAW = '1/2-1/2'
+UNFINISHED = '*'
+
+"""Functions"""
+def parse_move(text):
+    """Return the (src, dest, promotion) of a move in coordinate notation,
+    like e2e4 or e7e8q, promotion being None for no promotion, or return
+    None if the text is not a move."""
+
+    if(len(text) not in [4, 5] or
+       (len(text) == 5 and text[4] not in PROMOTION_LETTERS)):
+        return None
+    squares = []
+    for char_x, char_y in [text[0:2], text[2:4]]:
+        x, y = ord(char_x) - ord('a') + 1, ord(char_y) - ord('0')
+        if(not ru.on_board((x, y))):
+            return None
+        squares.append((x, y))
+    return squares[0], squares[1], PROMOTION_LETTERS.get(text[4:])
+
+def move_text(src, dest, promotion=None):
+    """Return the coordinate notation of a move."""
+
+    text = pgn.square_name(src) + pgn.square_name(dest)
+    if(promotion is not None):
+        text += ru.PIECE_LETTERS[promotion].lower()
+    return text
+
+def engine_move(fen, options):
+    """Search the move of the engine in the position of the FEN string, and
+    return it in coordinate notation. It runs in a process of the pool."""
+
+    engine = alphabeta.Engine(**options)
+    m = engine.search(gm.Game(fen=fen))
+    return move_text(m.src, m.dest, engine.best_promotion)
+
+def get_player(g, color):
+    """Return the Player of 'color' of the Game g."""
+
+    if(color == ru.WHITE_COLOR):
+        return g.white_player
+    return g.black_player
+
+
+"""Classes"""
+class Session():
+    """The class Session is a game hosted by the server: the Game, the
+    connection of each player, None for the engine, the clocks and the
+    watchers."""
+
+    def __init__(self, id_, seconds):
+        self.id_ = id_
+        self.game = gm.Game()
+        self.seconds = seconds      # Time of each player, 0 for no clock
+        self.connections = [None, None]
+        self.engines = []           # The colors played by the engine
+        self.turn_start = None      # When the player to move began, None
+                                    # before the start
+        self.over = False
+        self.texts = []             # The moves in coordinate notation
+        self.watchers = {}          # Connection: None if it got all the
+                                    # moves, else the ply of the first one
+                                    # it missed
+
+    def snapshot(self, now):
+        """Return the SNAPSHOT line of the position."""
+
+        return "SNAPSHOT %d %d %s %s\n" % (self.id_, len(self.texts),
+                                           self.clocks(now),
+                                           self.game.to_fen())
+
+    def catch_up(self, ply, now):
+        """Return the lines giving the moves from ply on, then the
+        position."""
+
+        return "MOVES %d %d %s\n%s" % (self.id_, ply,
+                                       ' '.join(self.texts[ply:]),
+                                       self.snapshot(now))
+
+    def time_left(self, color, now):
+        """Return the seconds left to the 'color' player."""
+
+        left = self.seconds - get_player(self.game, color).time_spent
+        if(self.turn_start is not None and
+           color == self.game.get_playing_color()):
+            left -= now - self.turn_start
+        return left
+
+    def clocks(self, now):
+        """Return the text of the time left to each player, in ms."""
+
+        if(not self.seconds):
+            return "0 0"
+        return "%d %d" % tuple(max(0, int(self.time_left(c, now) * 1000))
+                               for c in [ru.WHITE_COLOR, ru.BLACK_COLOR])
+
+class Connection(asynchat.async_chat):
+    """The class Connection reads the lines of a client and sends it the
+    lines of the server."""
+
+    ac_out_buffer_size = SEND_BUFFER
+
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock, map=server.map)
+        self.server = server
+        self.set_terminator('\n')
+        self.buffer = []
+        self.length = 0
+        self.sessions = set()   # The ids of its games
+        self.watched = set()    # The ids of the games it watches
+        self.lagging = False    # Whether it missed moves of a game
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+        self.length += len(data)
+        if(self.length > MAX_LINE):
+            self.handle_close()
+
+    def found_terminator(self):
+        line = ''.join(self.buffer).strip()
+        self.buffer = []
+        self.length = 0
+        if(line and self.connected):
+            self.server.command(self, line)
+
+    def send_line(self, line):
+        """Send a line of the protocol."""
+
+        self.push(line + '\n')
+
+    def push(self, data):
+        """Queue data, which the loop sends when the socket is writable: the
+        lines of all the moves played in one turn of the loop go in a
+        single send."""
+
+        self.producer_fifo.append(data)
+
+    def initiate_send(self):
+        # Send in one go the lines waiting, up to SEND_BUFFER bytes. A
+        # watcher which missed moves gets them once all its lines are sent,
+        # whoever sent them.
+        fifo = self.producer_fifo
+        if(len(fifo) > 1):
+            data, size = [], 0
+            while(fifo and size < SEND_BUFFER):
+                data.append(fifo.popleft())
+                size += len(data[-1])
+            fifo.appendleft(''.join(data))
+        asynchat.async_chat.initiate_send(self)
+        if(self.lagging and not fifo and self.connected):
+            self.server.catch_up(self)
+
+    def handle_close(self):
+        self.close()
+        self.server.disconnected(self)
+
+class Waker(asyncore.file_dispatcher):
+    """The class Waker wakes the loop up when the pool gives a move: the
+    thread of the pool writes a byte in the pipe it reads."""
+
+    def __init__(self, server):
+        self.server = server
+        read, self.write_fd = os.pipe()
+        asyncore.file_dispatcher.__init__(self, read, map=server.map)
+        os.close(read)  # file_dispatcher works on a copy
+
+    def wake(self):
+        """Wake the loop up, from any thread."""
+
+        os.write(self.write_fd, 'x')
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+        self.server.engine_moves()
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        os.close(self.write_fd)
+
+class Server(asyncore.dispatcher):
+    """The class Server accepts the clients and plays their games.
+
+    Its loop has its own map of the sockets, so several servers, or a
+    server and clients, can run in one process.
+    """
+
+    def __init__(self, port=PORT, processes=None,
+                 engine_options=ENGINE_OPTIONS, host=''):
+        # The pool is started first, so its processes don't get copies of
+        # the sockets.
+        self.pool = multiprocessing.Pool(processes)
+        self.engine_options = engine_options
+        self.results = Queue.Queue()    # (game, ply, move) from the pool
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(BACKLOG)
+        self.port = self.socket.getsockname()[1]
+        self.waker = Waker(self)
+
+        self.sessions = {}      # Id: Session
+        self.waiting = {}       # Seconds: Session waiting for black
+        self.next_id = 1
+        self.moves = 0          # Moves played since the start
+        self.running = False
+
+    def handle_accept(self):
+        pair = self.accept()
+        if(pair is not None):
+            Connection(self, pair[0])
+
+    def serve(self, duration=None):
+        """Run the loop until stop() is called, or for duration seconds if
+        given, then close the connections and the pool."""
+
+        self.running = True
+        now = time.time()
+        next_clock = now + CLOCK_EVERY
+        next_collection = now + FULL_COLLECTION_EVERY
+        thresholds = gc.get_threshold()
+        gc.set_threshold(*GC_THRESHOLDS)
+        try:
+            while(self.running and
+                  (duration is None or time.time() < now + duration)):
+                asyncore.loop(POLL_TIMEOUT, True, self.map, 1)
+                if(time.time() >= next_clock):
+                    self.check_clocks(time.time())
+                    next_clock = time.time() + CLOCK_EVERY
+                if(time.time() >= next_collection):
+                    gc.collect()
+                    next_collection = time.time() + FULL_COLLECTION_EVERY
+        finally:
+            gc.set_threshold(*thresholds)
+        self.close_all()
+
+    def stop(self):
+        """Stop the loop, from any thread."""
+
+        self.running = False
+        if(self.waker.connected):
+            self.waker.wake()
+
+    def close_all(self):
+        """Close the connections and the pool."""
+
+        asyncore.close_all(self.map)
+        self.pool.terminate()
+
+    def command(self, connection, line):
+        """Do what the line sent by the connection asks."""
+
+        words = line.split()
+        name, args = words[0].upper(), words[1:]
+        if(name in ['PLAY', 'AI', 'SHOW'] and len(args) <= 1):
+            if(args and not args[0].isdigit()):
+                connection.send_line("ERROR - bad time: %s" % args[0])
+            elif(name == 'PLAY'):
+                self.play(connection, int(args[0]) if args else 0)
+            elif(name == 'AI'):
+                self.play_engine(connection, int(args[0]) if args else 0)
+            else:
+                self.show(connection, int(args[0]) if args else 0)
+            return
+        if(name not in ['MOVE', 'RESIGN', 'WATCH', 'UNWATCH'] or
+           len(args) != (2 if name == 'MOVE' else 1)):
+            connection.send_line("ERROR - bad command: %s" % line)
+            return
+
+        session = None
+        if(args[0].isdigit()):
+            session = self.sessions.get(int(args[0]))
+        if(name in ['WATCH', 'UNWATCH']):
+            if(session is None or
+               (name == 'UNWATCH' and connection not in session.watchers)):
+                connection.send_line("ERROR %s unknown game" % args[0])
+            elif(name == 'WATCH'):
+                self.watch(connection, session)
+            else:
+                self.unwatch(connection, session)
+        elif(session is None or connection not in session.connections):
+            connection.send_line("ERROR %s unknown game" % args[0])
+        elif(session.over or session.turn_start is None):
+            connection.send_line("ERROR %d game not running" % session.id_)
+        elif(name == 'RESIGN'):
+            # A player of both sides resigns for the one to move.
+            color = session.game.get_playing_color()
+            if(session.connections[color] is not connection):
+                color = ru.enemy_color(color)
+            self.end(session, RESULTS[ru.enemy_color(color)], 'resignation')
+        else:
+            color = session.game.get_playing_color()
+            if(session.connections[color] is not connection):
+                connection.send_line("ERROR %d not your turn" % session.id_)
+            else:
+                self.move(session, color, args[1])
+
+    def __new_session(self, connection, seconds):
+        # Create a game whose white player is the connection, if any.
+        session = Session(self.next_id, seconds)
+        self.next_id += 1
+        self.sessions[session.id_] = session
+        if(connection is not None):
+            session.connections[ru.WHITE_COLOR] = connection
+            connection.sessions.add(session.id_)
+        return session
+
+    def play(self, connection, seconds):
+        """Pair the connection with the one waiting for a game of the same
+        time, or make it wait."""
+
+        session = self.waiting.pop(seconds, None)
+        if(session is None):
+            session = self.__new_session(connection, seconds)
+            self.waiting[seconds] = session
+            connection.send_line("WAIT %d" % session.id_)
+            return
+        session.connections[ru.BLACK_COLOR] = connection
+        connection.sessions.add(session.id_)
+        self.start(session)
+
+    def play_engine(self, connection, seconds):
+        """Start a game of the connection against the engine."""
+
+        session = self.__new_session(connection, seconds)
+        session.engines = [ru.BLACK_COLOR]
+        self.start(session)
+
+    def show(self, connection, seconds):
+        """Start a game of the engine against itself, watched by the
+        connection. It ends when nobody watches it any more."""
+
+        session = self.__new_session(None, seconds)
+        session.engines = [ru.WHITE_COLOR, ru.BLACK_COLOR]
+        self.watch(connection, session)
+        self.start(session)
+
+    def start(self, session):
+        """Start the clocks of the game and tell its players."""
+
+        session.turn_start = time.time()
+        for color, c in enumerate(session.connections):
+            if(c is not None):
+                c.send_line("START %d %s %d" % (session.id_,
+                                                COLOR_LETTERS[color],
+                                                session.seconds))
+        if(session.game.get_playing_color() in session.engines):
+            self.__search(session)
+
+    def watch(self, connection, session):
+        """Send the position of the game to the connection, which gets its
+        moves from then on."""
+
+        if(connection not in session.watchers and
+           len(session.watchers) >= MAX_WATCHERS):
+            connection.send_line("ERROR %d too many watchers" % session.id_)
+            return
+        session.watchers[connection] = None
+        connection.watched.add(session.id_)
+        connection.push(session.snapshot(time.time()))
+
+    def unwatch(self, connection, session):
+        """Stop sending the moves of the game to the connection."""
+
+        del session.watchers[connection]
+        connection.watched.discard(session.id_)
+        if(not session.watchers and len(session.engines) == 2 and
+           not session.over):
+            self.end(session, UNFINISHED, 'no watchers')
+
+    def move(self, session, color, text):
+        """Play the move of 'color' given in coordinate notation."""
+
+        parsed = parse_move(text)
+        if(parsed is None):
+            self.__send(session, color, "ERROR %d bad move: %s" %
+                        (session.id_, text))
+            return
+        src, dest, promotion = parsed
+
+        g, now = session.game, time.time()
+        if(session.seconds and session.time_left(color, now) < 0):
+            self.end(session, RESULTS[ru.enemy_color(color)], 'time')
+            return
+        # A castling is sent as the move of the king: the rook going next
+        # to it only moves.
+        type_ = None
+        p = g.board.dict_.get(src)
+        if(p is not None and p.type_ == ru.ROOK):
+            type_ = ru.NORMAL_MOVE
+        result = g.move(color, src, dest, type_=type_)
+        if(result == gm.INVALID_MOVE):
+            self.__send(session, color, "ERROR %d illegal move: %s" %
+                        (session.id_, text))
+            return
+        if(result != gm.PROMOTE):
+            promotion = None
+        elif(promotion is None):
+            promotion = ru.QUEEN
+        if(promotion is not None):
+            g.promote(dest, promotion)
+        get_player(g, color).time_spent += now - session.turn_start
+        session.turn_start = now
+        self.moves += 1
+
+        text = move_text(src, dest, promotion)
+        session.texts.append(text)
+        clocks = session.clocks(now)
+        self.__send(session, color, "OK %d %s %s" % (session.id_, text,
+                                                     clocks))
+        enemy = ru.enemy_color(color)
+        data = "MOVE %d %s %s\n" % (session.id_, text, clocks)
+        c = session.connections[enemy]
+        if(c is not None and c.connected):
+            c.push(data)
+        self.broadcast(session, data)
+
+        end = self.__end_of(g, enemy)
+        if(end is not None):
+            self.end(session, *end)
+        elif(enemy in session.engines):
+            self.__search(session)
+
+    def broadcast(self, session, data):
+        """Push the MOVE line of the last move to the watchers of the game
+        which got all the moves before. The ones with MAX_PENDING lines
+        waiting miss it, and catch up once their lines are sent."""
+
+        ply = len(session.texts) - 1
+        # A push can close a connection, which leaves the game.
+        for c, missed in session.watchers.items():
+            if(missed is not None or not c.connected):
+                continue
+            if(len(c.producer_fifo) < MAX_PENDING):
+                c.push(data)
+            else:
+                session.watchers[c] = ply
+                c.lagging = True
+
+    def catch_up(self, connection):
+        """Send the moves it missed and the positions to a watcher whose
+        lines were all sent."""
+
+        connection.lagging = False
+        now = time.time()
+        for id_ in list(connection.watched):
+            session = self.sessions.get(id_)
+            if(session is None or not connection.connected):
+                continue
+            ply = session.watchers.get(connection)
+            if(ply is not None):
+                session.watchers[connection] = None
+                connection.push(session.catch_up(ply, now))
+
+    def __end_of(self, g, color):
+        # Return the (result, reason) of the Game g if it is over, 'color'
+        # being the player to move, else None.
+        if(not g.legal_moves()):
+            if(g.board.is_check(color)):
+                return RESULTS[ru.enemy_color(color)], 'check mate'
+            return DRAW, 'stalemate'
+        if(g.repetitions() >= gm.REPETITIONS):
+            return DRAW, 'threefold repetition'
+        if(g.halfmove_clocks[-1] >= gm.FIFTY_MOVES):
+            return DRAW, '50-move rule'
+        return None
+
+    def __send(self, session, color, line):
+        # Send the line to the 'color' player, unless it is the engine.
+        c = session.connections[color]
+        if(c is not None and c.connected):
+            c.send_line(line)
+
+    def end(self, session, result, reason):
+        """End the game and tell its players and watchers."""
+
+        # The game is removed first: a connection which fails to get the
+        # line is closed, and ends its games.
+        session.over = True
+        del self.sessions[session.id_]
+        for c in session.connections:
+            if(c is not None):
+                c.sessions.discard(session.id_)
+        watchers, session.watchers = session.watchers, {}
+        for c in watchers:
+            c.watched.discard(session.id_)
+        line = "END %d %s %s" % (session.id_, result, reason)
+        for color, c in enumerate(session.connections):
+            if(c is not None and c not in session.connections[:color]):
+                self.__send(session, color, line)
+
+        data, now = line + '\n', time.time()
+        for c, missed in watchers.iteritems():
+            if(c.connected):
+                if(missed is not None):
+                    c.push(session.catch_up(missed, now))
+                c.push(data)
+
+    def __search(self, session):
+        # Ask the pool for the move of the engine.
+        g = session.game
+        key = (session.id_, len(g.history))
+
+        def done(text):
+            # Called by a thread of the pool
+            self.results.put(key + (text,))
+            self.waker.wake()
+
+        self.pool.apply_async(engine_move, (g.to_fen(), self.engine_options),
+                              callback=done)
+
+    def engine_moves(self):
+        """Play the moves the pool found, for the games which are still at
+        the position they were searched in."""
+
+        while(True):
+            try:
+                id_, ply, text = self.results.get_nowait()
+            except Queue.Empty:
+                return
+            session = self.sessions.get(id_)
+            if(session is not None and not session.over and
+               len(session.game.history) == ply):
+                self.move(session, session.game.get_playing_color(), text)
+
+    def check_clocks(self, now):
+        """End the games whose player to move has no time left."""
+
+        for session in self.sessions.values():
+            if(session.seconds and session.turn_start is not None and
+               not session.over):
+                color = session.game.get_playing_color()
+                if(session.time_left(color, now) < 0):
+                    self.end(session, RESULTS[ru.enemy_color(color)],
+                             'time')
+
+    def disconnected(self, connection):
+        """End the games of a connection which was closed, and stop sending
+        it the moves of the games it watched."""
+
+        for id_ in list(connection.watched):
+            session = self.sessions.get(id_)
+            if(session is not None and connection in session.watchers):
+                self.unwatch(connection, session)
+        connection.watched.clear()
+        for id_ in list(connection.sessions):
+            session = self.sessions.get(id_)
+            if(session is None):
+                continue
+            if(self.waiting.get(session.seconds) is session):
+                del self.waiting[session.seconds]
+                self.end(session, UNFINISHED, 'disconnection')
+                continue
+            color = session.game.get_playing_color()
+            if(session.connections[color] is not connection):
+                color = ru.enemy_color(color)
+            self.end(session, RESULTS[ru.enemy_color(color)],
+                     'disconnection')
+        connection.sessions.clear()
+
+
+if __name__ == '__main__':
+    port, processes = PORT, None
+    if(len(sys.argv) > 1):
+        port = int(sys.argv[1])
+    if(len(sys.argv) > 2):
+        processes = int(sys.argv[2])
+    server = Server(port, processes)
+    print "Listening on port %d" % server.port
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        server.close_all()
@@ -0,0 +1,391 @@
+"""Unittest of the module server.py."""
+
+import asyncore
+import socket
+import threading
+import unittest
+import game
+import rules
+import server
+
+"""Constants"""
+ENGINE_OPTIONS = {'max_depth': 1, 'hash_mb': 0}
+
+"""Functions"""
+def fen_after(moves):
+    """Return the FEN string of the position after the moves, given in
+    coordinate notation."""
+
+    g = game.Game()
+    for m in moves:
+        src, dest, promotion = server.parse_move(m)
+        g.move(g.get_playing_color(), src, dest)
+    return g.to_fen()
+
+"""Classes"""
+
+class Client():
+    """A client of the test server, reading the lines one by one."""
+
+    def __init__(self, port):
+        self.socket = socket.create_connection(('127.0.0.1', port), 5)
+        self.file = self.socket.makefile()
+
+    def send(self, line):
+        self.socket.sendall(line + '\n')
+
+    def read(self):
+        return self.file.readline().strip()
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+class Server(unittest.TestCase):
+    """Test the games played through the network."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.Server(0, 1, ENGINE_OPTIONS, '127.0.0.1')
+        cls.thread = threading.Thread(target=cls.server.serve)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.thread.join()
+
+    def setUp(self):
+        self.clients = []
+
+    def tearDown(self):
+        for c in self.clients:
+            c.close()
+
+    def client(self):
+        c = Client(self.server.port)
+        self.clients.append(c)
+        return c
+
+    def start(self, seconds=0):
+        """Return the id of a new game and its white and black clients."""
+
+        white, black = self.client(), self.client()
+        white.send("PLAY %d" % seconds)
+        id_ = int(white.read().split()[1])
+        black.send("PLAY %d" % seconds)
+        self.assertEqual(white.read(), "START %d w %d" % (id_, seconds))
+        self.assertEqual(black.read(), "START %d b %d" % (id_, seconds))
+        return id_, white, black
+
+    def test_check_mate(self):
+        """The moves go to both players, and the mate ends the game."""
+
+        id_, white, black = self.start()
+        for player, opponent, m in [(white, black, 'f2f3'),
+                                    (black, white, 'e7e5'),
+                                    (white, black, 'g2g4'),
+                                    (black, white, 'd8h4')]:
+            player.send("MOVE %d %s" % (id_, m))
+            self.assertEqual(player.read(), "OK %d %s 0 0" % (id_, m))
+            self.assertEqual(opponent.read(), "MOVE %d %s 0 0" % (id_, m))
+        for c in [white, black]:
+            self.assertEqual(c.read(), "END %d 0-1 check mate" % id_)
+        white.send("MOVE %d e2e4" % id_)
+        self.assertEqual(white.read(), "ERROR %d unknown game" % id_)
+
+    def test_errors(self):
+        """The wrong lines are answered by an error."""
+
+        id_, white, black = self.start()
+        black.send("MOVE %d e7e5" % id_)
+        self.assertEqual(black.read(), "ERROR %d not your turn" % id_)
+        white.send("MOVE %d e2e5" % id_)
+        self.assertEqual(white.read(), "ERROR %d illegal move: e2e5" % id_)
+        white.send("MOVE %d e2" % id_)
+        self.assertEqual(white.read(), "ERROR %d bad move: e2" % id_)
+        white.send("MOVE 0 e2e4")
+        self.assertEqual(white.read(), "ERROR 0 unknown game")
+        white.send("HELLO")
+        self.assertEqual(white.read(), "ERROR - bad command: HELLO")
+
+        # The game goes on.
+        white.send("MOVE %d e2e4" % id_)
+        self.assertEqual(white.read(), "OK %d e2e4 0 0" % id_)
+
+    def test_both_sides(self):
+        """A connection can play both sides of a game."""
+
+        c = self.client()
+        c.send("PLAY 0")
+        id_ = int(c.read().split()[1])
+        c.send("PLAY 0")
+        self.assertEqual(c.read(), "START %d w 0" % id_)
+        self.assertEqual(c.read(), "START %d b 0" % id_)
+        c.send("MOVE %d g1f3" % id_)
+        self.assertEqual(c.read(), "OK %d g1f3 0 0" % id_)
+        self.assertEqual(c.read(), "MOVE %d g1f3 0 0" % id_)
+        c.send("RESIGN %d" % id_)
+        self.assertEqual(c.read(), "END %d 1-0 resignation" % id_)
+
+    def test_castling(self):
+        """A castling is a move of the king, the rook going next to it
+        only moves."""
+
+        id_, white, black = self.start()
+        for player, opponent, m in [(white, black, 'e2e4'),
+                                    (black, white, 'e7e5'),
+                                    (white, black, 'g1f3'),
+                                    (black, white, 'b8c6'),
+                                    (white, black, 'f1c4'),
+                                    (black, white, 'g8f6')]:
+            player.send("MOVE %d %s" % (id_, m))
+            player.read()
+            opponent.read()
+        session = self.server.sessions[id_]
+        white.send("MOVE %d h1f1" % id_)
+        self.assertEqual(white.read(), "OK %d h1f1 0 0" % id_)
+        self.assertEqual(session.game.to_fen().split()[0],
+                         "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/"
+                         "RNBQKR2")
+        black.read()
+        black.send("MOVE %d f8c5" % id_)
+        black.read()
+        white.read()
+        white.send("MOVE %d f1h1" % id_)
+        white.read()
+        black.read()
+        black.send("MOVE %d e8g8" % id_)
+        self.assertEqual(black.read(), "OK %d e8g8 0 0" % id_)
+        self.assertEqual(session.game.to_fen().split()[0],
+                         "r1bq1rk1/pppp1ppp/2n2n2/2b1p3/2B1P3/5N2/PPPP1PPP/"
+                         "RNBQK2R")
+
+    def test_promotion(self):
+        """The pawn becomes the piece given with the move."""
+
+        id_, white, black = self.start()
+        for player, m in [(white, 'h2h4'), (black, 'g7g5'),
+                          (white, 'h4g5'), (black, 'h7h6'),
+                          (white, 'g5h6'), (black, 'g8f6'),
+                          (white, 'h6h7'), (black, 'h8g8')]:
+            player.send("MOVE %d %s" % (id_, m))
+            self.assertTrue(player.read().startswith("OK"))
+            self.assertTrue(({white: black, black: white}[player].read()
+                             .startswith("MOVE")))
+        white.send("MOVE %d h7g8n" % id_)
+        self.assertEqual(white.read(), "OK %d h7g8n 0 0" % id_)
+        self.assertEqual(self.server.sessions[id_].game.to_fen().split()[0],
+                         "rnbqkbN1/pppppp2/5n2/8/8/8/PPPPPPP1/RNBQKBNR")
+        self.assertEqual(black.read(), "MOVE %d h7g8n 0 0" % id_)
+
+    def test_clock(self):
+        """A player whose time is over loses the game."""
+
+        id_, white, black = self.start(60)
+        white.send("MOVE %d e2e4" % id_)
+        line = white.read().split()
+        self.assertEqual(line[:3], ['OK', str(id_), 'e2e4'])
+        self.assertTrue(59000 < int(line[3]) <= 60000)
+        self.assertEqual(int(line[4]), 60000)
+        black.read()
+        self.server.sessions[id_].turn_start -= 61
+        black.send("MOVE %d e7e5" % id_)
+        for c in [white, black]:
+            self.assertEqual(c.read(), "END %d 1-0 time" % id_)
+
+    def test_disconnection(self):
+        """A player who leaves loses the game."""
+
+        id_, white, black = self.start()
+        black.close()
+        self.clients.remove(black)
+        self.assertEqual(white.read(), "END %d 1-0 disconnection" % id_)
+
+    def test_engine(self):
+        """The engine answers the moves."""
+
+        c = self.client()
+        c.send("AI 0")
+        id_ = int(c.read().split()[1])
+        c.send("MOVE %d e2e4" % id_)
+        self.assertEqual(c.read(), "OK %d e2e4 0 0" % id_)
+        line = c.read().split()
+        self.assertEqual(line[:2], ['MOVE', str(id_)])
+        self.assertIsNotNone(server.parse_move(line[2]))
+
+    def test_watch(self):
+        """The watchers get the position, then the moves and the end."""
+
+        id_, white, black = self.start()
+        early = self.client()
+        early.send("WATCH %d" % id_)
+        self.assertEqual(early.read(), "SNAPSHOT %d 0 0 0 %s" %
+                         (id_, rules.INITIAL_FEN))
+        for player, opponent, m in [(white, black, 'e2e4'),
+                                    (black, white, 'c7c5')]:
+            player.send("MOVE %d %s" % (id_, m))
+            player.read()
+            line = opponent.read()
+            self.assertEqual(early.read(), line)
+
+        # A late watcher gets the position, not the moves.
+        late = self.client()
+        late.send("WATCH %d" % id_)
+        self.assertEqual(late.read(), "SNAPSHOT %d 2 0 0 %s" %
+                         (id_, fen_after(['e2e4', 'c7c5'])))
+        late.send("UNWATCH %d" % id_)
+        late.send("UNWATCH %d" % id_)
+        self.assertEqual(late.read(), "ERROR %d unknown game" % id_)
+
+        white.send("RESIGN %d" % id_)
+        self.assertEqual(early.read(), "END %d 0-1 resignation" % id_)
+
+    def test_show(self):
+        """The engine plays both sides of the games shown, which end when
+        nobody watches them."""
+
+        c = self.client()
+        c.send("SHOW 0")
+        line = c.read().split()
+        self.assertEqual(line[0], 'SNAPSHOT')
+        id_ = int(line[1])
+        for ply in xrange(2):
+            line = c.read().split()
+            self.assertEqual(line[:2], ['MOVE', str(id_)])
+        c.send("UNWATCH %d" % id_)
+        c.send("WATCH %d" % id_)
+        while(c.read().startswith("MOVE")):
+            pass
+        self.assertNotIn(id_, self.server.sessions)
+
+
+class SlowWatcher(unittest.TestCase):
+    """Test the watchers whose connection is too slow for the moves."""
+
+    def setUp(self):
+        self.max_pending = server.MAX_PENDING
+        server.MAX_PENDING = 2
+        self.server = server.Server(0, 1, ENGINE_OPTIONS, '127.0.0.1')
+        self.sockets = []
+
+    def tearDown(self):
+        server.MAX_PENDING = self.max_pending
+        self.server.close_all()
+        for s in self.sockets:
+            s.close()
+
+    def connection(self):
+        """Return a Connection of the server and the socket of its
+        client."""
+
+        a, b = socket.socketpair()
+        self.sockets.append(b)
+        b.setblocking(0)
+        return server.Connection(self.server, a), b
+
+    def read(self, sock):
+        """Return the lines the server sent, as the loop sends them."""
+
+        data = ''
+        for i in xrange(100):
+            asyncore.loop(0, True, self.server.map, 1)
+            try:
+                data += sock.recv(65536)
+            except socket.error:
+                pass
+        return [l for l in data.split('\n') if l]
+
+    def test_catch_up(self):
+        """A watcher whose lines pile up misses moves, and gets them with
+        the position once its lines are sent."""
+
+        white, white_socket = self.connection()
+        black, black_socket = self.connection()
+        watcher, watcher_socket = self.connection()
+        self.server.command(white, "PLAY 0")
+        self.server.command(black, "PLAY 0")
+        self.server.command(watcher, "WATCH 1")
+        self.assertEqual(self.read(watcher_socket)[0].split()[0], 'SNAPSHOT')
+        # The socket of the watcher is full: its lines wait.
+        watcher.socket.setblocking(0)
+        try:
+            while(True):
+                watcher.socket.send('\n' * 4096)
+        except socket.error:
+            pass
+
+        moves = ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1b5']
+        for i, m in enumerate(moves):
+            self.server.command([white, black][i % 2], "MOVE 1 %s" % m)
+        self.assertEqual(len(watcher.producer_fifo), 2)
+        self.assertEqual(self.server.sessions[1].watchers[watcher], 2)
+
+        lines = self.read(watcher_socket)
+        self.assertEqual(lines, ["MOVE 1 e2e4 0 0", "MOVE 1 e7e5 0 0",
+                                 "MOVES 1 2 g1f3 b8c6 f1b5",
+                                 "SNAPSHOT 1 5 0 0 %s" % fen_after(moves)])
+        self.assertIsNone(self.server.sessions[1].watchers[watcher])
+
+        # The next moves come one by one again.
+        self.server.command(black, "MOVE 1 a7a6")
+        self.assertEqual(self.read(watcher_socket), ["MOVE 1 a7a6 0 0"])
+
+    def test_drained_by_another_game(self):
+        """A watcher whose lines are sent along with the moves of another
+        game still gets the moves it missed."""
+
+        white, white_socket = self.connection()
+        black, black_socket = self.connection()
+        watcher, watcher_socket = self.connection()
+        for id_ in [1, 2]:
+            self.server.command(white, "PLAY 0")
+            self.server.command(black, "PLAY 0")
+            self.server.command(watcher, "WATCH %d" % id_)
+        self.assertEqual(len(self.read(watcher_socket)), 2)
+        watcher.socket.setblocking(0)
+        try:
+            while(True):
+                watcher.socket.send('\n' * 4096)
+        except socket.error:
+            pass
+
+        moves = ['e2e4', 'e7e5', 'g1f3']
+        for i, m in enumerate(moves):
+            self.server.command([white, black][i % 2], "MOVE 1 %s" % m)
+        self.assertTrue(watcher.lagging)
+
+        # The client reads its socket, and the move of the other game
+        # sends all the lines at once.
+        while(True):
+            try:
+                watcher_socket.recv(65536)
+            except socket.error:
+                break
+        self.server.command(white, "MOVE 2 d2d4")
+        watcher.initiate_send()
+        self.assertFalse(watcher.lagging)
+        self.assertIsNone(self.server.sessions[1].watchers[watcher])
+        self.assertEqual(self.read(watcher_socket),
+                         ["MOVE 1 e2e4 0 0", "MOVE 1 e7e5 0 0",
+                          "MOVES 1 2 g1f3",
+                          "SNAPSHOT 1 3 0 0 %s" % fen_after(moves),
+                          "MOVES 2 0 d2d4",
+                          "SNAPSHOT 2 1 0 0 %s" % fen_after(['d2d4'])])
+
+
+class Notation(unittest.TestCase):
+    """Test the coordinate notation of the moves."""
+
+    def test_parse_move(self):
+        self.assertEqual(server.parse_move('e2e4'), ((5, 2), (5, 4), None))
+        self.assertEqual(server.parse_move('a7a8n'),
+                         ((1, 7), (1, 8), rules.KNIGHT))
+        for text in ['e2e9', 'i2e4', 'e2e4k', 'e2', 'e2e4qq']:
+            self.assertIsNone(server.parse_move(text))
+        self.assertEqual(server.move_text((1, 7), (1, 8), rules.ROOK),
+                         'a7a8r')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,551 @@
+"""Tablebase module
+
+This module generates the endgame tablebases of the endings with a lone
+king, which give for each position the result with a perfect play and the
+number of plies to the check mate, and finds the best move of a position
+with them.
+
+A table is made by retrograde analysis: starting from the check mates, the
+positions where the defender is lost are found going back one ply at a time,
+so each position is only looked at when one of the positions after it gets
+its result. The side with the pieces is always stored as white, and the
+board is mirrored so that the king of the attacker stands on the left part
+of the board, or in the lower left corner when there is no pawn.
+
+A table file has one byte per position: first the positions where the
+attacker plays, then the ones where the defender plays. The byte is 0 for a
+draw, else the number of plies to the check mate plus one.
+
+The tables are generated by the processes of a multiprocessing pool, the
+endings with a pawn waiting for the endings their promotions lead to.
+
+Usage: python tablebase.py [directory] [processes]
+"""
+
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+
+import rules as ru
+
+"""Constants"""
+TABLEBASES_DIRECTORY = 'tablebases'
+BOARD_SIZE = ru.BOARD_SIZE
+
+# The endings and the pieces of the attacker beside his king, by type.
+ENDINGS = {'KQK': [ru.QUEEN],
+           'KRK': [ru.ROOK],
+           'KPK': [ru.PAWN],
+           'KBNK': [ru.BISHOP, ru.KNIGHT]}
+MAX_PIECES = 4
+# The tables the promotions of an ending lead to, by type of the new piece.
+# A lone bishop or knight can't mate: those promotions are draws.
+PROMOTIONS = {'KPK': {ru.QUEEN: 'KQK', ru.ROOK: 'KRK'}}
+
+(   # Side to move
+ATTACKER,
+DEFENDER
+) = range(2)
+
+(   # Result for the player to move
+LOSS,
+DRAW,
+WIN
+) = range(3)
+
+"""Functions"""
+def square((x, y)):
+    """Return the number of the square (x, y), from 0 for a1 to 63 for
+    h8."""
+
+    return (y - 1) * BOARD_SIZE + x - 1
+
+def mask_table(targets):
+    """Return the list giving for each square number the bit mask of the
+    squares of the dict targets, as jump_table() gives it."""
+
+    t = [0] * BOARD_SIZE ** 2
+    for pos, l in targets.iteritems():
+        for target in l:
+            t[square(pos)] |= 1 << square(target)
+    return t
+
+def ray_masks(rays):
+    """Return the list giving for each square number the bit mask of the
+    squares of the rays of the dict rays, as ray_table() gives it."""
+
+    return mask_table(dict((pos, sum(l, [])) for pos, l in rays.iteritems()))
+
+def square_rays(rays):
+    """Return the list giving for each square number its rays of square
+    numbers."""
+
+    t = [None] * BOARD_SIZE ** 2
+    for pos, l in rays.iteritems():
+        t[square(pos)] = [[square(target) for target in ray] for ray in l]
+    return t
+
+
+"""Precomputed tables"""
+KING_MASKS = mask_table(ru.KING_TARGETS)
+KING_SQUARES = [[square(target) for target in ru.KING_TARGETS[pos]]
+                for pos in sorted(ru.SQUARES, key=square)]
+KNIGHT_SQUARES = [[square(target) for target in ru.KNIGHT_TARGETS[pos]]
+                  for pos in sorted(ru.SQUARES, key=square)]
+# The pieces which attack a square next to them, the pawn being white.
+JUMP_MASKS = {ru.KING: KING_MASKS,
+              ru.KNIGHT: mask_table(ru.KNIGHT_TARGETS),
+              ru.PAWN: mask_table(ru.PAWN_TARGETS[ru.WHITE_COLOR])}
+SLIDER_MASKS = dict((type_, ray_masks(rays))
+                    for type_, rays in ru.SLIDER_RAYS.iteritems())
+SLIDER_SQUARES = dict((type_, square_rays(rays))
+                      for type_, rays in ru.SLIDER_RAYS.iteritems())
+# BETWEEN[a << 6 | b] is the mask of the squares between a and b on a row, a
+# column or a diagonal.
+BETWEEN = [0] * BOARD_SIZE ** 4
+for pos, rays in ru.QUEEN_RAYS.iteritems():
+    for ray in rays:
+        between = 0
+        for target in ray:
+            BETWEEN[square(pos) << 6 | square(target)] = between
+            between |= 1 << square(target)
+
+
+def generate(name, directory=TABLEBASES_DIRECTORY):
+    """Generate the table of the ending name in directory, from the tables
+    of its promotions which must be there.
+
+    Return (name, number of positions won, time in seconds).
+    """
+
+    start = time.time()
+    promotions = dict((type_, Table(other, directory))
+                      for type_, other in PROMOTIONS.get(name, {}).items())
+    table = Table(name)
+    won = table.generate(promotions)
+    for t in promotions.itervalues():
+        t.close()
+    if(not os.path.isdir(directory)):
+        os.makedirs(directory)
+    with open(os.path.join(directory, name + '.tb'), 'wb') as f:
+        f.write(table.data)
+    return name, won, time.time() - start
+
+def generate_star(args):
+    """Call generate() with the tuple args, for Pool.imap_unordered()."""
+
+    return generate(*args)
+
+def generate_all(directory=TABLEBASES_DIRECTORY, processes=None,
+                 endings=ENDINGS, out=sys.stdout):
+    """Generate the tables of the endings in directory with a pool of
+    processes, one per CPU if processes is None.
+
+    The tables their promotions need must be among them or already there.
+    """
+
+    left = set(endings)
+    pool = multiprocessing.Pool(processes)
+    try:
+        while(left):
+            # The tables which only need the ones already generated
+            ready = [name for name in sorted(left)
+                     if not left & set(PROMOTIONS.get(name, {}).values())]
+            left -= set(ready)
+            for name, won, t in pool.imap_unordered(
+                    generate_star, [(name, directory) for name in ready]):
+                out.write("%s: %d positions won, in %.1fs\n" % (name, won, t))
+    finally:
+        pool.terminate()
+
+
+"""Classes"""
+class Table():
+    """The class Table is the table of an ending.
+
+    It gives the number of each position, and reads the values of the table
+    file, mapped in memory, or makes them with generate().
+    """
+
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.types = ENDINGS[name]
+        self.pawn = ru.PAWN in self.types
+        # The squares of the king of the attacker, mirrored: the left half of
+        # the board, or its lower left quarter without a pawn.
+        self.kings = BOARD_SIZE ** 2 // (2 if self.pawn else 4)
+        self.size = self.kings * BOARD_SIZE ** (2 * len(self.types) + 2)
+        # The index of each piece of the attacker in the list of squares of a
+        # position, its type, and the bit masks of the squares it attacks.
+        self.pieces = [(i, type_, SLIDER_MASKS.get(type_),
+                        JUMP_MASKS.get(type_))
+                       for i, type_ in enumerate([ru.KING, None] + self.types)
+                       if type_ is not None]
+        # How far to the left the square of each piece is in the number.
+        self.shifts = [6 * i for i in xrange(len(self.types) + 1, -1, -1)]
+        self.f = None
+        self.data = None
+        if(directory is not None):
+            self.f = open(os.path.join(directory, name + '.tb'), 'rb')
+            self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        """Unmap and close the file."""
+
+        if(self.f is not None):
+            self.data.close()
+            self.f.close()
+
+    def index(self, squares):
+        """Return the number of the position of the list of square numbers
+        [king of the attacker, king of the defender, pieces of the attacker
+        in the order of their types]."""
+
+        ak = squares[0]
+        flip = 0
+        if(ak & 7 >= BOARD_SIZE // 2):
+            flip = 7        # The columns are mirrored
+        if(not self.pawn and ak >> 3 >= BOARD_SIZE // 2):
+            flip |= 56      # The rows are mirrored
+        ak ^= flip
+        n = (ak >> 3) * (BOARD_SIZE // 2) + (ak & 7)
+        for s in squares[1:]:
+            n = (n << 6) | (s ^ flip)
+        return n
+
+    def squares(self, n):
+        """Return the list of square numbers of the position number n."""
+
+        l = []
+        for type_ in self.types:
+            l.append(n & 63)
+            n >>= 6
+        l.append(n & 63)
+        n >>= 6
+        l.append((n // (BOARD_SIZE // 2)) * BOARD_SIZE +
+                 n % (BOARD_SIZE // 2))
+        l.reverse()
+        return l
+
+    def value(self, squares, side):
+        """Return the byte of the table for the position of squares, side
+        being ATTACKER or DEFENDER."""
+
+        return ord(self.data[side * self.size + self.index(squares)])
+
+    def attacked(self, squares, t, occupied, taken=None):
+        """Return True if the attacker controls the square t, the piece on
+        the square taken being left out."""
+
+        for i, type_, slider_masks, jump_masks in self.pieces:
+            s = squares[i]
+            if(s == taken):
+                continue
+            if(slider_masks is None):
+                if(jump_masks[s] >> t & 1):
+                    return True
+            elif(slider_masks[s] >> t & 1 and
+                 not BETWEEN[s << 6 | t] & occupied):
+                return True
+        return False
+
+    def occupied(self, squares):
+        """Return the mask of the squares of the pieces of the attacker."""
+
+        mask = 1 << squares[0]
+        for s in squares[2:]:
+            mask |= 1 << s
+        return mask
+
+    def is_legal(self, squares):
+        """Return True if no two pieces are on the same square, the kings are
+        not next to each other and the pawns are not on the first or the last
+        row."""
+
+        if(len(set(squares)) != len(squares) or
+           KING_MASKS[squares[0]] >> squares[1] & 1):
+            return False
+        for s, type_ in zip(squares[2:], self.types):
+            if(type_ == ru.PAWN and not BOARD_SIZE <= s < 56):
+                return False
+        return True
+
+    def defender_moves(self, squares):
+        """Return the number of legal moves of the defender, or None if he
+        can take a piece, which is a draw."""
+
+        occupied = self.occupied(squares)
+        n = 0
+        for t in KING_SQUARES[squares[1]]:
+            if(occupied >> t & 1):
+                if(not self.attacked(squares, t, occupied, t)):
+                    return None
+            elif(not self.attacked(squares, t, occupied)):
+                n += 1
+        return n
+
+    def attacker_unmoves(self, n, squares):
+        """Generate the numbers of the positions, the attacker to move, from
+        which he can play a move leading to the position number n, of
+        squares."""
+
+        dk = squares[1]
+        occupied = self.occupied(squares) | 1 << dk
+        for i, type_, slider_masks, jump_masks in self.pieces:
+            s = squares[i]
+            if(type_ == ru.KING):
+                froms = [f for f in KING_SQUARES[s]
+                         if not (occupied | KING_MASKS[dk]) >> f & 1]
+            elif(type_ == ru.KNIGHT):
+                froms = [f for f in KNIGHT_SQUARES[s] if not occupied >> f & 1]
+            elif(type_ == ru.PAWN):
+                froms = []
+                if(s >> 3 >= 2 and not occupied >> (s - 8) & 1):
+                    froms.append(s - 8)
+                    if(s >> 3 == 3 and not occupied >> (s - 16) & 1):
+                        froms.append(s - 16)
+            else:
+                froms = []
+                for ray in SLIDER_SQUARES[type_][s]:
+                    for f in ray:
+                        if(occupied >> f & 1):
+                            break
+                        froms.append(f)
+
+            # The squares of a position of the table are already mirrored:
+            # only the moves of the king may need to mirror them again.
+            shift = self.shifts[i]
+            for f in froms:
+                l = list(squares)
+                l[i] = f
+                # The defender can't be in check with the attacker to move.
+                if(self.attacked(l, dk, occupied ^ (1 << s | 1 << f))):
+                    continue
+                if(i == 0):
+                    yield self.index(l)
+                else:
+                    yield n + ((f - s) << shift)
+
+    def defender_unmoves(self, n, squares):
+        """Generate the (number, squares) of the positions, the defender to
+        move, from which he can play a move leading to the position number
+        n, of squares. His captures lead to draws and are left out."""
+
+        dk = squares[1]
+        occupied = self.occupied(squares) | KING_MASKS[squares[0]]
+        for f in KING_SQUARES[dk]:
+            if(not occupied >> f & 1):
+                l = list(squares)
+                l[1] = f
+                yield n + ((f - dk) << self.shifts[1]), l
+
+    def promoted(self, squares, i, type_):
+        """Return the squares of the position reached when the pawn of the
+        position of squares, at the index i, promotes to type_, in the order
+        of the types of the table of that position."""
+
+        pieces = [(other, s) for other, s in zip(self.types, squares[2:])
+                  if other != ru.PAWN]
+        pieces.append((type_, squares[i] + BOARD_SIZE))
+        return squares[:2] + [s for other, s in sorted(pieces)]
+
+    def generate(self, promotions={}):
+        """Make the values of the table by retrograde analysis, promotions
+        being the dict of the Tables of the endings where a pawn which
+        promotes leads, by type of the new piece.
+
+        Return the number of positions won by the attacker.
+        """
+
+        size = self.size
+        values = [bytearray(size), bytearray(size)]     # [side][n]
+        # The moves of the defender not yet known to lose, plus one, or 255
+        # if he can take a piece. 0 is for not counted yet.
+        counts = bytearray(size)
+        buckets = [[]]  # [plies]: positions whose result comes in plies
+
+        # The check mates, and the promotions for the attacker
+        for n in xrange(size):
+            squares = self.squares(n)
+            if(not self.is_legal(squares)):
+                continue
+            occupied = self.occupied(squares) | 1 << squares[1]
+            if(self.attacked(squares, squares[1], occupied)):
+                if(self.defender_moves(squares) == 0):
+                    values[DEFENDER][n] = 1
+                    buckets[0].append(n)
+                continue
+            for i, type_ in enumerate(self.types, start=2):
+                s = squares[i]
+                if(type_ != ru.PAWN or s >> 3 != 6 or
+                   occupied >> (s + 8) & 1):
+                    continue
+                for promotion, table in promotions.iteritems():
+                    v = table.value(self.promoted(squares, i, promotion),
+                                    DEFENDER)
+                    if(v and (values[ATTACKER][n] == 0 or
+                              v + 1 < values[ATTACKER][n])):
+                        values[ATTACKER][n] = v + 1
+                        while(len(buckets) <= v):
+                            buckets.append([])
+                        buckets[v].append(n)
+
+        ply = 0
+        while(ply < len(buckets)):
+            if(len(buckets) == ply + 1):
+                buckets.append([])
+            for n in buckets[ply]:
+                if(ply % 2 == 0):
+                    # The defender is lost: the moves leading here win.
+                    for m in self.attacker_unmoves(n, self.squares(n)):
+                        v = values[ATTACKER][m]
+                        if(v == 0 or v > ply + 2):
+                            values[ATTACKER][m] = ply + 2
+                            buckets[ply + 1].append(m)
+                elif(values[ATTACKER][n] == ply + 1):
+                    # The attacker wins: one more move of the defender loses.
+                    for m, squares in self.defender_unmoves(
+                            n, self.squares(n)):
+                        if(values[DEFENDER][m]):
+                            continue
+                        c = counts[m]
+                        if(c == 0):
+                            moves = self.defender_moves(squares)
+                            c = 255 if moves is None else moves + 1
+                        if(c != 255):
+                            c -= 1
+                            if(c == 1):
+                                values[DEFENDER][m] = ply + 2
+                                buckets[ply + 1].append(m)
+                        counts[m] = c
+            buckets[ply] = None
+            ply += 1
+            if(not buckets[-1]):
+                buckets.pop()   # Nothing more comes
+
+        self.data = values[ATTACKER] + values[DEFENDER]
+        return size - values[ATTACKER].count('\0')
+
+
+class Tablebases():
+    """The class Tablebases finds the result of the positions of the
+    endings, and their best move, in the tables of a directory.
+
+    A table is opened the first time it is needed. The positions with
+    castling rights, or with pieces on both sides, are not in the tables.
+    """
+
+    def __init__(self, directory=TABLEBASES_DIRECTORY):
+        self.directory = directory
+        self.tables = {}    # Name: Table, or None if there is no file
+
+    def close(self):
+        """Close the tables."""
+
+        for table in self.tables.itervalues():
+            if(table is not None):
+                table.close()
+        self.tables = {}
+
+    def __table(self, name):
+        # Return the Table name, or None if it is not in the directory.
+        if(name not in self.tables):
+            self.tables[name] = None
+            if(os.path.exists(os.path.join(self.directory, name + '.tb'))):
+                self.tables[name] = Table(name, self.directory)
+        return self.tables[name]
+
+    def probe_board(self, board, color):
+        """Return the (result, plies) of the position of the board, 'color'
+        being the player to move, or None if it is not in the tables.
+
+        The result is WIN, DRAW or LOSS for 'color', and plies is the number
+        of plies to the check mate, None for a draw.
+        """
+
+        if(len(board.dict_) > MAX_PIECES or board.castling):
+            return None
+        pieces = [[], []]   # [color]: (type, position) of the pieces
+        for c in [ru.WHITE_COLOR, ru.BLACK_COLOR]:
+            for pos in board.positions[c]:
+                if(pos != board.kings[c]):
+                    pieces[c].append((board.dict_[pos].type_, pos))
+        if(pieces[ru.WHITE_COLOR] and pieces[ru.BLACK_COLOR]):
+            return None
+        attacker = ru.WHITE_COLOR if pieces[ru.WHITE_COLOR] else ru.BLACK_COLOR
+        l = sorted(pieces[attacker])
+        if(not l or (len(l) == 1 and l[0][0] in [ru.BISHOP, ru.KNIGHT])):
+            return DRAW, None   # Nobody can mate
+
+        name = 'K' + ''.join(ru.PIECE_LETTERS[type_] for type_, pos in l) + 'K'
+        if(name not in ENDINGS or self.__table(name) is None):
+            return None
+        flip = 0
+        if(attacker == ru.BLACK_COLOR):
+            flip = 56   # The attacker is stored as white
+        squares = [square(board.kings[attacker]) ^ flip,
+                   square(board.kings[ru.enemy_color(attacker)]) ^ flip]
+        squares.extend(square(pos) ^ flip for type_, pos in l)
+        side = DEFENDER
+        if(color == attacker):
+            side = ATTACKER
+        v = self.tables[name].value(squares, side)
+        if(v == 0):
+            return DRAW, None
+        if(color == attacker):
+            return WIN, v - 1
+        return LOSS, v - 1
+
+    def probe(self, g):
+        """Return the (result, plies) of the position of the Game g for the
+        player to move, as probe_board() does, or None."""
+
+        return self.probe_board(g.board, g.get_playing_color())
+
+    def best_move(self, g):
+        """Return the (Move, promotion) of the best move of the player to
+        move in the Game g, promotion being the type of the new piece or
+        None, or None if the position is not in the tables or is over.
+
+        A won position is won as fast as possible, and a lost one lost as
+        late as possible.
+        """
+
+        board, color = g.board, g.get_playing_color()
+        if(self.probe_board(board, color) is None):
+            return None
+        best, best_key = None, None
+        for m in board.legal_moves(color):
+            promotions = [None]
+            if(m.type_ in [ru.PROMOTION, ru.CAPTURE_PROMOTION]):
+                promotions = [ru.QUEEN, ru.ROOK, ru.BISHOP, ru.KNIGHT]
+            for promotion in promotions:
+                token = board.make(m, promotion)
+                probed = self.probe_board(board, ru.enemy_color(color))
+                board.unmake(token)
+                # The loss of the enemy first, the shortest one first, then
+                # the draw, then a position out of the tables, like a
+                # promotion into an ending without a file, then the longest
+                # win of the enemy.
+                if(probed is None):
+                    key = (1, -1)
+                elif(probed[0] == LOSS):
+                    key = (2, -probed[1])
+                elif(probed[0] == DRAW):
+                    key = (1, 0)
+                else:
+                    key = (0, probed[1])
+                if(best_key is None or key > best_key):
+                    best, best_key = (m, promotion), key
+        return best
+
+
+if __name__ == '__main__':
+    directory, processes = TABLEBASES_DIRECTORY, None
+    if(len(sys.argv) > 1):
+        directory = sys.argv[1]
+    if(len(sys.argv) > 2):
+        processes = int(sys.argv[2])
+    generate_all(directory, processes)
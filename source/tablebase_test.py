@@ -0,0 +1,119 @@
+"""Unittest of the module tablebase.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import game
+import rules
+import tablebase
+from AI import alphabeta
+
+"""Constants"""
+W = rules.WHITE_COLOR
+B = rules.BLACK_COLOR
+
+class Tablebases(unittest.TestCase):
+    """Test generating the tables and playing with them."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        tablebase.generate_all(cls.directory, 2, ['KQK', 'KRK', 'KPK'],
+                               StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.tablebases = tablebase.Tablebases(self.directory)
+
+    def tearDown(self):
+        self.tablebases.close()
+
+    def test_longest_mates(self):
+        """The longest mates are the known ones: 10 moves with a queen, 16
+        with a rook and 28 with a pawn."""
+
+        for name, plies in [('KQK', 19), ('KRK', 31), ('KPK', 55)]:
+            table = tablebase.Table(name, self.directory)
+            self.assertEqual(max(bytearray(table.data[:table.size])),
+                             plies + 1)
+            self.assertEqual(max(bytearray(table.data[table.size:])),
+                             plies + 2)
+            table.close()
+
+    def test_probe(self):
+        """The result is given for the player to move, with either color
+        attacking."""
+
+        for fen, result in [("k7/8/1K6/8/8/8/7Q/8 w - - 0 1",
+                             (tablebase.WIN, 1)),
+                            ("8/7q/8/8/8/1k6/8/K7 b - - 0 1",
+                             (tablebase.WIN, 1)),
+                            ("8/7q/8/8/8/1k6/8/K7 w - - 0 1",
+                             (tablebase.DRAW, None)),    # Stalemate
+                            ("k7/8/8/8/8/8/P7/K7 w - - 0 1",
+                             (tablebase.DRAW, None)),
+                            ("8/8/8/4k3/8/8/8/1N2K3 w - - 0 1",
+                             (tablebase.DRAW, None)),
+                            ("4k3/8/8/8/8/8/8/4K2R w K - 0 1", None),
+                            ("4k3/8/8/8/8/8/8/r3K2R w - - 0 1", None),
+                            ("4k3/8/8/8/8/8/8/1B2K2N w - - 0 1", None)]:
+            g = game.Game(fen=fen)
+            self.assertEqual(self.tablebases.probe(g), result)
+
+    def test_perfect_play(self):
+        """Both players play the best moves: the mate comes as told."""
+
+        g = game.Game(fen="8/8/8/3k4/8/8/8/R3K3 w - - 0 1")
+        result, plies = self.tablebases.probe(g)
+        self.assertEqual(result, tablebase.WIN)
+        for ply in xrange(plies, 0, -1):
+            self.assertEqual(self.tablebases.probe(g)[1], ply)
+            m, promotion = self.tablebases.best_move(g)
+            m_type = g.move(g.get_playing_color(), m.src, m.dest)
+        self.assertEqual(m_type, game.CHECK_MATE)
+        self.assertEqual(self.tablebases.probe(g), (tablebase.LOSS, 0))
+        self.assertEqual(self.tablebases.best_move(g), None)
+
+    def test_engine(self):
+        """The engine plays the tables without searching, and promotes to a
+        rook when a queen would stalemate."""
+
+        g = game.Game(fen="8/1P6/k7/8/K7/8/8/8 w - - 0 1")
+        e = alphabeta.Engine(tablebases=self.directory)
+        self.assertEqual(e.play(g), game.PROMOTE)
+        self.assertEqual(g.board[2, 8].get_type(), rules.ROOK)
+        self.assertEqual(e.nodes, 0)
+        self.assertEqual(e.score, alphabeta.MATE - 13)
+
+        # A capture leading to a table ending is scored in the search.
+        g = game.Game(fen="8/8/8/3k4/8/8/3q4/3QK3 w - - 0 1")
+        e = alphabeta.Engine(max_depth=2, tablebases=self.directory)
+        e.play(g)
+        self.assertEqual(g.history[-1].dest, (4, 2))
+        self.assertTrue(e.score >= alphabeta.MATE_FOUND)
+
+    def test_missing_table(self):
+        """The moves into an ending without a table are not in the way of
+        the others."""
+
+        directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(self.directory, 'KPK.tb'), directory)
+        tablebases = tablebase.Tablebases(directory)
+        try:
+            g = game.Game(fen="8/1P6/k7/8/K7/8/8/8 w - - 0 1")
+            self.assertEqual(tablebases.probe(g)[0], tablebase.WIN)
+            m, promotion = tablebases.best_move(g)
+            # The promotions lead to KQK and KRK, which are not there.
+            self.assertEqual(g.board[m.src].get_type(), rules.KING)
+        finally:
+            tablebases.close()
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+"""Tournament module
+
+This module plays matches between AI configurations to measure which one is
+the strongest.
+
+Each pair of configurations plays a number of games, each opening being
+played twice with the colors swapped. The games are played by the processes
+of a multiprocessing pool, with a Game as referee which adjudicates the
+check mates, the stalemates, the threefold repetitions and the 50-move rule.
+The results and the PGN of the games are written as soon as they finish, then
+the Elo of each configuration is estimated with its error bar.
+
+Usage: python tournament.py [games_per_pair] [time_ms] [processes]
+"""
+
+import math
+import multiprocessing
+import random
+import sys
+import time
+from StringIO import StringIO
+from collections import namedtuple
+
+import rules as ru
+import game as gm
+import pgn
+from AI import alphabeta
+
+"""Constants"""
+# The configurations played by default: a name and the options of the Engine.
+CONFIGURATIONS = [('depth 1', {'max_depth': 1, 'hash_mb': 1}),
+                  ('depth 2', {'max_depth': 2, 'hash_mb': 1}),
+                  ('depth 3', {'max_depth': 3, 'hash_mb': 1})]
+OPENING_PLIES = 4   # Random moves played before the engines take over
+MAX_PLIES = 300     # Beyond, the game is a draw
+
+# A game to play: its number, the (name, options) of the white and black
+# configurations, the seed of its opening and the time per move.
+Pairing = namedtuple('Pairing', 'index, white, black, seed, time_ms')
+# A finished game: its number, the names of the players, the result as in
+# PGN, the reason of the end, the number of plies and the PGN text.
+GameResult = namedtuple('GameResult',
+                        'index, white, black, result, reason, plies, pgn')
+
+"""Functions"""
+def pairings(configurations, games_per_pair, time_ms=None):
+    """Return the list of the Pairings of a round robin where each pair of
+    configurations plays games_per_pair games."""
+
+    l = []
+    for i, a in enumerate(configurations):
+        for b in configurations[i + 1:]:
+            for j in xrange(games_per_pair):
+                # Each opening is played with both colors.
+                if(j % 2 == 0):
+                    white, black = a, b
+                else:
+                    white, black = b, a
+                l.append(Pairing(len(l), white, black, j // 2, time_ms))
+    return l
+
+def adjudicate(g, color):
+    """Return the (result, reason) of the Game g if it is over, 'color'
+    being the player to move, else None."""
+
+    if(g.board.is_pat(color)):
+        if(not g.board.is_check(color)):
+            return '1/2-1/2', 'stalemate'
+        if(color == ru.WHITE_COLOR):
+            return '0-1', 'check mate'
+        return '1-0', 'check mate'
+    if(g.repetitions() >= gm.REPETITIONS):
+        return '1/2-1/2', 'threefold repetition'
+    if(g.halfmove_clocks[-1] >= gm.FIFTY_MOVES):
+        return '1/2-1/2', '50-move rule'
+    if(len(g.history) >= MAX_PLIES):
+        return '1/2-1/2', 'too long'
+    return None
+
+def play_game(pairing):
+    """Play the game of the Pairing and return its GameResult."""
+
+    g = gm.Game()
+    engines = {}
+    for color, (name, options) in [(ru.WHITE_COLOR, pairing.white),
+                                   (ru.BLACK_COLOR, pairing.black)]:
+        options = dict(options)
+        if(pairing.time_ms is not None):
+            options['time_ms'] = pairing.time_ms
+        engines[color] = alphabeta.Engine(**options)
+
+    rand = random.Random(pairing.seed)
+    color = ru.WHITE_COLOR
+    end = None
+    while(end is None):
+        if(len(g.history) < OPENING_PLIES):
+            moves = sorted(m for m in g.board.legal_moves(color)
+                           if alphabeta.promotion(m) is None)
+            m = rand.choice(moves)
+            g.move(color, m.src, m.dest, type_=m.type_)
+        else:
+            engines[color].play(g)
+        color = ru.enemy_color(color)
+        end = adjudicate(g, color)
+
+    result, reason = end
+    f = StringIO()
+    pgn.write_game(f, g, {'Event': 'Tournament',
+                          'Round': str(pairing.index + 1),
+                          'White': pairing.white[0],
+                          'Black': pairing.black[0], 'Result': result,
+                          'Termination': reason})
+    return GameResult(pairing.index, pairing.white[0], pairing.black[0],
+                      result, reason, len(g.history), f.getvalue())
+
+def elo(score, games):
+    """Return the Elo difference given by a score over a number of games,
+    and its error bar at 95%."""
+
+    def difference(p):
+        p = min(max(p, 0.5 / games), 1 - 0.5 / games)
+        return -400 * math.log10(1 / p - 1)
+
+    # A score of 0 or 1 is taken as half a game from it.
+    p = min(max(float(score) / games, 0.5 / games), 1 - 0.5 / games)
+    error = 1.96 * math.sqrt(p * (1 - p) / games)
+    return (difference(p),
+            (difference(p + error) - difference(p - error)) / 2)
+
+def run(configurations=CONFIGURATIONS, games_per_pair=2, time_ms=None,
+        processes=None, pgn_path='tournament.pgn', out=sys.stdout):
+    """Play the tournament, writing each game in the PGN file pgn_path as it
+    finishes, and print the results.
+
+    Return the dict giving the (score, games) of each configuration.
+    """
+
+    start = time.time()
+    scores = dict((name, [0., 0]) for name, options in configurations)
+    pool = multiprocessing.Pool(processes)
+    try:
+        with open(pgn_path, 'w') as f:
+            for r in pool.imap_unordered(
+                    play_game, pairings(configurations, games_per_pair,
+                                        time_ms)):
+                f.write(r.pgn)
+                f.flush()
+                out.write("game %d: %s - %s %s (%s, %d plies)\n" %
+                          (r.index + 1, r.white, r.black, r.result,
+                           r.reason, r.plies))
+                white_score = {'1-0': 1., '0-1': 0.}.get(r.result, 0.5)
+                scores[r.white][0] += white_score
+                scores[r.black][0] += 1 - white_score
+                scores[r.white][1] += 1
+                scores[r.black][1] += 1
+    finally:
+        pool.terminate()
+
+    t = time.time() - start
+    games = sum(n for score, n in scores.itervalues()) // 2
+    out.write("%d games in %.0fs (%.0f games/hour)\n" %
+              (games, t, games * 3600 / max(t, 1e-9)))
+    out.write("Elo against the others:\n")
+    for name, options in configurations:
+        score, n = scores[name]
+        if(n == 0):
+            continue
+        difference, error = elo(score, n)
+        out.write("  %-20s %+6.0f +/- %3.0f  (%.1f/%d)\n" %
+                  (name, difference, error, score, n))
+    return dict((name, tuple(s)) for name, s in scores.iteritems())
+
+
+if __name__ == '__main__':
+    games_per_pair, time_ms, processes = 2, None, None
+    if(len(sys.argv) > 1):
+        games_per_pair = int(sys.argv[1])
+    if(len(sys.argv) > 2):
+        time_ms = int(sys.argv[2])
+    if(len(sys.argv) > 3):
+        processes = int(sys.argv[3])
+    run(CONFIGURATIONS, games_per_pair, time_ms, processes)
@@ -0,0 +1,80 @@
+"""Unittest of the module tournament.py."""
+
+from StringIO import StringIO
+import os
+import tempfile
+import unittest
+import game
+import pgn
+import tournament
+
+"""Constants"""
+W = game.WHITE_COLOR
+B = game.BLACK_COLOR
+
+A = ('a', {'max_depth': 1, 'hash_mb': 1})
+Z = ('z', {'max_depth': 1, 'hash_mb': 1})
+
+class Tournament(unittest.TestCase):
+    """Test the parts of the tournament."""
+
+    def test_pairings(self):
+        """Each opening is played with both colors."""
+
+        l = tournament.pairings([A, Z, ('x', {})], 4)
+        self.assertEqual(len(l), 12)
+        self.assertEqual([(p.white[0], p.black[0], p.seed) for p in l[:4]],
+                         [('a', 'z', 0), ('z', 'a', 0), ('a', 'z', 1),
+                          ('z', 'a', 1)])
+
+    def test_adjudicate(self):
+        """The ends of the games are found."""
+
+        for fen, end in [("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1",
+                          ('1/2-1/2', 'stalemate')),
+                         ("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1",
+                          ('1-0', 'check mate')),
+                         ("7k/8/6K1/8/8/8/8/6Q1 b - - 99 80", None),
+                         ("7k/8/6K1/8/8/8/8/6Q1 b - - 100 80",
+                          ('1/2-1/2', '50-move rule'))]:
+            g = game.Game(fen=fen)
+            self.assertEqual(tournament.adjudicate(g, B), end)
+        g = game.Game()
+        for i in xrange(2):
+            for c, src, dest in [(W, (7, 1), (6, 3)), (B, (7, 8), (6, 6)),
+                                 (W, (6, 3), (7, 1)), (B, (6, 6), (7, 8))]:
+                g.move(c, src, dest)
+        self.assertEqual(tournament.adjudicate(g, W),
+                         ('1/2-1/2', 'threefold repetition'))
+
+    def test_elo(self):
+        """An even score is 0 Elo, a better one is more."""
+
+        self.assertEqual(tournament.elo(5, 10)[0], 0)
+        difference, error = tournament.elo(75, 100)
+        self.assertAlmostEqual(difference, 190.8, 1)
+        self.assertTrue(50 < error < 100)
+        self.assertTrue(tournament.elo(10, 10)[0] > 400)
+
+    def test_run(self):
+        """The games are played and written."""
+
+        fd, path = tempfile.mkstemp(suffix='.pgn')
+        os.close(fd)
+        try:
+            out = StringIO()
+            scores = tournament.run([A, Z], 2, None, 1, path, out)
+            self.assertEqual(scores['a'][1], 2)
+            self.assertEqual(scores['a'][0] + scores['z'][0], 2)
+            self.assertIn("games/hour", out.getvalue())
+            with open(path) as f:
+                games = list(pgn.load_games(f))
+            self.assertEqual(len(games), 2)
+            for pgn_game, g in games:
+                self.assertNotEqual(g, None)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()